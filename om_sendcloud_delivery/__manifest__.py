@@ -5,6 +5,8 @@
     'summary': 'Sendcloud integratie voor Odoo Community',
     'depends': ['delivery', 'website_sale', 'stock_delivery'],
     'data': [
+        'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
         'views/res_company_views.xml',
         'views/delivery_carrier_views.xml',
         'views/website_sale_templates.xml',
@@ -1,4 +1,3 @@
-import json
 import logging
 from odoo import http, _
 from odoo.http import request
@@ -9,29 +8,28 @@ class SendcloudController(http.Controller):
 
     @http.route(['/sendcloud/webhook'], type='http', auth='public', methods=['POST'], csrf=False)
     def sendcloud_webhook(self, **post):
-        try:
-            data = json.loads(request.httprequest.data)
-            action = data.get('action')
-            parcel = data.get('parcel')
-
-            if action == 'parcel_status_changed' and parcel:
-                tracking_number = parcel.get('tracking_number')
-                new_status = parcel.get('status', {}).get('message')
-
-                picking = request.env['stock.picking'].sudo().search([
-                    ('carrier_tracking_ref', '=', tracking_number)
-                ], limit=1)
-
-                if picking:
-                    picking.message_post(
-                        body=f"Sendcloud Status Update: {new_status}",
-                        message_type="notification"
-                    )
-            return "OK"
+        """
+        Handtekening controleren, wegschrijven in de inbox en meteen 200 antwoorden. Dubbele of
+        te late events worden door de cron samengevoegd (zie sendcloud.webhook.event).
+        """
+        raw_data = request.httprequest.get_data()
+        Event = request.env['sendcloud.webhook.event'].sudo()
+        if not Event._verify_signature(raw_data, request.httprequest.headers.get('Sendcloud-Signature')):
+            _logger.warning("Sendcloud webhook met ongeldige handtekening geweigerd")
+            return request.make_response("Invalid signature", status=403)
 
+        try:
+            with request.env.cr.savepoint():
+                Event._store_raw_event(raw_data)
+        except ValueError as e:
+            # Ongeldige payload: opnieuw sturen lost niets op
+            _logger.error(f"Ongeldige Sendcloud webhook: {str(e)}")
+            return request.make_response("Invalid payload", status=400)
         except Exception as e:
-            _logger.error(f"Fout bij verwerken Sendcloud webhook: {str(e)}")
-            return "Error", 500
+            # Opslaan mislukt: 5xx zodat Sendcloud het later opnieuw probeert
+            _logger.error(f"Fout bij opslaan Sendcloud webhook: {str(e)}")
+            return request.make_response("Error", status=500)
+        return "OK"
 
     @http.route('/shop/sendcloud/save_service_point', type='jsonrpc', auth="public", website=True)
     def save_service_point(self, service_point_id, service_point_name, **kw):
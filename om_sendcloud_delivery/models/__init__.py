@@ -2,3 +2,7 @@ from . import res_company
 from . import res_config_settings
 from . import delivery_carrier
 from . import sale_order
+from . import stock_picking
+from . import sendcloud_webhook_event
+from . import sendcloud_rate
+from . import sendcloud_parcel
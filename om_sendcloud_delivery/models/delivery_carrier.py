@@ -1,10 +1,31 @@
-import requests
 import base64
 import json
+import logging
+import math
 import re
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+from .rate_cache import RateCache
+from .sendcloud_client import SendcloudClient, SendcloudError
+
+_logger = logging.getLogger(__name__)
+
+SENDCLOUD_BATCH_SIZE = 100      # parcels per multi-parcel call
+# Sleutel in cr.precommit.data: resultaten van een batch, per picking id (enkel binnen de transactie)
+SENDCLOUD_BATCH_RESULTS = 'om_sendcloud_delivery.batch_results'
+SENDCLOUD_LABEL_WORKERS = 8     # gelijktijdige label downloads
+SENDCLOUD_TIMEOUT = 30          # seconden
+SENDCLOUD_RATE_TIMEOUT = 5      # seconden, de checkout wacht hierop
+SENDCLOUD_WEIGHT_BUCKET = 0.5   # kg, prijzen worden per schijf gecachet
+# Systeemparameter met een versie van de prijzen cache: ophogen maakt de cache in ALLE workers ongeldig
+SENDCLOUD_RATE_CACHE_VERSION = 'om_sendcloud_delivery.rate_cache_version'
+
+_rate_cache = RateCache(maxsize=2048)
+
 class DeliveryCarrier(models.Model):
     _inherit = 'delivery.carrier'
 
@@ -19,55 +40,340 @@ class DeliveryCarrier(models.Model):
 
     sendcloud_shipping_id = fields.Char(string="Sendcloud Verzendmethode ID", help="Optioneel ID van de vervoerder in Sendcloud")
 
+    # --- Verzendprijzen ---
+    sendcloud_live_rates = fields.Boolean(string="Live Prijzen van Sendcloud",
+                                          help="Vraagt de prijs op bij Sendcloud (vereist een Verzendmethode ID). "
+                                               "Lukt dat niet, dan wordt de prijstabel gebruikt.")
+    sendcloud_rate_ttl = fields.Integer(string="Prijzen Cachen (minuten)", default=360)
+    sendcloud_price_rule_ids = fields.One2many('sendcloud.price.rule', 'carrier_id', string="Prijstabel")
+
     def sendcloud_rate_shipment(self, order):
+        zip_code = (order.partner_shipping_id.zip or '').replace(' ', '').upper()
+        price = self._sendcloud_get_rate(self._sendcloud_rate_key(order), zip_code)
+        if price is None:
+            return {
+                'success': False,
+                'price': 0.0,
+                'error_message': _("Er is geen verzendprijs gekend voor dit adres."),
+                'warning_message': False
+            }
         return {
             'success': True,
-            'price': 0.0,
+            'price': price,
             'error_message': False,
             'warning_message': False
         }
 
-    def sendcloud_send_shipping(self, pickings):
-        res = []
-        company = self.env.company
-        public_key = company.sendcloud_public_key
-        secret_key = company.sendcloud_secret_key
+    # =================================================================================
+    # PRIJZEN CACHE
+    # Volgorde: cache in het proces -> gedeelde cache (tabel) -> live Sendcloud
+    # -> verlopen cache -> offline prijstabel. Een storing bij Sendcloud blokkeert de checkout dus niet.
+    # =================================================================================
 
-        if not public_key or not secret_key:
-            raise UserError("Sendcloud API keys zijn niet ingesteld bij Instellingen > Voorraad!")
+    def _sendcloud_rate_key(self, order):
+        """
+        (carrier, land, gewichtsschijf): enkel wat de shipping-price call gebruikt, zodat elke
+        postcode / elk servicepunt in hetzelfde land dezelfde cache regel deelt.
+        """
+        weight = order._get_estimated_weight()
+        if weight <= 0.0:
+            weight = 5.0  # zelfde standaard als bij het aanmaken van het parcel
+        bucket = math.ceil(weight / SENDCLOUD_WEIGHT_BUCKET) * SENDCLOUD_WEIGHT_BUCKET
+        return (self.id, order.partner_shipping_id.country_id.code or '', bucket)
+
+    def _sendcloud_get_rate(self, key, zip_code=''):
+        """
+        Geeft de prijs voor een sleutel terug, of None als er geen enkele bron een prijs heeft.
+        De postcode dient enkel voor de offline prijstabel (die kan per postcode verschillen).
+        """
+        self.ensure_one()
+        if not self.sendcloud_live_rates and not self.sendcloud_price_rule_ids:
+            return 0.0  # niets ingesteld: gratis, zoals voorheen
+
+        # De versie zit in de sleutel: na een wijziging (in eender welke worker) vinden we de oude
+        # prijzen niet meer terug. get_param is zelf gecachet, dus dit kost geen query.
+        version = self.env['ir.config_parameter'].sudo().get_param(SENDCLOUD_RATE_CACHE_VERSION, '0')
+        local_key = (self.env.cr.dbname, version) + key
+        price = _rate_cache.get(local_key)
+        if price is not None:
+            return price
+
+        ttl = max(self.sendcloud_rate_ttl, 1) * 60
+        stale_price = None
+        if self.sendcloud_live_rates and self.sendcloud_shipping_id:
+            cached = self._sendcloud_read_cached_rate(key)
+            if cached:
+                price, fetched_at = cached
+                if fetched_at >= fields.Datetime.now() - timedelta(seconds=ttl):
+                    _rate_cache.set(local_key, price, ttl)
+                    return price
+                stale_price = price
 
-        for picking in pickings:
             try:
-                payload = self._prepare_sendcloud_payload(picking)
-                url = "https://panel.sendcloud.sc/api/v2/parcels"
-                auth = (public_key, secret_key)
-                headers = {'Content-Type': 'application/json'}
+                price = self._sendcloud_fetch_rate(key)
+                self._sendcloud_store_rate(key, price)
+                _rate_cache.set(local_key, price, ttl)
+                return price
+            except UserError as e:
+                _logger.warning(f"Sendcloud prijs ophalen mislukt voor {key}: {e}")
+                if stale_price is not None:
+                    return stale_price
 
-                response = requests.post(url, json=payload, auth=auth, headers=headers)
+        return self._sendcloud_offline_rate(key, zip_code)
 
-                if response.status_code not in [200, 201]:
-                    raise UserError(f"Sendcloud Fout ({response.status_code}): {response.text}")
+    def _sendcloud_offline_rate(self, key, zip_code=''):
+        _carrier_id, country_code, weight = key
+        for rule in self.sendcloud_price_rule_ids:
+            if rule._matches(country_code, zip_code, weight):
+                return rule.price
+        return None
 
-                data = response.json().get('parcel', {})
-                tracking = data.get('tracking_number')
+    def _sendcloud_fetch_rate(self, key):
+        _carrier_id, country_code, weight = key
+        company = self.company_id or self.env.company
+        client = self._get_sendcloud_client(company, timeout=SENDCLOUD_RATE_TIMEOUT)
+        try:
+            response = client.get_shipping_prices({
+                'shipping_method_id': self.sendcloud_shipping_id,
+                'from_country': company.country_id.code or 'BE',
+                'to_country': country_code,
+                'weight': weight,
+                'weight_unit': 'kilogram',
+            })
+        except SendcloudError as e:
+            raise UserError(f"Fout bij Sendcloud: {str(e)}")
+        prices = [p for p in response if p.get('price') is not None]
+        if not prices:
+            raise UserError("Sendcloud gaf geen prijs terug.")
+        return float(prices[0]['price'])
+
+    def _sendcloud_cache_key(self, key):
+        return "|".join(str(part) for part in key)
+
+    def _sendcloud_read_cached_rate(self, key):
+        self.env.cr.execute(
+            "SELECT price, fetched_at FROM sendcloud_rate_cache WHERE cache_key = %s",
+            [self._sendcloud_cache_key(key)],
+        )
+        return self.env.cr.fetchone()
+
+    def _sendcloud_store_rate(self, key, price):
+        """ Upsert in de gedeelde cache (ook vanuit de publieke checkout, dus in SQL). """
+        self.env.cr.execute("""
+            INSERT INTO sendcloud_rate_cache
+                (carrier_id, cache_key, price, fetched_at, create_uid, create_date, write_uid, write_date)
+            VALUES (%(carrier_id)s, %(cache_key)s, %(price)s, NOW() AT TIME ZONE 'UTC',
+                    %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (cache_key) DO UPDATE
+                SET price = EXCLUDED.price, fetched_at = EXCLUDED.fetched_at, write_date = EXCLUDED.write_date
+        """, {
+            'carrier_id': self.id,
+            'cache_key': self._sendcloud_cache_key(key),
+            'price': price,
+            'uid': self.env.uid,
+        })
+
+    @api.model
+    def _cron_warm_sendcloud_rates(self, days=30, limit=500):
+        """
+        Haalt vooraf de prijzen op voor de bestemmingen van recente orders, zodat de
+        checkout ze al in de cache vindt. Ruimt ook oude cache regels op.
+        """
+        carriers = self.search([
+            ('delivery_type', '=', 'sendcloud'),
+            ('sendcloud_live_rates', '=', True),
+            ('sendcloud_shipping_id', '!=', False),
+        ])
+        if carriers:
+            orders = self.env['sale.order'].search([
+                ('carrier_id', 'in', carriers.ids),
+                ('state', '=', 'sale'),
+                ('date_order', '>=', fields.Datetime.now() - timedelta(days=days)),
+            ], order='date_order desc', limit=limit)
 
-                # Label ophalen als het er is
-                label_url = data.get('label', {}).get('normal_printer')
-                if isinstance(label_url, list) and len(label_url) > 0:
-                    label_url = label_url[0]
+            keys = {}
+            for order in orders:
+                keys.setdefault(order.carrier_id._sendcloud_rate_key(order), order.carrier_id)
 
-                if label_url:
-                    self._save_label_attachment(picking, label_url)
+            refreshed = 0
+            for key, carrier in keys.items():
+                cached = carrier._sendcloud_read_cached_rate(key)
+                # Nog minstens de helft van de TTL geldig? Dan laten we hem staan.
+                if cached and cached[1] >= fields.Datetime.now() - timedelta(minutes=max(carrier.sendcloud_rate_ttl, 1) / 2):
+                    continue
+                try:
+                    carrier._sendcloud_store_rate(key, carrier._sendcloud_fetch_rate(key))
+                    refreshed += 1
+                except UserError as e:
+                    _logger.warning(f"Sendcloud prijs opwarmen mislukt voor {key}: {e}")
+            _logger.info(f"Sendcloud prijzen cache: {refreshed}/{len(keys)} bestemmingen vernieuwd.")
 
-                res.append({
-                    'exact_price': 0.0,
-                    'tracking_number': tracking,
-                })
+        # Verlopen prijzen blijven een week staan als reserve bij een storing
+        self.env['sendcloud.rate.cache'].search([
+            ('fetched_at', '<', fields.Datetime.now() - timedelta(days=7)),
+        ]).unlink()
 
-            except Exception as e:
-                raise UserError(f"Fout bij Sendcloud: {str(e)}")
+    def write(self, vals):
+        res = super().write(vals)
+        if {'sendcloud_live_rates', 'sendcloud_shipping_id', 'sendcloud_price_rule_ids'} & set(vals):
+            self._sendcloud_invalidate_rates()
         return res
 
+    def _sendcloud_invalidate_rates(self):
+        """
+        Prijzen van deze carriers vergeten: de gedeelde tabel meteen, de caches in de andere
+        workers via een nieuwe versie (set_param verwittigt alle workers).
+        """
+        self.env['sendcloud.rate.cache'].sudo().search([('carrier_id', 'in', self.ids)]).unlink()
+        self.env['ir.config_parameter'].sudo().set_param(SENDCLOUD_RATE_CACHE_VERSION, uuid.uuid4().hex[:8])
+        _rate_cache.clear()
+
+    def sendcloud_send_shipping(self, pickings):
+        """
+        Odoo roept dit per picking op (send_to_shipper doet ensure_one). Bij het valideren van
+        meerdere leveringen tegelijk (zie stock.picking._action_done) maken we bij de eerste
+        oproep de parcels voor de hele groep aan; de volgende oproepen halen hun resultaat
+        uit die batch. De resultaten leven enkel binnen de transactie (precommit data).
+        """
+        results = self.env.cr.precommit.data.setdefault(SENDCLOUD_BATCH_RESULTS, {})
+        missing = pickings.filtered(lambda p: p.id not in results)
+        if missing:
+            batch_ids = self.env.context.get('sendcloud_batch_picking_ids') or []
+            others = self.env['stock.picking'].browse(batch_ids).filtered(
+                lambda p: p.id not in results and p._sendcloud_needs_parcel(self))
+            self._sendcloud_ship_batch(missing | others, results)
+        return [results.pop(picking.id) for picking in pickings]
+
+    def _sendcloud_ship_batch(self, pickings, results):
+        """
+        Maakt de parcels aan (multi-parcel calls), haalt de labels op en vult results {picking id: vals}.
+        Mislukt er één, dan bewaren we de geslaagde parcels (sendcloud.parcel) en geven we een fout:
+        de validatie wordt teruggedraaid en de volgende poging hergebruikt die parcels.
+        """
+        client = self._get_sendcloud_client(self.env.company)
+
+        # 1. Parcels van een vorige, teruggedraaide poging hergebruiken (die zijn al betaald)
+        parcels = self._sendcloud_take_kept_parcels(pickings)
+
+        # 2. De rest in bulk aanmaken (één call per batch i.p.v. één per picking)
+        errors = {}
+        to_create = pickings.filtered(lambda p: p not in parcels)
+        for start in range(0, len(to_create), SENDCLOUD_BATCH_SIZE):
+            batch = to_create[start:start + SENDCLOUD_BATCH_SIZE]
+            parcels.update(self._sendcloud_create_parcels(client, batch, errors))
+
+        failed = pickings.filtered(lambda p: p not in parcels)
+        if failed:
+            # Enkel de nieuwe: hergebruikte parcels blijven staan, hun unlink wordt mee teruggedraaid
+            self._sendcloud_keep_parcels({p: data for p, data in parcels.items() if p in to_create})
+            lines = "\n".join(f"- {picking.name}: {errors.get(picking, 'geen antwoord van Sendcloud')}"
+                              for picking in failed)
+            raise UserError(
+                f"Sendcloud zending niet aangemaakt voor:\n{lines}\n\n"
+                f"De andere zendingen ({len(parcels)}) zijn wel aangemaakt en worden bij de volgende poging hergebruikt."
+            )
+
+        # 3. Labels parallel ophalen
+        label_urls = {}
+        for picking, data in parcels.items():
+            label_url = self._sendcloud_label_url(data)
+            if label_url:
+                label_urls[picking] = label_url
+        self._save_label_attachments(client, label_urls)
+
+        for picking in pickings:
+            results[picking.id] = {
+                'exact_price': 0.0,
+                'tracking_number': parcels[picking].get('tracking_number') or False,
+            }
+
+    def _sendcloud_keep_parcels(self, parcels):
+        """
+        Bewaart de aangemaakte parcels op een eigen cursor (meteen gecommit), zodat ze de rollback
+        van de validatie overleven. Zonder dit maakt de volgende poging ze opnieuw aan (en betalen we dubbel).
+        """
+        if not parcels:
+            return
+        with self.env.registry.cursor() as cr:
+            self.env(cr=cr, su=True)['sendcloud.parcel'].create([{
+                'picking_id': picking.id,
+                'parcel_id': str(data.get('id') or ''),
+                'tracking_number': data.get('tracking_number') or False,
+                'label_url': self._sendcloud_label_url(data) or False,
+            } for picking, data in parcels.items()])
+
+    def _sendcloud_take_kept_parcels(self, pickings):
+        """ {picking: parcel dict} uit sendcloud.parcel voor deze pickings; de regels zelf gaan weg. """
+        kept = self.env['sendcloud.parcel'].sudo().search([('picking_id', 'in', pickings.ids)])
+        parcels = {}
+        for record in kept:
+            picking = pickings.browse(record.picking_id)
+            parcels[picking] = {
+                'id': record.parcel_id,
+                'tracking_number': record.tracking_number,
+                'label': {'normal_printer': record.label_url},
+            }
+            picking.message_post(body=f"Sendcloud parcel van een vorige poging hergebruikt (ID {record.parcel_id}).")
+        kept.unlink()
+        return parcels
+
+    def _sendcloud_label_url(self, parcel):
+        label_url = parcel.get('label', {}).get('normal_printer')
+        if isinstance(label_url, list):
+            label_url = label_url[0] if label_url else False
+        return label_url
+
+    def _get_sendcloud_client(self, company, timeout=SENDCLOUD_TIMEOUT):
+        """ Client op de gedeelde Session (keep-alive over alle calls heen, zie sendcloud_client). """
+        if not company.sendcloud_public_key or not company.sendcloud_secret_key:
+            raise UserError("Sendcloud API keys zijn niet ingesteld bij Instellingen > Voorraad!")
+        return SendcloudClient((company.sendcloud_public_key, company.sendcloud_secret_key), timeout=timeout)
+
+    def _sendcloud_create_parcels(self, client, pickings, errors):
+        """
+        Maakt de parcels voor een batch pickings aan via de multi-parcel call ({"parcels": [...]}).
+        Elke parcel krijgt een unieke external_reference, zodat we het antwoord per picking kunnen
+        koppelen (de volgorde van het antwoord ligt niet vast).
+        Geeft {picking: parcel dict} terug voor de geslaagde parcels; de fout per mislukte picking
+        komt in errors. Een mislukte parcel breekt de batch niet af: de rest is al aangemaakt (en betaald).
+        """
+        payloads = {}
+        for picking in pickings:
+            try:
+                vals = self._prepare_sendcloud_payload(picking)['parcel']
+            except UserError as e:
+                errors[picking] = str(e)
+                continue
+            vals['external_reference'] = f"{picking.name}-{uuid.uuid4().hex[:8]}"
+            payloads[vals['external_reference']] = (picking, vals)
+        if not payloads:
+            return {}
+
+        try:
+            data = client.create_parcels([vals for _picking, vals in payloads.values()])
+        except SendcloudError as e:
+            raise UserError(f"Fout bij Sendcloud: {str(e)}")
+
+        for failed in data.get('failed_parcels') or []:
+            reference = (failed.get('parcel') or {}).get('external_reference')
+            picking = payloads.get(reference, (None, None))[0]
+            message = json.dumps(failed.get('errors', {}))
+            _logger.warning(f"Sendcloud parcel mislukt voor {picking.name if picking else reference}: {message}")
+            if picking:
+                errors[picking] = message
+
+        parcels = {}
+        for parcel in data.get('parcels') or []:
+            picking = payloads.get(parcel.get('external_reference'), (None, None))[0]
+            if not picking:
+                # Zou niet mogen: bijhouden zodat het label niet verloren raakt
+                _logger.error(f"Sendcloud parcel {parcel.get('id')} kon niet aan een levering gekoppeld worden: "
+                              f"{parcel.get('external_reference')}")
+                continue
+            parcels[picking] = parcel
+            picking.message_post(body=f"Sendcloud parcel aangemaakt (ID {parcel.get('id')}).")
+        return parcels
+
     def _prepare_sendcloud_payload(self, picking):
         partner = picking.partner_id
         weight = picking.shipping_weight
@@ -115,9 +421,26 @@ class DeliveryCarrier(models.Model):
         # Fallback: alles is straat
         return street_input, ""
 
-    def _save_label_attachment(self, picking, url):
-        try:
-            pdf_content = requests.get(url).content
+    def _save_label_attachments(self, client, label_urls):
+        """
+        Downloadt de label PDF's parallel (begrensd, met timeout). De threads doen enkel HTTP;
+        attachments en berichten maken we daarna op de hoofdcursor.
+        """
+        if not label_urls:
+            return
+
+        def download(url):
+            try:
+                return client.download_label(url)
+            except SendcloudError:
+                return False
+
+        with ThreadPoolExecutor(max_workers=SENDCLOUD_LABEL_WORKERS) as executor:
+            pdfs = dict(zip(label_urls, executor.map(download, label_urls.values())))
+
+        for picking, pdf_content in pdfs.items():
+            if not pdf_content:
+                continue
             attachment = self.env['ir.attachment'].create({
                 'name': f"Label_{picking.name}.pdf",
                 'type': 'binary',
@@ -127,8 +450,6 @@ class DeliveryCarrier(models.Model):
                 'mimetype': 'application/pdf'
             })
             picking.message_post(body="Sendcloud Label", attachment_ids=[attachment.id])
-        except Exception:
-            pass
 
     def sendcloud_get_tracking_link(self, picking):
         return f"https://tracking.sendcloud.sc/{picking.carrier_tracking_ref}"
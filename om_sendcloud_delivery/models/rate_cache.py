@@ -0,0 +1,43 @@
+"""
+Kleine LRU cache met TTL voor verzendprijzen, per proces.
+
+Puur Python (geen ORM): de checkout vraagt de prijs bij elke wijziging van winkelmand
+of adres opnieuw op, meestal voor dezelfde paar bestemmingen. Een hit hier kost geen
+query en geen HTTP call.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class RateCache:
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Geeft de waarde terug, of None als ze er niet (meer) is. """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """ ttl in seconden. Is de cache vol, dan valt de minst recent gebruikte eruit. """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Dunne Sendcloud client met één gedeelde requests.Session per proces
+(keep-alive: geen nieuwe TCP/TLS handshake per label).
+Gebruikt door de verzendmethode (delivery.carrier) én door otters_consignment
+(labels voor inzendingen), zodat er maar één client en één connectiepool is.
+
+Geen ORM hier: de basis-URL is instelbaar, zodat je hem kan testen tegen een
+lokale mock server (bv. http.server op localhost).
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://panel.sendcloud.sc/api/v2'
+DEFAULT_TIMEOUT = 30
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(api_url=DEFAULT_API_URL):
+    """ Eén Session per API host, hergebruikt over alle requests van dit proces. """
+    with _sessions_lock:
+        session = _sessions.get(api_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[api_url] = session
+        return session
+
+
+class SendcloudError(Exception):
+    """ retryable: True bij netwerkfouten / 429 / 5xx, False bij bv. een ongeldig adres (4xx). """
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SendcloudClient:
+
+    def __init__(self, auth, api_url=None, timeout=DEFAULT_TIMEOUT):
+        self.auth = auth
+        self.api_url = (api_url or DEFAULT_API_URL).rstrip('/')
+        self.timeout = timeout
+        self.session = get_session(self.api_url)
+
+    def _request(self, method, url, **kwargs):
+        try:
+            response = self.session.request(method, url, auth=self.auth, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise SendcloudError(f"Verbindingsfout: {e}", retryable=True)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SendcloudError(f"HTTP {response.status_code}: {response.text[:200]}", retryable=True)
+        if response.status_code >= 400:
+            raise SendcloudError(f"HTTP {response.status_code}: {response.text[:500]}", retryable=False)
+        return response
+
+    def create_parcels(self, parcels):
+        """ Multi-parcel call. Geeft het volledige antwoord terug: {'parcels': [...], 'failed_parcels': [...]}. """
+        response = self._request('POST', f"{self.api_url}/parcels", json={'parcels': parcels},
+                                 headers={"Content-Type": "application/json"})
+        return response.json()
+
+    def get_shipping_prices(self, params):
+        """ Prijzen voor een verzendmethode / land / gewicht (lijst dicts met 'price'). """
+        return self._request('GET', f"{self.api_url}/shipping-price", params=params).json()
+
+    def create_parcel(self, payload):
+        """ Maakt een parcel (met label) aan en geeft de parcel dict terug. """
+        response = self._request('POST', f"{self.api_url}/parcels", json=payload,
+                                 headers={"Content-Type": "application/json"})
+        return response.json().get('parcel', {})
+
+    def download_label(self, label_url):
+        """ Haalt de label PDF op (zelfde credentials, zelfde connectie). """
+        return self._request('GET', label_url).content
@@ -0,0 +1,20 @@
+from odoo import models, fields
+
+
+class SendcloudParcel(models.Model):
+    """
+    Parcels die bij Sendcloud al aangemaakt (en betaald) zijn, maar waarvan de levering nog niet
+    verzonden kon worden omdat een andere levering uit dezelfde batch mislukte (de validatie
+    wordt dan teruggedraaid). Geschreven op een eigen cursor, zodat ze die rollback overleven.
+    Bij de volgende poging hergebruiken we deze parcel i.p.v. een nieuwe aan te maken.
+    """
+    _name = 'sendcloud.parcel'
+    _description = 'Sendcloud Openstaande Parcel'
+    _log_access = False
+
+    # Geen Many2one: we schrijven op een eigen cursor, terwijl de levering nog in de hoofdtransactie openstaat
+    picking_id = fields.Integer(string="Levering ID", required=True, index=True)
+    parcel_id = fields.Char(string="Sendcloud Parcel ID")
+    tracking_number = fields.Char(string="Tracking Nummer")
+    label_url = fields.Char(string="Label URL")
+    created_at = fields.Datetime(string="Aangemaakt Op", default=fields.Datetime.now)
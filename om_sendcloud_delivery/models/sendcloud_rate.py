@@ -0,0 +1,50 @@
+from odoo import models, fields
+
+
+class SendcloudPriceRule(models.Model):
+    """
+    Offline prijstabel: wordt gebruikt als live prijzen uit staan, of als Sendcloud
+    niet antwoordt. De eerste regel (volgorde) die past, wint.
+    """
+    _name = 'sendcloud.price.rule'
+    _description = 'Sendcloud Prijsregel'
+    _order = 'carrier_id, sequence, id'
+
+    carrier_id = fields.Many2one('delivery.carrier', string="Verzendmethode", required=True, ondelete='cascade')
+    sequence = fields.Integer(string="Volgorde", default=10)
+    country_id = fields.Many2one('res.country', string="Land", help="Leeg = alle landen")
+    zip_prefix = fields.Char(string="Postcode Begint Met", help="Leeg = alle postcodes")
+    max_weight = fields.Float(string="Max. Gewicht (kg)", help="0 = geen limiet")
+    price = fields.Float(string="Prijs", required=True)
+
+    def _matches(self, country_code, zip_code, weight):
+        self.ensure_one()
+        if self.country_id and self.country_id.code != country_code:
+            return False
+        if self.zip_prefix and not (zip_code or '').startswith(self.zip_prefix.replace(' ', '').upper()):
+            return False
+        if self.max_weight and weight > self.max_weight:
+            return False
+        return True
+
+
+class SendcloudRateCache(models.Model):
+    """
+    Gedeelde cache van live Sendcloud prijzen (over alle workers heen).
+    Wordt gevuld door de checkout en opgewarmd door een cron op basis van recente orders.
+    """
+    _name = 'sendcloud.rate.cache'
+    _description = 'Sendcloud Prijzen Cache'
+    _order = 'fetched_at desc'
+
+    carrier_id = fields.Many2one('delivery.carrier', string="Verzendmethode", required=True, ondelete='cascade')
+    cache_key = fields.Char(string="Sleutel", required=True, readonly=True)
+    price = fields.Float(string="Prijs", readonly=True)
+    fetched_at = fields.Datetime(string="Opgehaald Op", readonly=True, index=True)
+
+    def init(self):
+        super().init()
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS sendcloud_rate_cache_cache_key_index
+            ON sendcloud_rate_cache (cache_key)
+        """)
@@ -0,0 +1,177 @@
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Verwerkte / genegeerde events houden we zo lang bij (debuggen), daarna weg
+WEBHOOK_RETENTION_DAYS = 30
+
+
+class SendcloudWebhookEvent(models.Model):
+    """
+    Inbox voor Sendcloud webhooks. De controller schrijft enkel de ruwe payload weg
+    (dubbels worden genegeerd via de dedup sleutel) en antwoordt meteen 200.
+    De cron verwerkt de inbox in batches.
+    """
+    _name = 'sendcloud.webhook.event'
+    _description = 'Sendcloud Webhook Event'
+    _order = 'status_date, id'
+
+    dedup_key = fields.Char(string="Dedup Sleutel", required=True, readonly=True)
+    action = fields.Char(string="Actie", readonly=True)
+    parcel_id = fields.Char(string="Parcel ID", index=True, readonly=True)
+    tracking_number = fields.Char(string="Tracking Nummer", index=True, readonly=True)
+    status_message = fields.Char(string="Status", readonly=True)
+    status_date = fields.Datetime(string="Tijdstip Status", readonly=True)
+    payload = fields.Text(string="Payload", readonly=True)
+    state = fields.Selection([
+        ('pending', 'Te Verwerken'),
+        ('done', 'Verwerkt'),
+        ('ignored', 'Genegeerd'),
+    ], string="Verwerking", default='pending', required=True, index=True)
+    note = fields.Char(string="Opmerking", readonly=True)
+
+    _sql_constraints = [
+        ('dedup_key_unique', 'UNIQUE(dedup_key)', 'Dit webhook event werd al ontvangen.'),
+    ]
+
+    def init(self):
+        super().init()
+        # ON CONFLICT heeft een unieke index nodig, ook als de constraint (nog) niet bestaat
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS sendcloud_webhook_event_dedup_key_index
+            ON sendcloud_webhook_event (dedup_key)
+        """)
+
+    # =================================================================================
+    # INBOX (vanuit de controller)
+    # =================================================================================
+
+    @api.model
+    def _verify_signature(self, raw_data, signature):
+        """
+        Sendcloud tekent de body met HMAC-SHA256 op de secret key (header Sendcloud-Signature).
+        We proberen de key van elk bedrijf met een Sendcloud koppeling.
+        """
+        if not signature:
+            return False
+        if isinstance(raw_data, str):
+            raw_data = raw_data.encode()
+        companies = self.env['res.company'].sudo().search([('sendcloud_secret_key', '!=', False)])
+        return any(
+            hmac.compare_digest(hmac.new(key.encode(), raw_data, hashlib.sha256).hexdigest(), signature)
+            for key in companies.mapped('sendcloud_secret_key')
+        )
+
+    @api.model
+    def _store_raw_event(self, raw_data):
+        """
+        Bewaart het event zonder verdere verwerking. ON CONFLICT DO NOTHING: een retry van
+        Sendcloud (zelfde parcel + zelfde tijdstip) komt er maar één keer in.
+        """
+        if isinstance(raw_data, bytes):
+            raw_data = raw_data.decode()
+        data = json.loads(raw_data)
+        parcel = data.get('parcel') or {}
+        status = parcel.get('status') or {}
+        timestamp = data.get('timestamp')  # milliseconden
+        parcel_id = str(parcel.get('id') or parcel.get('tracking_number') or '')
+        status_date = (
+            datetime.fromtimestamp(int(timestamp) / 1000.0, timezone.utc).replace(tzinfo=None)
+            if timestamp else fields.Datetime.now()
+        )
+
+        self.env.cr.execute("""
+            INSERT INTO sendcloud_webhook_event
+                (dedup_key, action, parcel_id, tracking_number, status_message, status_date, payload, state,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES (%(dedup_key)s, %(action)s, %(parcel_id)s, %(tracking_number)s, %(status_message)s,
+                    %(status_date)s, %(payload)s, 'pending',
+                    %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (dedup_key) DO NOTHING
+        """, {
+            'dedup_key': f"{parcel_id}:{timestamp or status.get('id')}",
+            'action': data.get('action'),
+            'parcel_id': parcel_id,
+            'tracking_number': parcel.get('tracking_number'),
+            'status_message': status.get('message'),
+            'status_date': status_date,
+            'payload': raw_data,
+            'uid': self.env.uid,
+        })
+        if self.env.cr.rowcount:
+            self._trigger_processing()
+
+    @api.model
+    def _trigger_processing(self):
+        cron = self.env.ref('om_sendcloud_delivery.ir_cron_process_sendcloud_webhooks', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    # =================================================================================
+    # VERWERKING (cron)
+    # =================================================================================
+
+    @api.model
+    def _cron_process_inbox(self, limit=1000):
+        self._purge_old_events()
+        events = self.search([('state', '=', 'pending')], limit=limit)
+        if not events:
+            return
+
+        # Enkel statuswijzigingen doen iets, de rest leggen we opzij
+        status_events = events.filtered(lambda e: e.action == 'parcel_status_changed' and e.tracking_number)
+        (events - status_events).write({'state': 'ignored', 'note': "Geen statuswijziging"})
+
+        # Samenvoegen: per tracking nummer telt enkel het recentste event uit deze batch
+        latest = {}
+        for event in status_events:
+            current = latest.get(event.tracking_number)
+            if not current or (event.status_date, event.id) > (current.status_date, current.id):
+                latest[event.tracking_number] = event
+
+        # Alle leveringen in één query
+        pickings = self.env['stock.picking'].sudo().search([('carrier_tracking_ref', 'in', list(latest))])
+        picking_by_tracking = {p.carrier_tracking_ref: p for p in pickings}
+
+        applied = self.browse()
+        for tracking_number, event in latest.items():
+            picking = picking_by_tracking.get(tracking_number)
+            if not picking:
+                continue
+            # Out-of-order: de levering heeft al een recentere status
+            if picking.sendcloud_status_date and event.status_date <= picking.sendcloud_status_date:
+                continue
+            picking.write({
+                'sendcloud_status': event.status_message,
+                'sendcloud_status_date': event.status_date,
+            })
+            picking.message_post(
+                body=f"Sendcloud Status Update: {event.status_message}",
+                message_type="notification"
+            )
+            applied |= event
+
+        applied.write({'state': 'done'})
+        (status_events - applied).write({
+            'state': 'ignored',
+            'note': "Samengevoegd, verouderd of geen levering gevonden",
+        })
+        self.env.cr.commit()
+
+        if len(events) == limit:
+            self._trigger_processing()
+
+    @api.model
+    def _purge_old_events(self):
+        """ Retentie: verwerkte en genegeerde events ouder dan WEBHOOK_RETENTION_DAYS verwijderen. """
+        self.env.cr.execute("""
+            DELETE FROM sendcloud_webhook_event
+            WHERE state != 'pending' AND create_date < %s
+        """, [fields.Datetime.now() - timedelta(days=WEBHOOK_RETENTION_DAYS)])
+        if self.env.cr.rowcount:
+            _logger.info(f"Sendcloud webhook inbox: {self.env.cr.rowcount} oude events verwijderd.")
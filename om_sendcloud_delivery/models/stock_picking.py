@@ -0,0 +1,25 @@
+from odoo import models, fields
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    # Laatst verwerkte Sendcloud status, zodat oudere webhooks niets overschrijven
+    sendcloud_status = fields.Char(string="Sendcloud Status", readonly=True, copy=False)
+    sendcloud_status_date = fields.Datetime(string="Sendcloud Status Tijdstip", readonly=True, copy=False)
+
+    def _action_done(self):
+        # Alle leveringen die samen gevalideerd worden, in één Sendcloud batch (zie sendcloud_send_shipping)
+        return super(StockPicking, self.with_context(sendcloud_batch_picking_ids=self.ids))._action_done()
+
+    def _sendcloud_needs_parcel(self, carrier):
+        """ Zelfde voorwaarden als stock_delivery gebruikt om send_to_shipper op te roepen. """
+        self.ensure_one()
+        return (
+            self.carrier_id == carrier
+            and self.state == 'done'
+            and carrier.integration_level == 'rate_and_ship'
+            and self.picking_type_code != 'incoming'
+            and not self.carrier_tracking_ref
+            and self.picking_type_id.print_label
+        )
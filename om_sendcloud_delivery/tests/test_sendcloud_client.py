@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.om_sendcloud_delivery.models.sendcloud_client import (
+    SendcloudClient, SendcloudError, get_session,
+)
+
+
+class MockSendcloudHandler(BaseHTTPRequestHandler):
+    """ Minimale Sendcloud API: /parcels (enkel en multi), /label.pdf en een paar foutcodes. """
+    protocol_version = 'HTTP/1.1'  # keep-alive, zodat we hergebruik van de connectie kunnen zien
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.requests.append((self.command, self.path, self.client_address, self.headers.get('Authorization')))
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path != '/api/v2/parcels':
+            return self._reply(404, {'error': 'not found'})
+        if 'parcels' in data:
+            parcels, failed = [], []
+            # Omgekeerde volgorde: de client mag niet op de volgorde rekenen
+            for n, parcel in reversed(list(enumerate(data['parcels'], start=1))):
+                if parcel.get('postal_code') == 'FOUT':
+                    failed.append({'parcel': parcel, 'errors': {'postal_code': ['Ongeldig']}})
+                else:
+                    parcels.append(dict(parcel, id=n, tracking_number=f"TRACK{n}"))
+            return self._reply(200, {'parcels': parcels, 'failed_parcels': failed})
+        if data['parcel'].get('postal_code') == 'FOUT':
+            return self._reply(400, {'error': {'message': 'Ongeldig adres'}})
+        return self._reply(200, {'parcel': dict(data['parcel'], id=1, tracking_number='TRACK1')})
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, self.client_address, self.headers.get('Authorization')))
+        if self.path.startswith('/api/v2/shipping-price'):
+            return self._reply(200, [{'price': '4.95', 'currency': 'EUR'}])
+        if self.path == '/label.pdf':
+            return self._reply(200, b'%PDF-1.4 label', content_type='application/pdf')
+        if self.path == '/overbelast':
+            return self._reply(503, {'error': 'later opnieuw'})
+        return self._reply(404, {'error': 'not found'})
+
+
+@tagged('post_install', '-at_install')
+class TestSendcloudClient(BaseCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockSendcloudHandler)
+        cls.server.requests = []
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.api_url = f"{cls.base_url}/api/v2"
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        self.client = SendcloudClient(('public', 'secret'), api_url=self.api_url, timeout=5)
+
+    def test_create_parcel(self):
+        parcel = self.client.create_parcel({'parcel': {'name': 'Test', 'postal_code': '9000'}})
+        self.assertEqual(parcel['tracking_number'], 'TRACK1')
+        self.assertTrue(self.server.requests[0][3].startswith('Basic '), "Credentials moeten meegestuurd worden")
+
+    def test_create_parcels_partial_failure(self):
+        reply = self.client.create_parcels([
+            {'external_reference': 'WH/OUT/1-a', 'postal_code': '9000'},
+            {'external_reference': 'WH/OUT/2-b', 'postal_code': 'FOUT'},
+            {'external_reference': 'WH/OUT/3-c', 'postal_code': '2000'},
+        ])
+        self.assertEqual(
+            {p['external_reference'] for p in reply['parcels']}, {'WH/OUT/1-a', 'WH/OUT/3-c'})
+        self.assertEqual(reply['failed_parcels'][0]['parcel']['external_reference'], 'WH/OUT/2-b')
+
+    def test_errors_are_classified(self):
+        with self.assertRaises(SendcloudError) as error:
+            self.client.create_parcel({'parcel': {'postal_code': 'FOUT'}})
+        self.assertFalse(error.exception.retryable, "Een 4xx lost zichzelf niet op")
+
+        with self.assertRaises(SendcloudError) as error:
+            self.client.download_label(f"{self.base_url}/overbelast")
+        self.assertTrue(error.exception.retryable, "Een 5xx mag opnieuw geprobeerd worden")
+
+    def test_shared_session_keeps_connection_alive(self):
+        other = SendcloudClient(('public', 'secret'), api_url=self.api_url, timeout=5)
+        self.assertIs(self.client.session, other.session)
+        self.assertIs(self.client.session, get_session(self.api_url))
+
+        self.assertEqual(self.client.get_shipping_prices({'weight': 1})[0]['price'], '4.95')
+        self.assertEqual(other.download_label(f"{self.base_url}/label.pdf"), b'%PDF-1.4 label')
+        client_ports = {address[1] for _method, _path, address, _auth in self.server.requests}
+        self.assertEqual(len(client_ports), 1, "Beide calls moeten over dezelfde connectie lopen")
@@ -60,6 +60,9 @@
         'data/mail_layout.xml',
         'data/mail_templates.xml',
         'data/action_sorting.xml',
+        'data/payout_ledger_data.xml',
+        'data/facet_count_data.xml',
+        'data/ir_cron_data.xml',
 
     ],
     'assets': {
@@ -9,15 +9,15 @@ class OttersBrandController(http.Controller):
 
     @http.route(['/merken', '/merken/page/<int:page>'], type='http', auth='public', website=True)
     def brands_overview(self, page=1, **kw):
-        all_brands = request.env['otters.brand'].search([
-            ('is_published', '=', True)
-        ], order='name asc')
+        Brand = request.env['otters.brand']
 
-        visible_brands = all_brands.filtered(lambda b: b.product_ids.filtered(
-            lambda p: p.is_published and p.virtual_available > 0
-        ))
+        # product_count is opgeslagen en geïndexeerd: filteren en pagineren gebeurt in SQL
+        domain = [
+            ('is_published', '=', True),
+            ('product_count', '>', 0),
+        ]
 
-        total = len(visible_brands)
+        total = Brand.search_count(domain)
         pager = request.website.pager(
             url='/merken',
             total=total,
@@ -27,43 +27,70 @@ class OttersBrandController(http.Controller):
             url_args=kw
         )
 
-        offset = pager['offset']
-        brands_to_show = visible_brands[offset : offset + self._brands_per_page]
+        brands_to_show = Brand.search(
+            domain,
+            order='name asc',
+            limit=self._brands_per_page,
+            offset=pager['offset']
+        )
 
         return request.render('otters_consignment.brands_overview_page', {
             'brands': brands_to_show,
             'pager': pager,
         })
 
+    # Sorteeropties voor de merkpagina (worden rechtstreeks als SQL order doorgegeven)
+    _brand_sortings = {
+        'newest': {'label': 'Nieuwste', 'order': 'create_date desc, id desc'},
+        'price_asc': {'label': 'Prijs: laag naar hoog', 'order': 'list_price asc, id desc'},
+        'price_desc': {'label': 'Prijs: hoog naar laag', 'order': 'list_price desc, id desc'},
+    }
+
     # 2. Detail (AANGEPAST)
     @http.route([
         '/brand/<model("otters.brand"):brand>',
         '/brand/<model("otters.brand"):brand>/page/<int:page>'
     ], type='http', auth='public', website=True)
-    def brand_detail(self, brand, page=1, **kw):
-        all_products = brand.product_ids.filtered(
-            lambda p: p.is_published and p.virtual_available > 0
-        )
+    def brand_detail(self, brand, page=1, sortby=None, **kw):
+        Product = request.env['product.template']
+
+        if sortby not in self._brand_sortings:
+            sortby = 'newest'
+        order = self._brand_sortings[sortby]['order']
 
-        total = len(all_products)
+        # Gebruikt de index op brand_id en het opgeslagen x_shop_available vinkje
+        domain = [
+            ('brand_id', '=', brand.id),
+            ('is_published', '=', True),
+            ('x_shop_available', '=', True),
+        ]
+
+        total = Product.search_count(domain)
 
         # AANPASSING HIERONDER:
         # We gebruiken request.env['ir.http']._slug(brand) in plaats van slug(brand)
+        url_args = dict(kw, sortby=sortby)
         pager = request.website.pager(
             url='/brand/%s' % request.env['ir.http']._slug(brand),
             total=total,
             page=page,
             step=self._products_per_page,
             scope=7,
-            url_args=kw
+            url_args=url_args
         )
 
-        offset = pager['offset']
-        products_to_show = all_products[offset : offset + self._products_per_page]
+        products_to_show = Product.search(
+            domain,
+            order=order,
+            limit=self._products_per_page,
+            offset=pager['offset']
+        )
 
         values = {
             'brand': brand,
             'products': products_to_show,
             'pager': pager,
+            'sortby': sortby,
+            'brand_sortings': self._brand_sortings,
         }
-        return request.render('otters_consignment.brand_detail_page', values)
\ No newline at end of file
+        return request.render('otters_consignment.brand_detail_page', values)
@@ -4,6 +4,8 @@ from odoo.addons.website_sale.controllers.main import WebsiteSale
 from odoo import http
 from odoo.http import request
 
+from ..models.facet_count import FACET_ALWAYS_VISIBLE
+
 # Maak een logger aan
 _logger = logging.getLogger(__name__)
 class OttersWebsiteSale(WebsiteSale):
@@ -29,7 +31,15 @@ class OttersWebsiteSale(WebsiteSale):
             post['order'] = 'type asc, create_date desc'
 
         # 3. Uitvoeren
-        return super(OttersWebsiteSale, self).shop(page, category, search, ppg, **post)
+        response = super(OttersWebsiteSale, self).shop(page, category, search, ppg, **post)
+
+        # 4. Filtertellers (waarde id -> aantal beschikbare producten) uit de voorberekende index,
+        #    voor de huidige categorie. De filter template verbergt waarden met 0.
+        if hasattr(response, 'qcontext'):
+            response.qcontext['facet_counts'] = request.env['otters.facet.count'].sudo()._get_counts(
+                response.qcontext.get('category') or category)
+            response.qcontext['facet_always_visible'] = FACET_ALWAYS_VISIBLE
+        return response
 
     def _get_mandatory_billing_address_fields(self, country_sudo):
         mandatory_fields = super(OttersWebsiteSale, self)._get_mandatory_billing_address_fields(country_sudo)
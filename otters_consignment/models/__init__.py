@@ -5,7 +5,10 @@ from . import product_template
 from . import import_products_wizard
 from . import image_upload_wizard
 from . import sale_order_line
+from . import payout_ledger
+from . import facet_count
 from . import migration_wizard
+from . import migration_job
 from . import submission_label
 from . import submission_rejected_line
 from . import brand
@@ -1,10 +1,77 @@
 # -*- coding: utf-8 -*-
-from odoo import models, api
+from odoo import models, fields, api
+from bisect import bisect_left
 import re
 
+from .facet_count import FACET_ALWAYS_VISIBLE
+
+# Mapping voor S/M/L maten (voor het geval die in 'Maat' voorkomen)
+SIZE_MAP = {
+    'xxs': 1, 'xs': 2, 's': 3, 'm': 4, 'l': 5, 'xl': 6, 'xxl': 7,
+    'one size': 100
+}
+
+# Ruimte tussen twee sequences, zodat een nieuwe waarde ertussen past zonder de rest te verschuiven
+SEQUENCE_STEP = 10
+
+
+def _longest_increasing_indices(sequences):
+    """ Indexen van de langste strikt stijgende deelrij: die waarden mogen hun sequence houden. """
+    tails, tail_values = [], []
+    previous = [None] * len(sequences)
+    for i, seq in enumerate(sequences):
+        k = bisect_left(tail_values, seq)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(seq)
+        else:
+            tails[k] = i
+            tail_values[k] = seq
+    keep = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+
+def _plan_sequences(values):
+    """
+    values: [{'id', 'sequence'}] in de gewenste volgorde.
+    Waarden die al goed staan houden hun sequence; de rest krijgt een plaats in het gat
+    tussen zijn buren. Is een gat te klein, dan nummeren we het hele attribuut opnieuw.
+    Geeft [(id, nieuwe sequence)] terug, enkel voor wat verandert.
+    """
+    sequences = [v['sequence'] or 0 for v in values]
+    keep = _longest_increasing_indices(sequences)
+
+    updates = []
+    pending = []
+    low = -1
+    for i, value in enumerate(values):
+        if i not in keep:
+            pending.append(value)
+            continue
+        if pending:
+            step = (sequences[i] - low) // (len(pending) + 1)
+            if step < 1:
+                return [(v['id'], n * SEQUENCE_STEP) for n, v in enumerate(values) if v['sequence'] != n * SEQUENCE_STEP]
+            updates += [(v['id'], low + step * (n + 1)) for n, v in enumerate(pending)]
+            pending = []
+        low = sequences[i]
+    # Achteraan is er altijd plaats
+    updates += [(v['id'], low + SEQUENCE_STEP * (n + 1)) for n, v in enumerate(pending)]
+    return updates
+
+
 class ProductAttribute(models.Model):
     _inherit = 'product.attribute'
 
+    x_needs_sorting = fields.Boolean(string="Waarden Opnieuw Sorteren", default=False, copy=False,
+                                     help="Gezet als er waarden bijkwamen of hernoemd werden.")
+
     def action_sort_and_cleanup(self):
         """
         MASTER FUNCTIE: Roept zowel sorteren als opruimen aan.
@@ -16,107 +83,148 @@ class ProductAttribute(models.Model):
         # 2. Dan opruimen (lege merken verbergen)
         self.action_hide_empty_brands()
 
-    def action_sort_values(self):
-        # Haal ALLE attributen op
-        all_attrs = self.search([])
+        # 3. Shop filtertellers volledig herbouwen (vangt wat incrementeel gemist werd)
+        self.env['otters.facet.count'].sudo()._rebuild_all()
 
-        # Mapping voor S/M/L maten (voor het geval die in 'Maat' voorkomen)
-        size_map = {
-            'xxs': 1, 'xs': 2, 's': 3, 'm': 4, 'l': 5, 'xl': 6, 'xxl': 7,
-            'one size': 100
-        }
+    def action_sort_values(self):
+        # Haal ALLE attributen op (volledige controle, ook als er niets gemarkeerd is)
+        self.search([])._sort_values_incremental()
+
+    @api.model
+    def _sort_pending_values(self):
+        """ Enkel de attributen waar sinds de vorige keer waarden bijkwamen of hernoemd werden. """
+        self.search([('x_needs_sorting', '=', True)])._sort_values_incremental()
+
+    def _mark_for_sorting(self):
+        to_mark = self.filtered(lambda a: not a.x_needs_sorting)
+        if to_mark:
+            to_mark.write({'x_needs_sorting': True})
+
+    def _value_sort_key(self, name):
+        """ Sorteersleutel voor een waarde van dit attribuut. """
+        attr_name = (self.name or '').lower()
+        name = name or ''
+        folded = name.strip().casefold()
+
+        # --- LOGICA 1: MAAT & SCHOENMAAT (Numeriek) ---
+        if attr_name in ['maat', 'schoenmaat']:
+            # 1. Check S/M/L mapping
+            if folded in SIZE_MAP:
+                return (SIZE_MAP[folded], folded)
+            # 2. Pak het eerste getal (bv "92" uit "92/98")
+            numbers = re.findall(r'\d+', folded)
+            # 3. Geen getal? Helemaal achteraan.
+            return (int(numbers[0]) if numbers else 10000, folded)
+
+        # --- LOGICA 2: CONDITIE (Hartjes) ---
+        if attr_name in ['conditie', 'staat']:
+            # 5 hartjes = 1 (bovenaan), 1 hartje = 5, geen hartje = achteraan
+            return (6 - name.count('❤️') if '❤️' in name else 100, folded)
+
+        # --- LOGICA 3: ALFABETISCH (De Standaard) ---
+        return (0, folded)
+
+    def _sort_values_incremental(self):
+        """
+        Zet de actieve waarden in volgorde. Wat al goed staat blijft staan; nieuwe of hernoemde
+        waarden schuiven op hun plaats. Alle sequences gaan in één UPDATE naar de database.
+        """
+        Value = self.env['product.attribute.value']
+        Value.flush_model(['attribute_id', 'name', 'sequence', 'active'])
 
-        for attr in all_attrs:
+        updates = []
+        for attr in self:
             # We werken alleen met de actieve waarden
-            values = attr.value_ids.filtered(lambda v: v.active)
-            attr_name = attr.name.lower()
-
-            # --- LOGICA 1: MAAT & SCHOENMAAT (Numeriek) ---
-            if attr_name in ['maat', 'schoenmaat']:
-                def sort_key_numeric(val):
-                    name = val.name.lower().strip()
-
-                    # 1. Check S/M/L mapping
-                    if name in size_map: return size_map[name]
-
-                    # 2. Pak het eerste getal (bv "92" uit "92/98")
-                    numbers = re.findall(r'\d+', name)
-                    if numbers: return int(numbers[0])
-
-                    # 3. Geen getal? Helemaal achteraan.
-                    return 10000
-
-                sorted_values = sorted(values, key=sort_key_numeric)
-
-            # --- LOGICA 2: CONDITIE (Hartjes) ---
-            elif attr_name in ['conditie', 'staat']:
-                def sort_key_hearts(val):
-                    name = val.name
-                    if '❤️' in name:
-                        # 5 hartjes = sequence 1 (bovenaan)
-                        # 1 hartje = sequence 5
-                        return 6 - name.count('❤️')
-                    return 100 # Geen hartje? Achteraan.
+            values = Value.search_read([('attribute_id', '=', attr.id)], ['name', 'sequence'], order='sequence, id')
+            values.sort(key=lambda v: attr._value_sort_key(v['name']) + (v['id'],))
+            updates += _plan_sequences(values)
 
-                sorted_values = sorted(values, key=sort_key_hearts)
+        if updates:
+            self.env.cr.execute("""
+                UPDATE product_attribute_value AS v
+                SET sequence = u.sequence
+                FROM (SELECT UNNEST(%s::int[]) AS id, UNNEST(%s::int[]) AS sequence) AS u
+                WHERE v.id = u.id
+            """, [[u[0] for u in updates], [u[1] for u in updates]])
+            Value.invalidate_model(['sequence'])
 
-            # --- LOGICA 3: ALFABETISCH (De Standaard) ---
-            else:
-                # Case insensitive sorteren
-                sorted_values = sorted(values, key=lambda v: v.name.lower())
-
-            # --- TOEPASSEN ---
-            # We schrijven de sequence alleen als die veranderd is (performance)
-            for index, val in enumerate(sorted_values):
-                if val.sequence != index:
-                    val.write({'sequence': index})
+        self.filtered('x_needs_sorting').write({'x_needs_sorting': False})
 
 
     def action_hide_empty_brands(self):
-        attributes_to_skip = ['Conditie']
+        attributes_to_skip = FACET_ALWAYS_VISIBLE
 
         # --- STAP A: WAT MAG ER ONLINE STAAN? (De Witte Lijst) ---
-        valid_products = self.env['product.template'].search([
-            ('is_published', '=', True),
-            ('qty_available', '>', 0)
-        ])
-
-        # FIX: Gebruik active_test=False om OOK gearchiveerde waarden te vinden die gebruikt worden!
-        valid_value_ids = valid_products.with_context(active_test=False).mapped('attribute_line_ids.value_ids').ids
+        # Eén query op het opgeslagen x_shop_available vinkje (geen stockberekening per product)
+        valid_value_ids = self._get_shop_value_ids()
 
         # Merken verzamelen
-        valid_brand_names = valid_products.with_context(active_test=False).mapped('attribute_line_ids').filtered(
-            lambda l: l.attribute_id.name in ['Merk', 'Brand']
-        ).mapped('value_ids.name')
-
+        # FIX: Gebruik active_test=False om OOK gearchiveerde waarden te vinden die gebruikt worden!
+        Value = self.env['product.attribute.value'].with_context(active_test=False)
+        valid_brand_names = set(Value.search([
+            ('id', 'in', list(valid_value_ids)),
+            ('attribute_id.name', 'in', ['Merk', 'Brand']),
+        ]).mapped('name'))
 
         # --- STAP B: UPDATE ATTRIBUTEN (Filters) ---
-        all_attrs = self.search([])
-
-        for attr in all_attrs:
-            # Als het op de skip-lijst staat, doe niets (blijft dus aan staan)
-            if attr.name in attributes_to_skip:
-                continue
+        # Als het op de skip-lijst staat, doe niets (blijft dus aan staan)
+        all_values = Value.search_read([('attribute_id.name', 'not in', attributes_to_skip)], ['active'])
 
-            all_values = attr.value_ids.with_context(active_test=False)
-
-            # 1. Aanzetten
-            to_activate = all_values.filtered(lambda v: v.id in valid_value_ids and not v.active)
-            if to_activate: to_activate.write({'active': True})
+        # 1. Aanzetten
+        to_activate = [v['id'] for v in all_values if v['id'] in valid_value_ids and not v['active']]
+        if to_activate: Value.browse(to_activate).write({'active': True})
 
-            # 2. Uitzetten
-            to_archive = all_values.filtered(lambda v: v.id not in valid_value_ids and v.active)
-            if to_archive: to_archive.write({'active': False})
+        # 2. Uitzetten
+        to_archive = [v['id'] for v in all_values if v['id'] not in valid_value_ids and v['active']]
+        if to_archive: Value.browse(to_archive).write({'active': False})
 
+        # --- STAP C: MERKEN ---
+        Brand = self.env['otters.brand'].with_context(active_test=False)
+        brands = Brand.search_read([], ['name', 'is_published'])
 
         # 1. Aanzetten
-        brands_to_publish = self.env['otters.brand'].with_context(active_test=False).search([
-            ('name', 'in', valid_brand_names), ('is_published', '=', False)
-        ])
-        if brands_to_publish: brands_to_publish.write({'is_published': True})
+        brands_to_publish = [b['id'] for b in brands if b['name'] in valid_brand_names and not b['is_published']]
+        if brands_to_publish: Brand.browse(brands_to_publish).write({'is_published': True})
 
         # 2. Uitzetten
-        brands_to_unpublish = self.env['otters.brand'].with_context(active_test=False).search([
-            ('name', 'not in', valid_brand_names), ('is_published', '=', True)
-        ])
-        if brands_to_unpublish: brands_to_unpublish.write({'is_published': False})
\ No newline at end of file
+        brands_to_unpublish = [b['id'] for b in brands if b['name'] not in valid_brand_names and b['is_published']]
+        if brands_to_unpublish: Brand.browse(brands_to_unpublish).write({'is_published': False})
+
+    @api.model
+    def _get_shop_value_ids(self):
+        """
+        Alle attribuutwaarden die op minstens één gepubliceerd, beschikbaar product staan,
+        als set. Eén query over de attribuutlijnen en het opgeslagen x_shop_available vinkje.
+        """
+        Line = self.env['product.template.attribute.line']
+        value_field = Line._fields['value_ids']
+        Line.flush_model(['product_tmpl_id', 'value_ids'])
+        self.env['product.template'].flush_model(['is_published', 'x_shop_available', 'active'])
+
+        self.env.cr.execute(f"""
+            SELECT DISTINCT rel.{value_field.column2}
+            FROM product_template_attribute_line ptal
+            JOIN {value_field.relation} rel ON rel.{value_field.column1} = ptal.id
+            JOIN product_template pt ON pt.id = ptal.product_tmpl_id
+            WHERE pt.active
+              AND pt.is_published
+              AND pt.x_shop_available
+        """)
+        return {row[0] for row in self.env.cr.fetchall()}
+
+
+class ProductAttributeValue(models.Model):
+    _inherit = 'product.attribute.value'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        values = super().create(vals_list)
+        values.attribute_id._mark_for_sorting()
+        return values
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Hernoemd of terug actief: moet (opnieuw) op zijn plaats gezet worden
+        if 'name' in vals or vals.get('active'):
+            self.attribute_id._mark_for_sorting()
+        return res
@@ -13,17 +13,32 @@ class OttersBrand(models.Model):
 
     product_ids = fields.One2many('product.template', 'brand_id', string="Producten")
 
-    product_count = fields.Integer(compute='_compute_product_count', string="Aantal Stuks", store=False)
+    # Opgeslagen teller: wordt automatisch herberekend wanneer de stock-hooks
+    # (otters_webshop_outofstock_filter) het vinkje x_shop_available wijzigen.
+    # Zo kan /merken met één geïndexeerde query pagineren.
+    product_count = fields.Integer(
+        compute='_compute_product_count',
+        string="Aantal Stuks",
+        store=True,
+        index=True
+    )
 
+    @api.depends('product_ids.x_shop_available', 'product_ids.is_published', 'product_ids.active')
     def _compute_product_count(self):
+        # We tellen alleen de producten die:
+        # 1. Gepubliceerd zijn op de website
+        # 2. Beschikbaar zijn in de shop (x_shop_available, bijgehouden door de stock listener)
+        counts = {}
+        if self.ids:
+            groups = self.env['product.template'].sudo()._read_group([
+                ('brand_id', 'in', self.ids),
+                ('is_published', '=', True),
+                ('x_shop_available', '=', True),
+            ], ['brand_id'], ['__count'])
+            counts = {brand.id: count for brand, count in groups}
+
         for record in self:
-            # We tellen alleen de producten die:
-            # 1. Gepubliceerd zijn op de website
-            # 2. Vrij zijn voor verkoop (Virtuele stock > 0)
-            available_products = record.product_ids.filtered(
-                lambda p: p.is_published and p.virtual_available > 0
-            )
-            record.product_count = len(available_products)
+            record.product_count = counts.get(record.id, 0)
 
     @api.model_create_multi
     def create(self, vals_list):
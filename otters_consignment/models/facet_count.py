@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Sleutel in cr.precommit.data waaronder we de aangeraakte templates verzamelen
+FACET_TEMPLATE_QUEUE = 'otters_consignment.facet_template_ids'
+
+# Deze attributen blijven altijd zichtbaar (zelfde lijst als de nachtelijke opruiming)
+FACET_ALWAYS_VISIBLE = ['Conditie']
+
+
+class FacetCount(models.Model):
+    """
+    Vooraf berekende filtertellers voor de shop.
+    Eén regel per (Attribuutwaarde, Website Categorie) met het aantal gepubliceerde,
+    beschikbare producten (x_shop_available). Categorie leeg = de hele shop.
+    Een product telt ook mee voor alle bovenliggende categorieën, net als de shop filter.
+
+    Bijwerken gebeurt in twee stappen, zodat een checkout nooit op een gedeelde teller wacht:
+    1. Precommit: per gewijzigd product het verschil (+1 / -1) met wat er al geteld was
+       wegschrijven in otters.facet.delta (enkel INSERTs, geen locks op gedeelde regels).
+    2. Cron: de deltas optellen bij de tellers (INSERT ... ON CONFLICT DO UPDATE) en
+       waarden zonder beschikbaar product verbergen.
+    """
+    _name = 'otters.facet.count'
+    _description = 'Shop Filter Teller'
+
+    attribute_value_id = fields.Many2one('product.attribute.value', string="Waarde", required=True, index=True, ondelete='cascade')
+    public_categ_id = fields.Many2one('product.public.category', string="Website Categorie", index=True, ondelete='cascade')
+    product_count = fields.Integer(string="Aantal Producten")
+
+    def init(self):
+        # Eén teller per (waarde, categorie). Leeg = de hele shop, vandaar de COALESCE.
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS otters_facet_count_value_categ_uniq
+            ON otters_facet_count (attribute_value_id, COALESCE(public_categ_id, 0))
+        """)
+
+    # =================================================================================
+    # WACHTRIJ (Precommit)
+    # =================================================================================
+
+    @api.model
+    def _schedule_refresh(self, template_ids=()):
+        """ Onthoudt welke templates gewijzigd zijn; bij de commit schrijven we hun verschil weg. """
+        template_ids = {tid for tid in template_ids if tid}
+        if not template_ids:
+            return
+        data = self.env.cr.precommit.data
+        if FACET_TEMPLATE_QUEUE not in data:
+            data[FACET_TEMPLATE_QUEUE] = set()
+            self.env.cr.precommit.add(self._flush_refresh_queue)
+        data[FACET_TEMPLATE_QUEUE].update(template_ids)
+
+    @api.model
+    def _flush_refresh_queue(self):
+        template_ids = self.env.cr.precommit.data.pop(FACET_TEMPLATE_QUEUE, set())
+        if template_ids:
+            self.env.flush_all()
+            self.sudo()._apply_template_deltas(list(template_ids))
+
+    @api.model
+    def _apply_template_deltas(self, template_ids, drop=False):
+        """
+        Vergelijkt wat deze templates nu bijdragen met wat er al geteld was (otters.facet.membership)
+        en schrijft enkel het verschil weg als delta. drop=True: de templates tellen niet meer mee
+        (bv. vlak voor het verwijderen).
+        """
+        extra_where = "AND FALSE" if drop else "AND pt.id = ANY(%(template_ids)s)"
+        self.env.cr.execute(f"""
+            WITH old AS (
+                DELETE FROM otters_facet_membership
+                WHERE template_id = ANY(%(template_ids)s)
+                RETURNING attribute_value_id, public_categ_id
+            ), new AS (
+                INSERT INTO otters_facet_membership (template_id, attribute_value_id, public_categ_id)
+                {self._membership_query(extra_where)}
+                RETURNING attribute_value_id, public_categ_id
+            ), diff AS (
+                SELECT attribute_value_id, public_categ_id, -1 AS delta FROM old
+                UNION ALL
+                SELECT attribute_value_id, public_categ_id, 1 FROM new
+            )
+            INSERT INTO otters_facet_delta (attribute_value_id, public_categ_id, delta)
+            SELECT attribute_value_id, public_categ_id, SUM(delta)
+            FROM diff
+            GROUP BY attribute_value_id, public_categ_id
+            HAVING SUM(delta) != 0
+        """, {'template_ids': template_ids})
+
+    # =================================================================================
+    # CRON
+    # =================================================================================
+
+    @api.model
+    def _cron_fold_deltas(self):
+        """ Telt de openstaande deltas op bij de tellers en zet de betrokken waarden aan / uit. """
+        self.env.cr.execute("""
+            WITH folded AS (
+                DELETE FROM otters_facet_delta
+                RETURNING attribute_value_id, public_categ_id, delta
+            )
+            INSERT INTO otters_facet_count (attribute_value_id, public_categ_id, product_count)
+            SELECT attribute_value_id, public_categ_id, SUM(delta)
+            FROM folded
+            GROUP BY attribute_value_id, public_categ_id
+            ON CONFLICT (attribute_value_id, COALESCE(public_categ_id, 0))
+            DO UPDATE SET product_count = otters_facet_count.product_count + EXCLUDED.product_count
+            RETURNING attribute_value_id
+        """)
+        value_ids = list({row[0] for row in self.env.cr.fetchall()})
+        if value_ids:
+            self.invalidate_model(['product_count'])
+            self._sync_value_visibility(value_ids)
+
+    # =================================================================================
+    # OPBOUW
+    # =================================================================================
+
+    @api.model
+    def _rebuild_all(self):
+        """ Volledige herbouw (installatie / upgrade en de nachtelijke opruiming). """
+        self.env.flush_all()
+        self.env.cr.execute("DELETE FROM otters_facet_delta")
+        self.env.cr.execute("DELETE FROM otters_facet_membership")
+        self.env.cr.execute(f"""
+            INSERT INTO otters_facet_membership (template_id, attribute_value_id, public_categ_id)
+            {self._membership_query()}
+        """)
+        self.env.cr.execute("DELETE FROM otters_facet_count")
+        self.env.cr.execute("""
+            INSERT INTO otters_facet_count (attribute_value_id, public_categ_id, product_count)
+            SELECT attribute_value_id, public_categ_id, COUNT(*)
+            FROM otters_facet_membership
+            GROUP BY attribute_value_id, public_categ_id
+        """)
+        count = self.env.cr.rowcount
+        self.invalidate_model(['product_count'])
+        _logger.info(f"Shop filtertellers herbouwd: {count} regels.")
+
+    @api.model
+    def _membership_query(self, extra_where=''):
+        """
+        SELECT (template, waarde, categorie) voor elk beschikbaar product: één regel voor de hele
+        shop (categorie leeg) en één per (bovenliggende) categorie.
+        """
+        value_field = self.env['product.template.attribute.line']._fields['value_ids']
+        categ_field = self.env['product.template']._fields['public_categ_ids']
+        return f"""
+            WITH shop_values AS (
+                SELECT DISTINCT pt.id AS template_id, rel.{value_field.column2} AS value_id
+                FROM product_template pt
+                JOIN product_template_attribute_line ptal ON ptal.product_tmpl_id = pt.id
+                JOIN {value_field.relation} rel ON rel.{value_field.column1} = ptal.id
+                WHERE pt.active
+                  AND pt.is_published
+                  AND pt.x_shop_available
+                  {extra_where}
+            )
+            SELECT sv.template_id, sv.value_id, NULL::int
+            FROM shop_values sv
+            UNION
+            SELECT sv.template_id, sv.value_id, ancestor.id
+            FROM shop_values sv
+            JOIN {categ_field.relation} crel ON crel.{categ_field.column1} = sv.template_id
+            JOIN product_public_category pc ON pc.id = crel.{categ_field.column2}
+            CROSS JOIN LATERAL UNNEST(STRING_TO_ARRAY(RTRIM(pc.parent_path, '/'), '/')::int[]) AS ancestor(id)
+        """
+
+    @api.model
+    def _sync_value_visibility(self, value_ids):
+        """ Waarden zonder beschikbaar product verbergen (archiveren) en omgekeerd. """
+        self.env.cr.execute("""
+            SELECT attribute_value_id FROM otters_facet_count
+            WHERE attribute_value_id = ANY(%s) AND public_categ_id IS NULL AND product_count > 0
+        """, [value_ids])
+        visible_ids = {row[0] for row in self.env.cr.fetchall()}
+
+        Value = self.env['product.attribute.value'].with_context(active_test=False)
+        values = Value.search_read([
+            ('id', 'in', value_ids),
+            ('attribute_id.name', 'not in', FACET_ALWAYS_VISIBLE),
+        ], ['active'])
+        to_activate = [v['id'] for v in values if v['id'] in visible_ids and not v['active']]
+        if to_activate: Value.browse(to_activate).write({'active': True})
+        to_archive = [v['id'] for v in values if v['id'] not in visible_ids and v['active']]
+        if to_archive: Value.browse(to_archive).write({'active': False})
+
+    # =================================================================================
+    # SHOP
+    # =================================================================================
+
+    @api.model
+    def _get_counts(self, category=None):
+        """
+        {waarde id: aantal} voor de shop (of één categorie, inclusief subcategorieën).
+        Nog niet verwerkte deltas tellen mee, zodat het getal meteen klopt. Eén query.
+        """
+        category_id = category.id if hasattr(category, 'id') else category
+        self.env.cr.execute("""
+            SELECT attribute_value_id, SUM(product_count)::int
+            FROM (
+                SELECT attribute_value_id, public_categ_id, product_count FROM otters_facet_count
+                UNION ALL
+                SELECT attribute_value_id, public_categ_id, delta FROM otters_facet_delta
+            ) counts
+            WHERE COALESCE(public_categ_id, 0) = %s
+            GROUP BY attribute_value_id
+        """, [int(category_id or 0)])
+        return dict(self.env.cr.fetchall())
+
+
+class FacetMembership(models.Model):
+    """ Wat elk product op dit moment bijdraagt aan de tellers (basis voor de deltas). """
+    _name = 'otters.facet.membership'
+    _description = 'Shop Filter Bijdrage'
+    _log_access = False
+
+    template_id = fields.Many2one('product.template', required=True, index=True, ondelete='cascade')
+    attribute_value_id = fields.Many2one('product.attribute.value', required=True, ondelete='cascade')
+    public_categ_id = fields.Many2one('product.public.category', ondelete='cascade')
+
+
+class FacetDelta(models.Model):
+    """ Nog niet verwerkte wijzigingen aan de tellers (enkel INSERT, de cron telt ze op). """
+    _name = 'otters.facet.delta'
+    _description = 'Shop Filter Wijziging'
+    _log_access = False
+
+    attribute_value_id = fields.Many2one('product.attribute.value', required=True, ondelete='cascade')
+    public_categ_id = fields.Many2one('product.public.category', ondelete='cascade')
+    delta = fields.Integer()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Parallelle foto-downloader voor de migratie.
+
+Puur Python (geen ORM): de threads doen enkel HTTP en het wegschrijven naar de
+lokale foto-cache, alle database writes blijven op de hoofdcursor. Daardoor kan
+je hem ook los testen tegen een lokale HTTP server (http.server op localhost).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+
+class ImageDownloadPool:
+    """
+    Begrensde thread pool met één gedeelde requests.Session (keep-alive + connection pooling)
+    en een rate limit per host.
+
+        with ImageDownloadPool(max_workers=8, per_host_rate=10) as pool:
+            pool.prefetch(urls, save_path)     # start op de achtergrond
+            ...
+            content = pool.get(urls, save_path)  # wacht op het resultaat (of haalt het nu op)
+    """
+
+    def __init__(self, max_workers=8, per_host_rate=10.0, timeout=10, session=None, headers=None, postprocess=None):
+        self.max_workers = max(int(max_workers or 1), 1)
+        self.min_interval = 1.0 / per_host_rate if per_host_rate and per_host_rate > 0 else 0.0
+        self.timeout = timeout
+        self.headers = headers or DEFAULT_HEADERS
+        # Optioneel: bytes -> bytes (bv. ImageProcessor.process), draait ook in de worker thread
+        self.postprocess = postprocess
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='otters_img')
+        self._futures = {}
+        # Vrij te gebruiken door de aanroeper: info die bij het inplannen al berekend werd
+        # (bv. de migratie bewaart hier het downloadplan per foto, zie _iter_rows_with_image_prefetch)
+        self.plans = {}
+        self._host_lock = threading.Lock()
+        self._host_next_slot = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        # Niet opgehaalde prefetches hebben geen zin meer
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self.plans.clear()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    # --- Publieke API ---
+
+    def prefetch(self, urls, save_path=False):
+        """ Plant de download in op de achtergrond. Dubbele aanvragen worden samengevoegd. """
+        key = tuple(urls)
+        if key and key not in self._futures:
+            self._futures[key] = self._executor.submit(self._fetch, key, save_path)
+
+    def is_scheduled(self, urls):
+        return tuple(urls) in self._futures
+
+    def get(self, urls, save_path=False):
+        """ Geeft de ruwe bytes terug (of False). Gebruikt de prefetch als die er is. """
+        key = tuple(urls)
+        if not key:
+            return False
+        future = self._futures.pop(key, None)
+        if future is None:
+            return self._fetch(key, save_path)
+        try:
+            return future.result()
+        except Exception as e:
+            _logger.warning(f"Download mislukt voor {key[0]}: {e}")
+            return False
+
+    # --- Intern (draait in de worker threads) ---
+
+    def _wait_for_host(self, url):
+        """ Simpele rate limit: per host minstens min_interval seconden tussen twee requests. """
+        if not self.min_interval:
+            return
+        host = urlparse(url).netloc
+        with self._host_lock:
+            now = time.monotonic()
+            slot = max(now, self._host_next_slot.get(host, now))
+            self._host_next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _fetch(self, urls, save_path=False):
+        for url in urls:
+            try:
+                self._wait_for_host(url)
+                r = self.session.get(url, headers=self.headers, timeout=self.timeout)
+                if r.status_code == 200 and 'image' in r.headers.get('Content-Type', ''):
+                    content = r.content
+                    if save_path:
+                        self._save_local(save_path, content)
+                    if self.postprocess:
+                        content = self.postprocess(content)
+                    return content
+            except Exception:
+                pass
+        return False
+
+    def _save_local(self, save_path, content):
+        """ Foto-cache op schijf vullen, zodat een volgende run niets meer hoeft te downloaden. """
+        try:
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            # Eerst naar een tijdelijk bestand, zodat de hoofdthread nooit een half bestand leest
+            tmp_path = f"{save_path}.part"
+            with open(tmp_path, 'wb') as f_save:
+                f_save.write(content)
+            os.replace(tmp_path, save_path)
+            _logger.info(f"💾 CACHE OPGESLAGEN: {save_path}")
+        except Exception as save_err:
+            _logger.warning(f"Kon bestand niet lokaal cachen: {save_err}")
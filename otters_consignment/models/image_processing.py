@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Voorbewerking van productfoto's vóór ze in de ORM terechtkomen.
+
+Controleren, rechtzetten (EXIF), verkleinen en opnieuw encoderen gebeurt in een
+thread pool. PIL laat de GIL los tijdens decoderen, verkleinen en encoderen, dus een
+bulk upload gebruikt toch alle cores, zonder processen te forken vanuit een Odoo
+worker (met open database connecties en lopende threads). Odoo maakt daarna nog zijn
+eigen formaten (image_1024, ...), maar vertrekt dan van een veel kleinere afbeelding.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps
+
+_logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', {'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'method': 4}),
+}
+
+
+def process_image(data, max_resolution=1920, quality=85, image_format='jpeg'):
+    """
+    Geeft de herwerkte afbeelding als bytes terug, of False als het geen geldige afbeelding is.
+    Draait in een worker thread: geen ORM, geen database.
+    Foto's met echte transparantie blijven PNG (of WebP), de rest wordt JPEG / WebP.
+    """
+    if not data:
+        return False
+    try:
+        # verify() maakt het object onbruikbaar, dus daarna opnieuw openen
+        Image.open(io.BytesIO(data)).verify()
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+
+        if max_resolution:
+            image.thumbnail((max_resolution, max_resolution), Image.LANCZOS)
+
+        if _has_transparency(image):
+            image = image.convert('RGBA')
+            # JPEG kent geen transparantie: dan PNG houden in plaats van op wit te plakken
+            if image_format == 'jpeg':
+                output = io.BytesIO()
+                image.save(output, format='PNG', optimize=True)
+                return output.getvalue()
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        pil_format, options = IMAGE_FORMATS.get(image_format, IMAGE_FORMATS['jpeg'])
+        output = io.BytesIO()
+        image.save(output, format=pil_format, quality=quality, **options)
+        return output.getvalue()
+    except Exception as e:
+        _logger.warning(f"Ongeldige afbeelding overgeslagen: {e}")
+        return False
+
+
+def _has_transparency(image):
+    """ Enkel echte transparantie telt (een volledig ondoorzichtig alfakanaal mag gerust JPEG worden). """
+    if image.mode == 'P':
+        if 'transparency' not in image.info:
+            return False
+        image = image.convert('RGBA')
+    if image.mode not in ('RGBA', 'LA', 'PA'):
+        return False
+    return image.getchannel('A').getextrema()[0] < 255
+
+
+class ImageProcessor:
+    """
+    Thread pool rond process_image().
+
+        with ImageProcessor(max_workers=4, max_resolution=1920, quality=85) as processor:
+            results = processor.process_many([bytes1, bytes2, ...])
+
+    max_workers=0 verwerkt alles in de huidige thread (handig om te debuggen).
+    """
+
+    def __init__(self, max_workers=None, max_resolution=1920, quality=85, image_format='jpeg'):
+        self.options = {
+            'max_resolution': max_resolution,
+            'quality': quality,
+            'image_format': image_format if image_format in IMAGE_FORMATS else 'jpeg',
+        }
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='otters_image',
+        ) if max_workers > 0 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def process(self, data):
+        """ Eén afbeelding (blokkeert tot ze klaar is; mag vanuit meerdere threads). """
+        if not self._executor:
+            return process_image(data, **self.options)
+        return self._executor.submit(process_image, data, **self.options).result()
+
+    def process_many(self, datas):
+        """ Meerdere afbeeldingen parallel, resultaten in dezelfde volgorde. """
+        if not self._executor:
+            return [process_image(data, **self.options) for data in datas]
+        futures = [self._executor.submit(process_image, data, **self.options) for data in datas]
+        return [future.result() for future in futures]
@@ -2,6 +2,8 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import base64
+import shutil
+import tempfile
 import zipfile
 import io
 import logging
@@ -9,123 +11,235 @@ import re # Nodig voor flexibele matching
 
 _logger = logging.getLogger(__name__)
 
+# Zoveel afbeeldingen worden samen verkleind en weggeschreven, daarna legen we de ORM cache
+IMAGE_WRITE_BATCH = 20
+
+
 class ImageUploadWizard(models.TransientModel):
     _name = 'otters.image.upload.wizard'
     _description = 'Wizard voor bulk upload van productafbeeldingen'
 
-    zip_file = fields.Binary(string="ZIP-bestand met Afbeeldingen", required=True)
+    # Let op: de upload zelf gaat nog via het gewone Binary veld (base64 in één JSON request), dus de
+    # ZIP moet binnen web.max_file_upload_size (standaard 128 MB) en het geheugen van de worker passen.
+    # Enkel het verwerken gebeurt gestreamd. Grotere sets: opsplitsen in meerdere ZIP's.
+    zip_file = fields.Binary(string="ZIP-bestand met Afbeeldingen", required=True, attachment=True,
+                             help="Maximaal ca. 100 MB per ZIP. Grotere sets opsplitsen in meerdere uploads.")
     filename = fields.Char(string="Bestandsnaam")
 
+    state = fields.Selection([('draft', 'Concept'), ('done', 'Klaar')], default='draft')
+    total_count = fields.Integer(string="Afbeeldingen in ZIP", readonly=True)
+    processed_count = fields.Integer(string="Verwerkt", readonly=True)
+    unchanged_count = fields.Integer(string="Ongewijzigd (identiek)", readonly=True)
+    error_count = fields.Integer(string="Fouten", readonly=True)
+    error_report = fields.Text(string="Foutrapport", readonly=True)
+
     def upload_images(self):
         """
         Leest een ZIP-bestand, matcht bestanden aan product.template.default_code
         en wijst ze toe als hoofdimage (_1 / (1)) of secundaire images.
+
+        De ZIP wordt bestand per bestand gelezen en in kleine batches weggeschreven, zodat het
+        verwerken niet de hele ZIP (of alle foto's) in het geheugen houdt. De upload zelf wel:
+        zie de opmerking bij zip_file.
         """
         self.ensure_one()
 
         if not self.filename or not self.filename.lower().endswith('.zip'):
             raise UserError(_("Selecteer a.u.b. een .zip-bestand."))
 
-        # Decode de binaire ZIP-file
-        zip_content = base64.b64decode(self.zip_file)
+        errors = []
+        processed = 0
+        total = 0
 
         try:
-            with zipfile.ZipFile(io.BytesIO(zip_content), 'r') as z:
-
-                product_updates = {}
+            with self._open_zip_stream() as stream, zipfile.ZipFile(stream, 'r') as z:
 
+                # 1. Enkel de inhoudstafel lezen: welke bestanden horen bij welke code?
+                members_by_code = {}
                 for member in z.infolist():
                     file_name = member.filename
 
-                    # 1. Skip mappen, verborgen of niet-afbeeldingen
+                    # Skip mappen, verborgen of niet-afbeeldingen
                     if member.is_dir() or not re.search(r'\.(jpe?g|png)$', file_name, re.IGNORECASE):
                         continue
+                    total += 1
 
-                    # 2. Extract de CODE en het nummer
-                    code = None
-                    index = None
-
-                    # --- Patroon 1: CODE_1.jpg (CODE_VOLGNUMMER.ext) ---
-                    match_underscore = re.match(r'(.+?)_(\d+)\.(jpe?g|png)$', file_name, re.IGNORECASE)
-
-                    # --- Patroon 2: CODE (1).jpg (CODE (VOLGNUMMER).ext) ---
-                    match_parentheses = re.match(r'(.+?)\s*\((?P<index>\d+)\)\.(jpe?g|png)$', file_name, re.IGNORECASE)
-
-                    if match_underscore:
-                        # Haal code en index uit Patroon 1
-                        code = match_underscore.group(1).upper().strip()
-                        index = int(match_underscore.group(2))
-
-                    elif match_parentheses:
-                        # Haal code en index uit Patroon 2
-                        code = match_parentheses.group(1).upper().strip()
-                        index = int(match_parentheses.group('index'))
-
-                    else:
+                    code, index = self._parse_image_filename(file_name)
+                    if not code:
                         _logger.warning(f"Afbeeldingsnaam {file_name} kon niet gematcht worden aan een geldige conventie (CODE_N.jpg of CODE (N).jpg).")
+                        errors.append(f"{file_name}: naam volgt niet de conventie CODE_N.jpg of CODE (N).jpg")
                         continue
-
-                    # 3. Zoek het product
-                    product = self.env['product.template'].search([('default_code', '=ilike', code)], limit=1)
-                    if not product:
-                        _logger.warning(f"Product met code {code} niet gevonden. Afbeelding {file_name} overgeslagen.")
-                        continue
-
-                    # 4. Lees het binaire bestand
-                    image_binary = z.read(member)
-                    image_base64 = base64.b64encode(image_binary)
-
-                    if product.id not in product_updates:
-                        product_updates[product.id] = {'main_image': None, 'secondary_images': [], 'name': product.name}
-
-                    # 5. Bepaal of het hoofd- of secundaire afbeelding is
-                    if index == 1:
-                        # Index 1 is de hoofdafbeelding (image_1920)
-                        product_updates[product.id]['main_image'] = image_base64
-                    else:
-                        # Index 2 of hoger zijn secundaire afbeeldingen (product.image)
-                        product_updates[product.id]['secondary_images'].append({
-                            'name': f"{product_updates[product.id]['name']} - {index}",
-                            'image_1920': image_base64,
-                            'product_tmpl_id': product.id
-                        })
-
-                # --- UPDATE DATABASE RECORDS ---
-
-                # A. Creëer Secundaire Afbeeldingen (met duplicate check)
-                ImageModel = self.env['product.image'].sudo()
-
-                for product_id, data in product_updates.items():
-                    for img_vals in data['secondary_images']:
-                        # CHECK: Bestaat er al een extra foto voor dit product met deze naam?
-                        # De naam is bv: "Broek S.Oliver - 2"
-                        existing = ImageModel.search([
-                            ('product_tmpl_id', '=', product_id),
-                            ('name', '=', img_vals['name'])
-                        ], limit=1)
-
-                        if existing:
-                            # OPTIE 1: Overschrijven (Update de foto als hij al bestaat)
-                            existing.write({'image_1920': img_vals['image_1920']})
-                            _logger.info(f"Afbeelding geüpdatet: {img_vals['name']}")
-
-                            # OPTIE 2: Negeren (doe niets)
-                            # continue
-                        else:
-                            # Bestaat nog niet -> Aanmaken
-                            ImageModel.create(img_vals)
-
-                # B. Update Hoofdafbeeldingen (Blijft hetzelfde: overschrijven is prima)
-                for product_id, data in product_updates.items():
-                    if data['main_image']:
-                        self.env['product.template'].browse(product_id).sudo().write({
-                            'image_1920': data['main_image']
-                        })
+                    members_by_code.setdefault(code, []).append((index, member))
+
+                _logger.info(f"ZIP {self.filename}: {total} afbeeldingen voor {len(members_by_code)} codes.")
+
+                # 2. Alle codes, productnamen en bestaande extra foto's in een handvol queries
+                product_ids_by_code = self.env['product.template']._resolve_default_codes(members_by_code)
+                product_names = {
+                    p['id']: p['name']
+                    for p in self.env['product.template'].browse(list(product_ids_by_code.values())).read(['name'])
+                }
+                existing_images = {}
+                for img in self.env['product.image'].sudo().search_read(
+                        [('product_tmpl_id', 'in', list(product_names))], ['product_tmpl_id', 'name']):
+                    existing_images.setdefault(img['product_tmpl_id'][0], {}).setdefault(img['name'], img['id'])
+
+                # Checksums van wat er nu al staat: identieke foto's slaan we over
+                ProductTemplate = self.env['product.template']
+                checksums = {
+                    'main': ProductTemplate._get_image_checksums('product.template', product_names),
+                    'extra': ProductTemplate._get_image_checksums(
+                        'product.image', [img_id for imgs in existing_images.values() for img_id in imgs.values()]),
+                    'unchanged': 0,
+                }
+
+                # 3. Bestanden pas nu lezen, parallel verkleinen en in batches wegschrijven
+                batch = []
+                with self.env['product.template']._get_image_processor() as processor:
+                    for code, members in members_by_code.items():
+                        product_id = product_ids_by_code.get(code)
+                        if not product_id:
+                            _logger.warning(f"Product met code {code} niet gevonden. {len(members)} afbeelding(en) overgeslagen.")
+                            errors.extend(f"{m.filename}: geen product met code {code}" for _i, m in members)
+                            continue
+
+                        for index, member in sorted(members, key=lambda m: m[0]):
+                            batch.append((product_id, index, member))
+
+                        if len(batch) >= IMAGE_WRITE_BATCH:
+                            processed += self._write_image_batch(z, processor, batch, product_names, existing_images, checksums, errors)
+                            batch = []
+                            _logger.info(f"   ... {processed}/{total} afbeeldingen verwerkt")
+
+                    processed += self._write_image_batch(z, processor, batch, product_names, existing_images, checksums, errors)
 
         except zipfile.BadZipFile:
             raise UserError(_("Ongeldig ZIP-bestand."))
+        except UserError:
+            raise
         except Exception as e:
             _logger.error(f"Fout bij verwerken ZIP: {e}")
             raise UserError(_("Fout bij verwerken ZIP: %s") % str(e))
 
-        return {'type': 'ir.actions.act_window_close'}
+        self.write({
+            'state': 'done',
+            'total_count': total,
+            'processed_count': processed,
+            'unchanged_count': checksums['unchanged'],
+            'error_count': len(errors),
+            'error_report': '\n'.join(errors) or False,
+        })
+
+        if not errors:
+            return {'type': 'ir.actions.act_window_close'}
+
+        # Toon het rapport in dezelfde wizard
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _open_zip_stream(self):
+        """
+        Opent de ZIP als bestand. Staat hij in de filestore, dan lezen we hem daar rechtstreeks;
+        anders schrijven we hem eerst weg naar een tijdelijk bestand (geen kopie in het geheugen).
+        """
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'zip_file'),
+        ], limit=1)
+        if attachment.store_fname:
+            return open(attachment._full_path(attachment.store_fname), 'rb')
+
+        if not attachment:
+            raise UserError(_("Selecteer a.u.b. een .zip-bestand."))
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(io.BytesIO(attachment.raw), spool)
+        spool.seek(0)
+        return spool
+
+    def _parse_image_filename(self, file_name):
+        """ Geeft (CODE, volgnummer) terug, of (None, None) als de naam niet klopt. """
+        # --- Patroon 1: CODE_1.jpg (CODE_VOLGNUMMER.ext) ---
+        match_underscore = re.match(r'(.+?)_(\d+)\.(jpe?g|png)$', file_name, re.IGNORECASE)
+        if match_underscore:
+            return match_underscore.group(1).upper().strip(), int(match_underscore.group(2))
+
+        # --- Patroon 2: CODE (1).jpg (CODE (VOLGNUMMER).ext) ---
+        match_parentheses = re.match(r'(.+?)\s*\((?P<index>\d+)\)\.(jpe?g|png)$', file_name, re.IGNORECASE)
+        if match_parentheses:
+            return match_parentheses.group(1).upper().strip(), int(match_parentheses.group('index'))
+
+        return None, None
+
+    def _write_image_batch(self, z, processor, batch, product_names, existing_images, checksums, errors):
+        """
+        Leest een batch (product_id, volgnummer, zip member), verkleint alles parallel
+        en schrijft weg. Index 1 is de hoofdafbeelding, de rest worden extra foto's
+        (bestaande met dezelfde naam worden overschreven). Is de foto identiek aan wat
+        er al staat (zelfde checksum), dan schrijven we niets.
+        Geeft het aantal verwerkte afbeeldingen terug.
+        """
+        if not batch:
+            return 0
+
+        raw_images = []
+        for _product_id, _index, member in batch:
+            try:
+                raw_images.append(z.read(member))
+            except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError, RuntimeError) as e:
+                _logger.warning(f"Afbeelding {member.filename} kon niet gelezen worden: {e}")
+                errors.append(f"{member.filename}: bestand onleesbaar ({e})")
+                raw_images.append(False)
+
+        ImageModel = self.env['product.image'].sudo()
+        written = 0
+        for (product_id, index, member), raw, image in zip(batch, raw_images, processor.process_many(raw_images)):
+            if not raw:
+                continue
+            if not image:
+                errors.append(f"{member.filename}: geen geldige afbeelding")
+                continue
+            checksum = self.env['product.template']._image_checksum(image)
+            image_base64 = base64.b64encode(image)
+            written += 1
+
+            if index == 1:
+                # Index 1 is de hoofdafbeelding (image_1920)
+                if checksums['main'].get(product_id) == checksum:
+                    checksums['unchanged'] += 1
+                    continue
+                self.env['product.template'].browse(product_id).sudo().write({'image_1920': image_base64})
+                checksums['main'][product_id] = checksum
+            else:
+                # Index 2 of hoger zijn secundaire afbeeldingen (product.image)
+                # De naam is bv: "Broek S.Oliver - 2"
+                name = f"{product_names[product_id]} - {index}"
+                existing_by_name = existing_images.setdefault(product_id, {})
+                image_id = existing_by_name.get(name)
+                if image_id and checksums['extra'].get(image_id) == checksum:
+                    checksums['unchanged'] += 1
+                    continue
+                if image_id:
+                    ImageModel.browse(image_id).write({'image_1920': image_base64})
+                    _logger.info(f"Afbeelding geüpdatet: {name}")
+                else:
+                    image_id = ImageModel.create({
+                        'name': name,
+                        'image_1920': image_base64,
+                        'product_tmpl_id': product_id,
+                    }).id
+                    existing_by_name[name] = image_id
+                checksums['extra'][image_id] = checksum
+
+        self._release_image_batch()
+        return written
+
+    def _release_image_batch(self):
+        """ Naar de database schrijven en de afbeeldingen uit de ORM cache gooien. """
+        self.env.flush_all()
+        self.env.invalidate_all()
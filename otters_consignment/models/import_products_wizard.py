@@ -68,118 +68,29 @@ class ImportProductsWizard(models.TransientModel):
             _logger.info(f"Import start. Delimiter: '{delimiter}'. Headers: {csv_data.fieldnames}")
 
             # ---------------------------------------------------------------
-            # STAP 2: DE LOGICA
+            # STAP 2: RIJEN LEZEN
             # ---------------------------------------------------------------
+            parsed_rows = [parsed for parsed in (self._parse_csv_row(row) for row in csv_data) if parsed]
 
-            products_to_create = []
-
-            for row in csv_data:
-
-                # A. Basis Velden
-                name = self._get_csv_value(row, ['name', 'naam', 'titel'])
-                if not name: continue
-
-                price_str = self._get_csv_value(row, ['price', 'prijs', 'verkoopprijs']).replace(',', '.') or '0.0'
-                try: price = float(price_str)
-                except ValueError: price = 0.0
-
-                default_code = self._get_csv_value(row, ['code', 'default_code', 'ref', 'DRO code'])
-
-                # SEO & Omschrijvingen
-                seo_title = self._get_csv_value(row, ['seo_title', 'meta title'])
-                seo_desc = self._get_csv_value(row, ['seo_description', 'meta description'])
-                web_desc_raw = self._get_csv_value(row, ['website_description', 'omschrijving'])
-                web_desc = web_desc_raw.replace('\n', '<br/>') if web_desc_raw else ''
-
-                # B. Maak de Product Dictionary
-                product_vals = {
-                    'name': name,
-                    'list_price': price,
-                    'submission_id': submission.id,
-                    'is_published': True,
-                    'type': 'consu',
-                    'is_storable': True,
-                    'qty_available': 1,
-                    'default_code': default_code,
-                    'website_meta_title': seo_title,
-                    'website_meta_description': seo_desc,
-                    'description_sale': web_desc,
-                    'description_ecommerce': web_desc,
-                }
-
-                # C. Categorie Logica
-                # We lezen gewoon wat er in de CSV staat
-                cat_raw = self._get_csv_value(row, ['category', 'categorie', 'type'])
-
-                if cat_raw:
-                    # 1. Website Categorie (Hiërarchie maken)
-                    category_id = self._find_or_create_category_hierarchy(cat_raw)
-                    if category_id:
-                        product_vals['public_categ_ids'] = [(6, 0, [category_id])]
-
-                        # 2. NIEUW: Interne Categorie (voor backend)
-                        # We pakken de naam van de net gevonden/gemaakte categorie
-                        public_cat = self.env['product.public.category'].browse(category_id)
-
-                        # Zoek of maak een interne categorie met diezelfde naam
-                        internal_cat = self.env['product.category'].search([('name', '=', public_cat.name)], limit=1)
-                        if not internal_cat:
-                            internal_cat = self.env['product.category'].create({'name': public_cat.name})
-
-                        product_vals['categ_id'] = internal_cat.id
-
-                # D. Attributen Verzamelen
-                attribute_lines = []
-
-                # 1. Merk
-                merk_raw = self._get_csv_value(row, ['merk', 'brand'])
-                if merk_raw:
-                    brand = self._find_or_create_brand(merk_raw)
-                    if not brand.is_published:
-                        brand.write({'is_published': True})
-                    product_vals['brand_id'] = brand.id
-                    self._add_attribute_line(attribute_lines, 'Merk', merk_raw)
-
-                # 2. Conditie
-                conditie_raw = self._get_csv_value(row, ['condition_number', 'conditie', 'staat'])
-                if conditie_raw:
-                    val = self.CONDITION_MAPPING.get(conditie_raw, conditie_raw)
-                    self._add_attribute_line(attribute_lines, 'Conditie', val)
-
-                # 3. Dynamische Kolommen
-                for header in row.keys():
-                    if not header: continue
-                    clean_header = header.strip()
-                    val = row[header].strip()
-
-                    if not val: continue
-                    if clean_header.lower() in [x.lower() for x in self.BASE_FIELDS]:
-                        continue
-
-                    attr_name = clean_header.capitalize()
-
-                    # Speciale check: Maat vs Schoenmaat
-                    # Als de categorie 'Schoen' bevat, noemen we de attribuut 'Schoenmaat'
-                    if attr_name.lower() in ['maat', 'size']:
-                        if cat_raw and 'schoen' in cat_raw.lower():
-                            attr_name = 'Schoenmaat'
-                        else:
-                            attr_name = 'Maat'
-
-                    self._add_attribute_line(attribute_lines, attr_name, val)
-
-                if attribute_lines:
-                    product_vals['attribute_line_ids'] = attribute_lines
-
-                products_to_create.append(product_vals)
+            # ---------------------------------------------------------------
+            # STAP 3: ALLE CATEGORIEËN, MERKEN EN ATTRIBUTEN IN ÉÉN KEER
+            # Eén keer opzoeken (en wat ontbreekt samen aanmaken) per unieke
+            # waarde, in plaats van een paar zoekopdrachten per rij.
+            # ---------------------------------------------------------------
+            cache = self._build_resolver_cache(parsed_rows)
+
+            # ---------------------------------------------------------------
+            # STAP 4: DE PRODUCTEN
+            # ---------------------------------------------------------------
+            products_to_create = [self._prepare_product_vals(parsed, submission, cache) for parsed in parsed_rows]
 
             # E. Alles aanmaken
             if products_to_create:
                 self.env['product.template'].create(products_to_create)
 
-            # F. Nasorteren
+            # F. Nasorteren (enkel attributen met nieuwe of hernoemde waarden)
             try:
-                self.env['product.attribute'].search([]).action_sort_values()
+                self.env['product.attribute']._sort_pending_values()
             except Exception as e:
                 _logger.warning(f"Sorteerfout: {e}")
 
@@ -188,7 +99,7 @@ class ImportProductsWizard(models.TransientModel):
 
         return {'type': 'ir.actions.act_window_close'}
 
-    # --- HULPFUNCTIES (Ongewijzigd) ---
+    # --- HULPFUNCTIES ---
 
     def _get_csv_value(self, row, key_variants):
         for k in key_variants:
@@ -198,98 +109,304 @@ class ImportProductsWizard(models.TransientModel):
                     return row[header].strip()
         return ''
 
-    def _find_or_create_category_hierarchy(self, path_str):
-        path_str = str(path_str).strip()
-        if not path_str: return False
-
-        if '/' not in path_str:
-            existing_cat = self.env['product.public.category'].search([
-                ('name', '=ilike', path_str)
-            ], limit=1)
-            if existing_cat: return existing_cat.id
-
-        parts = [p.strip() for p in path_str.split('/') if p.strip()]
-        parent_id = False
-        last_cat = False
-
-        for part in parts:
-            cat = self.env['product.public.category'].search([
-                ('name', '=ilike', part),
-                ('parent_id', '=', parent_id)
-            ], limit=1)
-
-            if not cat:
-                cat = self.env['product.public.category'].create({
-                    'name': part.capitalize(),
-                    'parent_id': parent_id
-                })
-                # Zorg dat de koppeling met Type ook gelegd wordt!
-                self._ensure_category_type_link(cat)
-
-            parent_id = cat.id
-            last_cat = cat
-
-        return last_cat.id if last_cat else False
-
-    def _ensure_category_type_link(self, category):
-        """ Zorgt dat de categorie gekoppeld is aan een Type waarde """
+    def _parse_csv_row(self, row):
+        """ Leest één CSV rij uit, zonder database. Geeft None terug voor rijen zonder naam. """
+        # A. Basis Velden
+        name = self._get_csv_value(row, ['name', 'naam', 'titel'])
+        if not name:
+            return None
+
+        price_str = self._get_csv_value(row, ['price', 'prijs', 'verkoopprijs']).replace(',', '.') or '0.0'
+        try: price = float(price_str)
+        except ValueError: price = 0.0
+
+        web_desc_raw = self._get_csv_value(row, ['website_description', 'omschrijving'])
+
+        # We lezen gewoon wat er in de CSV staat
+        cat_raw = self._get_csv_value(row, ['category', 'categorie', 'type'])
+        merk_raw = self._get_csv_value(row, ['merk', 'brand'])
+
+        # Attributen verzamelen als (naam, waarde), in volgorde
+        attributes = []
+        # 1. Merk
+        if merk_raw:
+            attributes.append(('Merk', merk_raw))
+
+        # 2. Conditie
+        conditie_raw = self._get_csv_value(row, ['condition_number', 'conditie', 'staat'])
+        if conditie_raw:
+            attributes.append(('Conditie', self.CONDITION_MAPPING.get(conditie_raw, conditie_raw)))
+
+        # 3. Dynamische Kolommen
+        base_fields = {x.lower() for x in self.BASE_FIELDS}
+        for header in row.keys():
+            if not header: continue
+            clean_header = header.strip()
+            val = (row[header] or '').strip()
+
+            if not val: continue
+            if clean_header.lower() in base_fields:
+                continue
+
+            attr_name = clean_header.capitalize()
+
+            # Speciale check: Maat vs Schoenmaat
+            # Als de categorie 'Schoen' bevat, noemen we de attribuut 'Schoenmaat'
+            if attr_name.lower() in ['maat', 'size']:
+                if cat_raw and 'schoen' in cat_raw.lower():
+                    attr_name = 'Schoenmaat'
+                else:
+                    attr_name = 'Maat'
+
+            attributes.append((attr_name, val))
+
+        return {
+            'name': name,
+            'price': price,
+            'default_code': self._get_csv_value(row, ['code', 'default_code', 'ref', 'DRO code']),
+            'seo_title': self._get_csv_value(row, ['seo_title', 'meta title']),
+            'seo_desc': self._get_csv_value(row, ['seo_description', 'meta description']),
+            'web_desc': web_desc_raw.replace('\n', '<br/>') if web_desc_raw else '',
+            'category': cat_raw,
+            'brand': merk_raw,
+            # Meerdere waarden in één cel: "Rood, Blauw" of "Rood|Blauw"
+            'attributes': [
+                (attr_name, [v.strip() for v in val.replace('|', ',').split(',') if v.strip()])
+                for attr_name, val in attributes
+            ],
+        }
+
+    def _prepare_product_vals(self, parsed, submission, cache):
+        # B. Maak de Product Dictionary
+        product_vals = {
+            'name': parsed['name'],
+            'list_price': parsed['price'],
+            'submission_id': submission.id,
+            'is_published': True,
+            'type': 'consu',
+            'is_storable': True,
+            'qty_available': 1,
+            'default_code': parsed['default_code'],
+            'website_meta_title': parsed['seo_title'],
+            'website_meta_description': parsed['seo_desc'],
+            'description_sale': parsed['web_desc'],
+            'description_ecommerce': parsed['web_desc'],
+        }
+
+        # C. Categorie: website categorie + interne categorie met dezelfde naam
+        category = cache['public_category'].get(parsed['category'].strip())
+        if category:
+            category_id, category_name = category
+            product_vals['public_categ_ids'] = [(6, 0, [category_id])]
+            product_vals['categ_id'] = cache['internal_category'][category_name]
+
+        # D. Merk
+        if parsed['brand']:
+            product_vals['brand_id'] = cache['brand'][parsed['brand'].lower()]
+
+        # Attributen: één lijn per waarde
+        attribute_lines = []
+        for attr_name, values in parsed['attributes']:
+            attribute_id = cache['attribute'][attr_name.lower()]
+            for v in values:
+                attribute_lines.append((0, 0, {
+                    'attribute_id': attribute_id,
+                    'value_ids': [(6, 0, [cache['attribute_value'][(attribute_id, v.lower())]])],
+                }))
+        if attribute_lines:
+            product_vals['attribute_line_ids'] = attribute_lines
+
+        return product_vals
+
+    def _build_resolver_cache(self, parsed_rows):
+        """
+        Zoekt alle categorieën, merken, attributen en waarden van deze import in een
+        handvol queries op en maakt wat ontbreekt in één batch per model aan.
+        De sleutels zijn hoofdletterongevoelig, net als de =ilike zoekopdrachten van vroeger.
+        """
+        paths = {r['category'].strip() for r in parsed_rows if r['category'].strip()}
+        public_categories = self._resolve_category_paths(paths)
+        brand_names = {r['brand'] for r in parsed_rows if r['brand']}
+        attribute_values = {}
+        for r in parsed_rows:
+            for attr_name, values in r['attributes']:
+                attribute_values.setdefault(attr_name, []).extend(values)
+
+        attributes, values = self._resolve_attributes(attribute_values)
+        return {
+            'public_category': public_categories,
+            'internal_category': self._resolve_internal_categories({name for _id, name in public_categories.values()}),
+            'brand': self._resolve_brands(brand_names),
+            'attribute': attributes,
+            'attribute_value': values,
+        }
+
+    def _resolve_category_paths(self, paths):
+        """
+        {pad uit de CSV: (website categorie id, naam)}. Een naam zonder '/' mag overal in de
+        boom staan; anders volgen we het pad vanaf de wortel en maken we ontbrekende
+        niveaus aan (per niveau in één batch).
+        """
+        Category = self.env['product.public.category']
+        by_parent = {}
+        by_name = {}
+        for cat in Category.search_read([], ['name', 'parent_id']):
+            value = (cat['id'], cat['name'])
+            by_parent.setdefault((cat['parent_id'][0] if cat['parent_id'] else False, cat['name'].lower()), value)
+            by_name.setdefault(cat['name'].lower(), value)
+
+        result = {}
+        new_categories = Category
+        # Eerst de volledige paden, zodat een losse naam ook een net aangemaakte subcategorie vindt
+        for group in ([p for p in paths if '/' in p], [p for p in paths if '/' not in p]):
+            pending = []
+            for path in group:
+                if '/' not in path and path.lower() in by_name:
+                    result[path] = by_name[path.lower()]
+                    continue
+                parts = [p.strip() for p in path.split('/') if p.strip()]
+                if parts:
+                    pending.append((path, parts))
+
+            parents = dict.fromkeys((path for path, _parts in pending), False)
+            depth = 0
+            while pending:
+                to_create = {}
+                for path, parts in pending:
+                    key = (parents[path], parts[depth].lower())
+                    if key not in by_parent and key not in to_create:
+                        to_create[key] = {'name': parts[depth].capitalize(), 'parent_id': parents[path]}
+                if to_create:
+                    created = Category.create(list(to_create.values()))
+                    for key, cat in zip(to_create, created):
+                        by_parent[key] = (cat.id, cat.name)
+                        by_name.setdefault(key[1], (cat.id, cat.name))
+                    new_categories |= created
+
+                still_pending = []
+                for path, parts in pending:
+                    category = by_parent[(parents[path], parts[depth].lower())]
+                    if depth == len(parts) - 1:
+                        result[path] = category
+                    else:
+                        parents[path] = category[0]
+                        still_pending.append((path, parts))
+                pending = still_pending
+                depth += 1
+
+        # Zorg dat de koppeling met Type ook gelegd wordt!
+        self._ensure_category_type_links(new_categories)
+        return result
+
+    def _ensure_category_type_links(self, categories):
+        """ Zorgt dat de categorieën gekoppeld zijn aan een Type waarde """
+        if not categories:
+            return
         type_attr = self.env['product.attribute'].search([('name', '=', 'Type')], limit=1)
         if not type_attr:
             type_attr = self.env['product.attribute'].create({'name': 'Type', 'display_type': 'radio'})
 
-        type_val = self.env['product.attribute.value'].search([
-            ('attribute_id', '=', type_attr.id),
-            ('name', '=', category.name)
-        ], limit=1)
-
-        if not type_val:
-            type_val = self.env['product.attribute.value'].create({
-                'attribute_id': type_attr.id,
-                'name': category.name
-            })
-
-        if category.x_linked_type_value_id != type_val:
-            category.write({'x_linked_type_value_id': type_val.id})
-
-    def _find_or_create_brand(self, name):
-        brand = self.env['otters.brand'].search([('name', '=ilike', name)], limit=1)
-        if brand:
-            if not brand.is_published:
-                brand.write({'is_published': True})
-        else:
-            brand = self.env['otters.brand'].create({'name': name, 'is_published': True})
-        return brand
-
-    def _add_attribute_line(self, lines_list, attr_name, val_string):
-        if not val_string: return
-        values = [v.strip() for v in val_string.replace('|', ',').split(',') if v.strip()]
-        attribute = self.env['product.attribute'].search([('name', '=ilike', attr_name)], limit=1)
-        if not attribute:
-            attribute = self.env['product.attribute'].create({
-                'name': attr_name,
+        Value = self.env['product.attribute.value']
+        type_values = {}
+        for val in Value.search_read([('attribute_id', '=', type_attr.id), ('name', 'in', categories.mapped('name'))], ['name']):
+            type_values.setdefault(val['name'], val['id'])
+        missing = [name for name in dict.fromkeys(categories.mapped('name')) if name not in type_values]
+        if missing:
+            for val in Value.create([{'attribute_id': type_attr.id, 'name': name} for name in missing]):
+                type_values[val.name] = val.id
+
+        for category in categories:
+            if category.x_linked_type_value_id.id != type_values[category.name]:
+                category.write({'x_linked_type_value_id': type_values[category.name]})
+
+    def _resolve_internal_categories(self, names):
+        """ {naam: product.category id}, ontbrekende worden aangemaakt. """
+        if not names:
+            return {}
+        result = {}
+        for cat in self.env['product.category'].search_read([('name', 'in', list(names))], ['name']):
+            result.setdefault(cat['name'], cat['id'])
+        missing = [name for name in names if name not in result]
+        if missing:
+            for cat in self.env['product.category'].create([{'name': name} for name in missing]):
+                result[cat.name] = cat.id
+        return result
+
+    def _resolve_brands(self, names):
+        """ {naam in kleine letters: merk id}. Gebruikte merken worden (opnieuw) gepubliceerd. """
+        if not names:
+            return {}
+        Brand = self.env['otters.brand']
+        wanted = {name.lower(): name for name in names}
+        result = {}
+        unpublished = []
+        for brand in Brand.search_read([], ['name', 'is_published']):
+            key = brand['name'].lower()
+            if key in wanted and key not in result:
+                result[key] = brand['id']
+                if not brand['is_published']:
+                    unpublished.append(brand['id'])
+        if unpublished:
+            Brand.browse(unpublished).write({'is_published': True})
+
+        missing = [name for key, name in wanted.items() if key not in result]
+        if missing:
+            for brand in Brand.create([{'name': name, 'is_published': True} for name in missing]):
+                result[brand.name.lower()] = brand.id
+        return result
+
+    def _resolve_attributes(self, attribute_values):
+        """
+        attribute_values: {attribuut naam: [waarden]}.
+        Geeft ({naam in kleine letters: attribuut id}, {(attribuut id, waarde in kleine letters): waarde id}).
+        Gearchiveerde waarden die in de import staan worden terug actief gezet.
+        """
+        if not attribute_values:
+            return {}, {}
+        Attribute = self.env['product.attribute']
+        wanted = {}
+        for name in attribute_values:
+            wanted.setdefault(name.lower(), name)
+
+        attributes = {}
+        for attr in Attribute.search_read([], ['name']):
+            key = attr['name'].lower()
+            if key in wanted:
+                attributes.setdefault(key, attr['id'])
+        missing = [name for key, name in wanted.items() if key not in attributes]
+        if missing:
+            for attr in Attribute.create([{
+                'name': name,
                 'create_variant': 'no_variant',
                 'display_type': 'radio'
-            })
-
-        val_ids = []
-        for v in values:
-            val_obj = self.env['product.attribute.value'].with_context(active_test=False).search([
-                ('attribute_id', '=', attribute.id),
-                ('name', '=ilike', v)
-            ], limit=1)
-
-            if not val_obj:
-                val_obj = self.env['product.attribute.value'].create({
-                    'attribute_id': attribute.id,
-                    'name': v
-                })
-            elif not val_obj.active:
-                val_obj.write({'active': True})
-
-            val_ids.append(val_obj.id)
-
-        for val_id in val_ids:
-            lines_list.append((0, 0, {
-                'attribute_id': attribute.id,
-                'value_ids': [(6, 0, [val_id])],
-            }))
\ No newline at end of file
+            } for name in missing]):
+                attributes[attr.name.lower()] = attr.id
+
+        # Enkel de waarden die deze import vraagt (de rest blijft verborgen, zie de nachtelijke opruiming)
+        requested = {
+            (attributes[name.lower()], v.lower())
+            for name, names in attribute_values.items() for v in names
+        }
+        Value = self.env['product.attribute.value'].with_context(active_test=False)
+        values = {}
+        inactive = []
+        for val in Value.search_read([('attribute_id', 'in', list(attributes.values()))], ['attribute_id', 'name', 'active']):
+            key = (val['attribute_id'][0], val['name'].lower())
+            if key not in values:
+                values[key] = val['id']
+                if not val['active'] and key in requested:
+                    inactive.append(val['id'])
+        if inactive:
+            Value.browse(inactive).write({'active': True})
+
+        to_create = {}
+        for name, names in attribute_values.items():
+            attribute_id = attributes[name.lower()]
+            for v in names:
+                key = (attribute_id, v.lower())
+                if key not in values and key not in to_create:
+                    to_create[key] = {'attribute_id': attribute_id, 'name': v}
+        if to_create:
+            for key, val in zip(to_create, Value.create(list(to_create.values()))):
+                values[key] = val.id
+        return attributes, values
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import io
+import itertools
+import json
+import logging
+import time
+import traceback
+
+_logger = logging.getLogger(__name__)
+
+# Volgorde van de fases. (fase, binair veld of False voor een fase zonder bestand)
+MIGRATION_PHASES = [
+    ('setup', False),
+    ('customers', 'file_customers'),
+    ('submissions', 'file_submissions'),
+    ('brands', 'file_brands'),
+    ('migration_records', False),
+    ('products', 'file_products'),
+    ('giftcards', 'file_giftcards'),
+    ('actioncodes', 'file_actioncodes'),
+]
+
+PHASE_SELECTION = [
+    ('setup', 'Categorieën & Types'),
+    ('customers', '1. Klanten'),
+    ('submissions', '2. Verzendzakken'),
+    ('brands', '3. Merken'),
+    ('migration_records', 'Fictieve Migratie Records'),
+    ('products', '4. Producten'),
+    ('giftcards', '5. Cadeaubonnen'),
+    ('actioncodes', '6. Actiecodes'),
+]
+
+
+class MigrationJob(models.Model):
+    """
+    Persistente, hervatbare migratie. Vervangt het oude start_migration dat alles
+    in één HTTP request deed. De cron verwerkt de CSV's in chunks en bewaart
+    na elke chunk een checkpoint (bestands-hash + laatst verwerkte rij).
+    """
+    _name = 'otters.migration.job'
+    _description = 'Migratie Job'
+    _order = 'id desc'
+
+    name = fields.Char(string="Naam", required=True, readonly=True, default=lambda self: fields.Datetime.to_string(fields.Datetime.now()))
+    state = fields.Selection([
+        ('draft', 'Concept'),
+        ('queued', 'In Wachtrij'),
+        ('running', 'Bezig'),
+        ('paused', 'Gepauzeerd'),
+        ('done', 'Klaar'),
+        ('failed', 'Mislukt'),
+    ], string="Status", default='draft', required=True, readonly=True)
+
+    chunk_size = fields.Integer(string="Rijen per Chunk", default=100, required=True)
+    image_base_path = fields.Char(string="Lokaal Pad naar Foto's (Server)")
+    old_site_url = fields.Char(string="Oude Website URL", default="https://www.ottersenflamingos.be")
+
+    # --- Bestanden (als attachment in de filestore, zodat we ze kunnen streamen) ---
+    file_customers = fields.Binary(string="1. Klanten", attachment=True)
+    filename_customers = fields.Char()
+    file_submissions = fields.Binary(string="2. Verzendzakken", attachment=True)
+    filename_submissions = fields.Char()
+    file_brands = fields.Binary(string="3. Merken", attachment=True)
+    filename_brands = fields.Char()
+    file_products = fields.Binary(string="4. Producten", attachment=True)
+    filename_products = fields.Char()
+    file_giftcards = fields.Binary(string="5. Cadeaubonnen", attachment=True)
+    filename_giftcards = fields.Char()
+    file_actioncodes = fields.Binary(string="6. Actiecodes", attachment=True)
+    filename_actioncodes = fields.Char()
+
+    # --- Mappings tussen fases (oud ID -> Odoo ID) staan in otters.migration.map, overleven een herstart ---
+    map_ids = fields.One2many('otters.migration.map', 'job_id', string="Mappings")
+
+    migration_partner_id = fields.Many2one('res.partner', string="Fictieve Migratie Klant", readonly=True)
+    migration_submission_id = fields.Many2one('otters.consignment.submission', string="Fictieve Migratie Inzending", readonly=True)
+
+    checkpoint_ids = fields.One2many('otters.migration.checkpoint', 'job_id', string="Fases")
+    current_phase = fields.Selection(PHASE_SELECTION, string="Huidige Fase", readonly=True)
+    progress = fields.Float(string="Voortgang (%)", compute='_compute_progress')
+    error_message = fields.Text(string="Foutmelding", readonly=True)
+
+    @api.depends('checkpoint_ids.last_row', 'checkpoint_ids.total_rows', 'checkpoint_ids.state')
+    def _compute_progress(self):
+        for job in self:
+            checkpoints = job.checkpoint_ids.filtered(lambda c: c.state != 'skipped')
+            if not checkpoints:
+                job.progress = 0.0
+                continue
+            total = sum(checkpoints.mapped('progress')) / len(checkpoints)
+            job.progress = total
+
+    # =================================================================================
+    # KNOPPEN
+    # =================================================================================
+
+    def action_queue(self):
+        """ Zet de job (opnieuw) in de wachtrij. Bestaande checkpoints blijven behouden -> hervatten. """
+        for job in self:
+            if not job.checkpoint_ids:
+                job._create_checkpoints()
+            job.write({'state': 'queued', 'error_message': False})
+        self.env.ref('otters_consignment.ir_cron_process_migration_jobs')._trigger()
+        return True
+
+    def action_pause(self):
+        self.filtered(lambda j: j.state in ('queued', 'running')).write({'state': 'paused'})
+        return True
+
+    def action_reset(self):
+        """ Alles opnieuw vanaf rij 0 (de idempotentie-checks vangen dubbels op). """
+        self.checkpoint_ids.unlink()
+        self.map_ids.unlink()
+        self.write({'state': 'draft', 'error_message': False})
+        return True
+
+    def _create_checkpoints(self):
+        self.ensure_one()
+        vals_list = []
+        for sequence, (phase, file_field) in enumerate(MIGRATION_PHASES):
+            vals_list.append({
+                'job_id': self.id,
+                'phase': phase,
+                'sequence': sequence,
+                'state': 'pending' if (not file_field or self[file_field]) else 'skipped',
+            })
+        self.env['otters.migration.checkpoint'].create(vals_list)
+
+    # =================================================================================
+    # CRON
+    # =================================================================================
+
+    @api.model
+    def _cron_process_jobs(self, time_budget=240):
+        """ Verwerkt jobs in de wachtrij tot het tijdsbudget op is, en plant zichzelf dan opnieuw in. """
+        deadline = time.time() + time_budget
+        job = self.search([('state', 'in', ('queued', 'running'))], order='id asc', limit=1)
+        if not job:
+            return
+
+        finished = job._run(deadline)
+        if not finished or self.search_count([('state', 'in', ('queued', 'running'))]):
+            self.env.ref('otters_consignment.ir_cron_process_migration_jobs')._trigger()
+
+    def _run(self, deadline):
+        """ Geeft True terug als de job klaar (of mislukt/gepauzeerd) is, False als de tijd op is. """
+        self.ensure_one()
+        self.write({'state': 'running'})
+        self.env.cr.commit()
+
+        try:
+            for checkpoint in self.checkpoint_ids.sorted('sequence'):
+                if checkpoint.state in ('done', 'skipped'):
+                    continue
+                self.current_phase = checkpoint.phase
+                if not self._run_phase(checkpoint, deadline):
+                    return False
+                # Gepauzeerd vanuit de UI (andere transactie)?
+                self.invalidate_recordset(['state'])
+                if self.state == 'paused':
+                    return True
+        except Exception as e:
+            self.env.cr.rollback()
+            self.env['otters.migration.wizard']._clear_lookup_caches()
+            _logger.error(f"❌ MIGRATIE JOB {self.name} MISLUKT: {e}")
+            self.write({'state': 'failed', 'error_message': traceback.format_exc()})
+            self.env.cr.commit()
+            return True
+
+        self.write({'state': 'done', 'current_phase': False})
+        self.env.cr.commit()
+        _logger.info("==========================================")
+        _logger.info(f"🏁 MIGRATIE JOB {self.name} SUCCESVOL AFGEROND!")
+        _logger.info("==========================================")
+        return True
+
+    def _get_processing_wizard(self):
+        """ De verwerkingslogica zit in otters.migration.wizard; we voeden die met chunks. """
+        return self.env['otters.migration.wizard'].create({
+            'image_base_path': self.image_base_path,
+            'old_site_url': self.old_site_url,
+            'migration_partner_id': self.migration_partner_id.id,
+            'migration_submission_id': self.migration_submission_id.id,
+        })
+
+    def _run_phase(self, checkpoint, deadline):
+        wizard = self._get_processing_wizard()
+
+        # --- Fases zonder bestand ---
+        if checkpoint.phase == 'setup':
+            wizard._setup_categories_and_types()
+            checkpoint.write({'state': 'done'})
+            self.env.cr.commit()
+            return True
+
+        if checkpoint.phase == 'migration_records':
+            wizard._create_migration_records()
+            self.write({
+                'migration_partner_id': wizard.migration_partner_id.id,
+                'migration_submission_id': wizard.migration_submission_id.id,
+            })
+            checkpoint.write({'state': 'done'})
+            self.env.cr.commit()
+            return True
+
+        # --- Fases met een CSV ---
+        file_field = dict(MIGRATION_PHASES)[checkpoint.phase]
+        attachment = self._get_file_attachment(file_field)
+        if not attachment:
+            checkpoint.write({'state': 'skipped'})
+            self.env.cr.commit()
+            return True
+
+        # Bestand gewijzigd sinds het checkpoint? Dan opnieuw van voor af aan.
+        if checkpoint.file_hash and checkpoint.file_hash != attachment.checksum:
+            _logger.warning(f"Migratie {checkpoint.phase}: bestand gewijzigd, checkpoint wordt gereset.")
+            checkpoint.write({'last_row': 0, 'total_rows': 0})
+        if not checkpoint.total_rows:
+            with self._open_attachment_stream(attachment) as stream:
+                total_rows = sum(1 for _row in wizard._read_csv_stream(stream))
+            checkpoint.write({'file_hash': attachment.checksum, 'total_rows': total_rows})
+        checkpoint.write({'state': 'running'})
+        self.env.cr.commit()
+
+        _logger.info(f">>> Migratie fase {checkpoint.phase}: verder vanaf rij {checkpoint.last_row}/{checkpoint.total_rows}")
+
+        with self._open_attachment_stream(attachment) as stream:
+            reader = wizard._read_csv_stream(stream)
+            rows_iter = itertools.islice(reader, checkpoint.last_row, None)
+
+            while True:
+                rows = list(itertools.islice(rows_iter, max(self.chunk_size, 1)))
+                if not rows:
+                    break
+
+                self._process_chunk(wizard, checkpoint.phase, rows)
+                checkpoint.write({'last_row': checkpoint.last_row + len(rows)})
+                self.env.cr.commit()  # Checkpoint + data + mappings samen vastleggen
+
+                # Gepauzeerd vanuit de UI (andere transactie)? Dan niet wachten tot het einde van de fase.
+                self.invalidate_recordset(['state'])
+                if self.state == 'paused':
+                    _logger.info(f"   [JOB] Gepauzeerd bij {checkpoint.phase} rij {checkpoint.last_row}.")
+                    return True
+
+                if time.time() > deadline:
+                    _logger.info(f"   [JOB] Tijdsbudget op bij {checkpoint.phase} rij {checkpoint.last_row}. Wordt hervat.")
+                    return False
+
+        checkpoint.write({'state': 'done'})
+        self.env.cr.commit()
+        return True
+
+    def _process_chunk(self, wizard, phase, rows):
+        """
+        Roept de bestaande verwerkingslogica aan voor één chunk. Van de mappings lezen we enkel
+        de sleutels die deze rijen nodig hebben, en we schrijven enkel de nieuwe weg.
+        """
+        if phase == 'customers':
+            mapping = wizard._process_customers(rows=rows)
+            self._store_map('partner', {k: p.id for k, p in mapping.items()})
+
+        elif phase == 'submissions':
+            partner_map = self._browse_map('res.partner', self._load_map('partner', self._row_keys(wizard, rows, 'KlantId')))
+            mapping = wizard._process_submissions(partner_map, rows=rows)
+            self._store_map('submission', {k: s.id for k, s in mapping.items()})
+
+        elif phase == 'brands':
+            self._store_map('brand', wizard._process_brands(rows=rows))
+
+        elif phase == 'products':
+            submission_map = self._browse_map(
+                'otters.consignment.submission', self._load_map('submission', self._row_keys(wizard, rows, 'zak_id')))
+            brand_map = self._load_map('brand', self._row_keys(wizard, rows, 'merk_id'))
+            wizard._process_products_new_logic(submission_map, brand_map, rows=rows)
+
+        elif phase == 'giftcards':
+            wizard._process_giftcards(rows=rows)
+
+        elif phase == 'actioncodes':
+            wizard._process_actioncodes(rows=rows)
+
+    def _row_keys(self, wizard, rows, column):
+        """ De (opgekuiste) oude ID's uit één kolom van deze chunk. """
+        return list({key for key in (wizard._clean_id(row.get(column)) for row in rows) if key})
+
+    def _store_map(self, map_type, mapping):
+        """ Nieuwe mappings van deze chunk wegschrijven (één INSERT, bestaande sleutels overschrijven). """
+        if not mapping:
+            return
+        self.env.cr.execute("""
+            INSERT INTO otters_migration_map (job_id, map_type, old_id, res_id, data)
+            SELECT %s, %s, m.old_id, m.res_id, m.data
+            FROM UNNEST(%s::varchar[], %s::int[], %s::jsonb[]) AS m(old_id, res_id, data)
+            ON CONFLICT (job_id, map_type, old_id)
+            DO UPDATE SET res_id = EXCLUDED.res_id, data = EXCLUDED.data
+        """, [
+            self.id, map_type,
+            [str(key) for key in mapping],
+            [value if isinstance(value, int) else None for value in mapping.values()],
+            [json.dumps(value) if isinstance(value, dict) else None for value in mapping.values()],
+        ])
+
+    def _load_map(self, map_type, old_ids):
+        """ {oud_id: odoo_id} (of de opgeslagen dict, bv. voor merken) voor enkel deze sleutels. """
+        if not old_ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT old_id, res_id, data FROM otters_migration_map
+            WHERE job_id = %s AND map_type = %s AND old_id = ANY(%s)
+        """, [self.id, map_type, list(old_ids)])
+        return {old_id: data if data is not None else res_id for old_id, res_id, data in self.env.cr.fetchall()}
+
+    def _browse_map(self, model_name, id_map):
+        """ {oud_id: odoo_id} -> {oud_id: record}, met gedeelde prefetch. """
+        id_map = id_map or {}
+        all_ids = list(set(id_map.values()))
+        Model = self.env[model_name]
+        return {key: Model.browse(rec_id).with_prefetch(all_ids) for key, rec_id in id_map.items()}
+
+    # =================================================================================
+    # BESTANDEN
+    # =================================================================================
+
+    def _get_file_attachment(self, file_field):
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', file_field),
+        ], limit=1)
+
+    def _open_attachment_stream(self, attachment):
+        """ Opent het bestand rechtstreeks uit de filestore (geen base64 kopie in het geheugen). """
+        if attachment.store_fname:
+            return open(attachment._full_path(attachment.store_fname), 'rb')
+        return io.BytesIO(attachment.raw or b'')
+
+
+class MigrationCheckpoint(models.Model):
+    _name = 'otters.migration.checkpoint'
+    _description = 'Migratie Checkpoint'
+    _order = 'sequence, id'
+
+    job_id = fields.Many2one('otters.migration.job', string="Job", required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(string="Volgorde")
+    phase = fields.Selection(PHASE_SELECTION, string="Fase", required=True)
+    state = fields.Selection([
+        ('pending', 'Te Doen'),
+        ('running', 'Bezig'),
+        ('done', 'Klaar'),
+        ('skipped', 'Overgeslagen'),
+    ], string="Status", default='pending', required=True)
+    file_hash = fields.Char(string="Bestands-hash")
+    last_row = fields.Integer(string="Verwerkte Rijen", default=0)
+    total_rows = fields.Integer(string="Totaal Rijen", default=0)
+    progress = fields.Float(string="Voortgang (%)", compute='_compute_progress')
+
+    @api.depends('state', 'last_row', 'total_rows')
+    def _compute_progress(self):
+        for checkpoint in self:
+            if checkpoint.state == 'done':
+                checkpoint.progress = 100.0
+            elif checkpoint.total_rows:
+                checkpoint.progress = min(100.0, 100.0 * checkpoint.last_row / checkpoint.total_rows)
+            else:
+                checkpoint.progress = 0.0
+
+
+class MigrationMap(models.Model):
+    """ Oud ID -> Odoo ID per job en soort. Eén regel per sleutel, zodat een chunk enkel zijn nieuwe regels schrijft. """
+    _name = 'otters.migration.map'
+    _description = 'Migratie Mapping'
+    _log_access = False
+
+    job_id = fields.Many2one('otters.migration.job', string="Job", required=True, ondelete='cascade')
+    map_type = fields.Selection([
+        ('partner', 'Klant'),
+        ('submission', 'Verzendzak'),
+        ('brand', 'Merk'),
+    ], string="Soort", required=True)
+    old_id = fields.Char(string="Oud ID", required=True)
+    res_id = fields.Integer(string="Odoo ID")
+    data = fields.Json(string="Data")
+
+    def init(self):
+        # Opzoeken per (job, soort, sleutel) en ON CONFLICT in _store_map
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS otters_migration_map_key_uniq
+            ON otters_migration_map (job_id, map_type, old_id)
+        """)
@@ -5,14 +5,19 @@ from urllib.parse import urlparse, parse_qs
 import base64
 import csv
 import io
+import itertools
 import logging
-import requests
 import time
 import re
 import os
 
+from .image_download_pool import ImageDownloadPool
+
 _logger = logging.getLogger(__name__)
 
+# Sleutel in cr.cache voor de opzoek-caches van de migratie (blijft over chunks heen bestaan)
+MIGRATION_LOOKUP_CACHE = 'otters_consignment.migration_lookup'
+
 
 class MigrationWizard(models.TransientModel):
     _name = 'otters.migration.wizard'
@@ -99,86 +104,119 @@ class MigrationWizard(models.TransientModel):
             pass
 
     def start_migration(self):
-        self._setup_categories_and_types()
-
+        """
+        Start de volledige migratie als achtergrond job (otters.migration.job).
+        De job leest de CSV's in chunks, bewaart per fase een checkpoint en
+        draait via de cron, buiten de web worker. Na een crash of timeout
+        gaat hij verder waar hij gebleven was.
+        """
         # 1. Veiligheidscheck
         if not self.file_customers and not self.file_products:
             raise UserError("Upload minstens de basisbestanden (klanten/producten) om te starten!")
 
-        _logger.info("==========================================")
-        _logger.info("🚀 START TOTALE PRODUCTIE MIGRATIE")
-        _logger.info("==========================================")
-
-        # --- FASE 1: DE IMPORT (Bestaande logica) ---
-
-        # 1. Klanten
-        partner_map = {}
-        if self.file_customers:
-            partner_map = self._process_customers()
-            self.env.cr.commit()  # Tussentijds opslaan
-
-        # 2. Verzendzakken
-        submission_map = {}
-        if self.file_submissions:
-            submission_map = self._process_submissions(partner_map)
-            self.env.cr.commit()
-
-        # 3. Merken
-        brand_map = {}
-        if self.file_brands:
-            brand_map = self._process_brands()
-            self.env.cr.commit()
-
-        # NIEUWE STAP: Aanmaken van de Fictieve Migratie Records
-        _logger.info(">>> Stap 3d: Fictieve Migratie Records aanmaken...")
-        self._create_migration_records()
-        self.env.cr.commit()
-        _logger.info("✅ Stap 3d Klaar: Fictieve klant en zakken aangemaakt.")
-
-        # 4. Producten (Hier zit nu de nieuwe geïntegreerde logica)
-        if self.file_products:
-            _logger.info(">>> Stap 4: Producten en Fictieve Orders verwerken...")
-            count = self._process_products_new_logic(submission_map, brand_map)
-            self.env.cr.commit()
-
-        if self.file_giftcards:
-            self._process_giftcards()
-
-        if self.file_actioncodes:
-            self._process_actioncodes()
-            self.env.cr.commit()
-
-        # --- FASE 2: DE AUTOMATISCHE FIXES (Jouw nieuwe functies) ---
+        job = self.env['otters.migration.job'].create({
+            'image_base_path': self.image_base_path,
+            'old_site_url': self.old_site_url,
+            'file_customers': self.file_customers,
+            'filename_customers': self.filename_customers,
+            'file_submissions': self.file_submissions,
+            'filename_submissions': self.filename_submissions,
+            'file_brands': self.file_brands,
+            'filename_brands': self.filename_brands,
+            'file_products': self.file_products,
+            'filename_products': self.filename_products,
+            'file_giftcards': self.file_giftcards,
+            'filename_giftcards': self.filename_giftcards,
+            'file_actioncodes': self.file_actioncodes,
+            'filename_actioncodes': self.filename_actioncodes,
+        })
+        job.action_queue()
 
         _logger.info("==========================================")
-        _logger.info("🏁 MIGRATIE SUCCESVOL AFGEROND!")
+        _logger.info(f"🚀 MIGRATIE JOB {job.name} IN DE WACHTRIJ GEZET")
         _logger.info("==========================================")
 
         return {
-            'type': 'ir.actions.client',
-            'tag': 'display_notification',
-            'params': {
-                'title': 'Migratie Voltooid',
-                'message': 'Alles is geïmporteerd, bevestigd, opgeruimd en financieel bijgewerkt.',
-                'type': 'success',
-                'sticky': True
-            }
+            'type': 'ir.actions.act_window',
+            'res_model': 'otters.migration.job',
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
         }
 
+    # =================================================================================
+    # OPZOEK CACHES
+    # =================================================================================
+
+    def _get_lookup_cache(self, model_name, key_fields, domain=None, normalize=None):
+        """
+        Eén search_read per (model, sleutel) in plaats van een search(limit=1) per CSV rij.
+        Geeft een dict {sleutel: id} terug; wie een record aanmaakt, zet het er zelf bij.
+        De cache hangt aan de cursor, zodat een migratie job hem over alle chunks hergebruikt.
+        """
+        if isinstance(key_fields, str):
+            key_fields = (key_fields,)
+        caches = self.env.cr.cache.setdefault(MIGRATION_LOOKUP_CACHE, {})
+        cache_key = (model_name, key_fields, repr(domain))
+        if cache_key not in caches:
+            normalize = normalize or (lambda value: value)
+            records = self.env[model_name].search_read(
+                domain if domain is not None else [(key_fields[0], '!=', False)],
+                list(key_fields),
+            )
+            lookup = {}
+            for rec in records:
+                # Many2one komt terug als (id, naam)
+                values = tuple(rec[f][0] if isinstance(rec[f], (list, tuple)) else rec[f] for f in key_fields)
+                if not all(values):
+                    continue
+                key = normalize(values[0]) if len(values) == 1 else normalize(values)
+                lookup.setdefault(key, rec['id'])  # Eerste wint, net als search(limit=1)
+            caches[cache_key] = lookup
+            _logger.info(f"   [CACHE] {model_name} op {', '.join(key_fields)}: {len(lookup)} sleutels geladen.")
+        return caches[cache_key]
+
+    @api.model
+    def _clear_lookup_caches(self):
+        """ Na een rollback kloppen de id's in de cache niet meer. """
+        self.env.cr.cache.pop(MIGRATION_LOOKUP_CACHE, None)
+
+    def _normalize_lookup_text(self, value):
+        """ Voor de =ilike opzoekingen: hoofdletterongevoelig en zonder spaties errond. """
+        if isinstance(value, tuple):
+            return tuple(self._normalize_lookup_text(v) for v in value)
+        return str(value).strip().lower() if isinstance(value, str) else value
+
     def _read_csv(self, binary_data):
         if not binary_data: return []
+        return self._read_csv_stream(io.BytesIO(base64.b64decode(binary_data)))
+
+    def _read_csv_stream(self, stream):
+        """
+        Leest een CSV lijn per lijn uit een binaire stream (bv. een bestand in de filestore),
+        zonder het volledige bestand als tekst in het geheugen te zetten.
+        """
+        first_line = stream.readline()
+        stream.seek(0)
+        delimiter = ';' if b';' in first_line else ','
+        lines = (self._decode_csv_line(line) for line in stream)
+        return csv.DictReader(lines, delimiter=delimiter)
+
+    def _decode_csv_line(self, raw_line):
         try:
-            file_content = base64.b64decode(binary_data).decode('utf-8')
+            return raw_line.decode('utf-8')
         except UnicodeDecodeError:
-            file_content = base64.b64decode(binary_data).decode('latin-1')
-        first_line = file_content.split('\n')[0]
-        delimiter = ';' if ';' in first_line else ','
-        return csv.DictReader(io.StringIO(file_content), delimiter=delimiter)
+            return raw_line.decode('latin-1')
 
-    def _process_customers(self):
-        csv_data = self._read_csv(self.file_customers)
+    def _process_customers(self, rows=None):
+        # rows: optioneel een chunk rijen (migratie job), anders het volledige bestand
+        csv_data = rows if rows is not None else self._read_csv(self.file_customers)
         mapping = {}
         count = 0
+        Partner = self.env['res.partner']
+        partners_by_email = self._get_lookup_cache('res.partner', 'email', normalize=self._normalize_lookup_text)
+        partners_by_old_id = self._get_lookup_cache('res.partner', 'x_old_id')
+        existing_banks = self._get_lookup_cache('res.partner.bank', ('acc_number', 'partner_id'))
         for row in csv_data:
             # Logging heartbeat elke 100 klanten
             count += 1
@@ -189,8 +227,8 @@ class MigrationWizard(models.TransientModel):
             email = row.get('username')
             if not old_id or not email: continue
 
-            domain = ['|', ('email', '=ilike', email.strip()), ('x_old_id', '=', str(old_id))]
-            partner = self.env['res.partner'].search(domain, limit=1)
+            partner_id = partners_by_email.get(self._normalize_lookup_text(email)) or partners_by_old_id.get(str(old_id))
+            partner = Partner.browse(partner_id) if partner_id else Partner
 
             straat = f"{row.get('straat', '')} {row.get('huisnr', '')}".strip()
             bus = row.get('bus')
@@ -208,9 +246,13 @@ class MigrationWizard(models.TransientModel):
                     'zip': row.get('postcode', ''), 'city': row.get('gemeente', ''),
                     'x_old_id': str(old_id)
                 })
+                partners_by_email.setdefault(self._normalize_lookup_text(email), partner.id)
+                partners_by_old_id.setdefault(str(old_id), partner.id)
             else:
                 vals = {}
-                if not partner.x_old_id: vals['x_old_id'] = str(old_id)
+                if not partner.x_old_id:
+                    vals['x_old_id'] = str(old_id)
+                    partners_by_old_id.setdefault(str(old_id), partner.id)
                 if partner.x_consignment_prefix and partner.x_consignment_prefix.startswith('IMP'):
                     vals['x_consignment_prefix'] = False
                 if vals: partner.write(vals)
@@ -221,24 +263,21 @@ class MigrationWizard(models.TransientModel):
 
             if iban and str(iban) != 'nan' and str(iban).strip() != '':
                 clean_iban = str(iban).replace(' ', '').strip()
-                existing_bank = self.env['res.partner.bank'].search([
-                    ('acc_number', '=', clean_iban),
-                    ('partner_id', '=', partner.id)
-                ], limit=1)
-                if not existing_bank:
+                if (clean_iban, partner.id) not in existing_banks:
                     try:
-                        self.env['res.partner.bank'].create({
+                        bank = self.env['res.partner.bank'].create({
                             'acc_number': clean_iban,
                             'partner_id': partner.id
                         })
+                        existing_banks[(clean_iban, partner.id)] = bank.id
                     except Exception as e:
                         pass
 
             mapping[old_id] = partner
         return mapping
 
-    def _process_submissions(self, customer_map):
-        csv_data = self._read_csv(self.file_submissions)
+    def _process_submissions(self, customer_map, rows=None):
+        csv_data = rows if rows is not None else self._read_csv(self.file_submissions)
         mapping = {}
 
         def parse_legacy_date(d_str):
@@ -253,6 +292,9 @@ class MigrationWizard(models.TransientModel):
             except ValueError:
                 return False
 
+        Submission = self.env['otters.consignment.submission']
+        submissions_by_old_id = self._get_lookup_cache('otters.consignment.submission', 'x_old_id')
+
         for row in csv_data:
             # ... (bestaande checks voor id en customer) ...
             old_bag_id = self._clean_id(row.get('zak_id'))
@@ -262,7 +304,8 @@ class MigrationWizard(models.TransientModel):
             partner = customer_map.get(old_customer_id)
             if not partner: continue
 
-            submission = self.env['otters.consignment.submission'].search([('x_old_id', '=', str(old_bag_id))], limit=1)
+            submission_id = submissions_by_old_id.get(str(old_bag_id))
+            submission = Submission.browse(submission_id) if submission_id else Submission
 
             schenking_raw = str(row.get('schenking', '')).lower()
             if 'goed doel' in schenking_raw:
@@ -335,6 +378,7 @@ class MigrationWizard(models.TransientModel):
                     'agreed_to_shipping_fee': True,
                     'x_iban': partner_iban,
                 })
+                submissions_by_old_id[str(old_bag_id)] = submission.id
 
                 notities = row.get('notities')
                 if notities and str(notities) != 'nan' and str(notities).strip() != '':
@@ -352,9 +396,9 @@ class MigrationWizard(models.TransientModel):
             mapping[old_bag_id] = submission
         return mapping
 
-    def _process_brands(self):
-        if not self.file_brands: return {}
-        csv_data = self._read_csv(self.file_brands)
+    def _process_brands(self, rows=None):
+        if rows is None and not self.file_brands: return {}
+        csv_data = rows if rows is not None else self._read_csv(self.file_brands)
         brand_map = {}
         count = 0
         skipped_images = 0
@@ -370,10 +414,16 @@ class MigrationWizard(models.TransientModel):
             })
         # ---------------------------------------------------------------------
 
+        Brand = self.env['otters.brand']
+        brands_by_name = self._get_lookup_cache('otters.brand', 'name')
+        brand_values_by_name = self._get_lookup_cache(
+            'product.attribute.value', 'name', domain=[('attribute_id', '=', brand_attribute.id)])
+
         _logger.info("--- START MERKEN IMPORT ---")
 
         for row in csv_data:
-            if count > 0 and count % 50 == 0:
+            # Vanuit een migratie job (rows meegegeven) commit de job zelf, samen met het checkpoint
+            if rows is None and count > 0 and count % 50 == 0:
                 self.env.cr.commit()
 
             old_merk_id = self._clean_id(row.get('merk_id'))
@@ -381,7 +431,7 @@ class MigrationWizard(models.TransientModel):
             if not old_merk_id or not name: continue
 
             # 1. ZOEK HET MERK (Otters Brand Model)
-            brand = self.env['otters.brand'].search([('name', '=', name)], limit=1)
+            brand = Brand.browse(brands_by_name[name]) if name in brands_by_name else Brand
 
             brand_vals = {
                 'name': name,
@@ -411,26 +461,24 @@ class MigrationWizard(models.TransientModel):
 
             # 3. MAAK AAN OF UPDATE
             if not brand:
-                brand = self.env['otters.brand'].create(brand_vals)
+                brand = Brand.create(brand_vals)
+                brands_by_name[name] = brand.id
             else:
                 brand.write(brand_vals)
 
             # 4. ZOEK DE ATTRIBUUT WAARDE (Gebruik de brand_attribute van boven de lus)
-            brand_val = self.env['product.attribute.value'].search([
-                ('attribute_id', '=', brand_attribute.id),
-                ('name', '=', name)
-            ], limit=1)
-
-            if not brand_val:
-                brand_val = self.env['product.attribute.value'].create({
+            brand_val_id = brand_values_by_name.get(name)
+            if not brand_val_id:
+                brand_val_id = self.env['product.attribute.value'].create({
                     'attribute_id': brand_attribute.id,
                     'name': name
-                })
+                }).id
+                brand_values_by_name[name] = brand_val_id
 
             # Opslaan in map voor gebruik bij producten
             brand_map[old_merk_id] = {
                 'brand_id': brand.id,
-                'attr_val_id': brand_val.id,
+                'attr_val_id': brand_val_id,
                 'attr_id': brand_attribute.id
             }
             count += 1
@@ -439,27 +487,28 @@ class MigrationWizard(models.TransientModel):
             f"--- MERKEN KLAAR: {count} verwerkt. {skipped_images} keer foto-download overgeslagen (bestond al). ---")
         return brand_map
 
-    def _process_products_new_logic(self, submission_map, brand_map):
+    def _process_products_new_logic(self, submission_map, brand_map, rows=None):
         # 1. SETUP: Zorg dat categorieën en types klaar staan
-        self._setup_categories_and_types()
+        # (Een migratie job doet dit één keer in zijn eigen fase, niet per chunk)
+        if rows is None:
+            self._setup_categories_and_types()
 
-        if not self.file_products: return
-        csv_data = self._read_csv(self.file_products)
+        if rows is None and not self.file_products: return
+        csv_data = rows if rows is not None else self._read_csv(self.file_products)
         count = 0
 
         # --- CACHE OPBOUWEN ---
         _logger.info("--- CACHE OPBOUWEN... ---")
-        existing_recs = self.env['product.template'].search_read(
-            ['|', ('x_old_id', '!=', False), ('default_code', '!=', False)],
-            ['id', 'x_old_id', 'default_code']
-        )
-        existing_by_old_id = {str(r['x_old_id']): r['id'] for r in existing_recs if r['x_old_id']}
-        existing_by_code = {r['default_code']: r['id'] for r in existing_recs if r['default_code']}
+        existing_by_old_id = self._get_lookup_cache('product.template', 'x_old_id', normalize=str)
+        existing_by_code = self._get_lookup_cache('product.template', 'default_code')
 
         # Merk Cache (nodig omdat we merk mapping gebruiken)
         # We gaan ervan uit dat _process_brands() al gedraaid heeft en de merken bestaan
 
-        _logger.info(f"--- CACHE KLAAR: {len(existing_recs)} producten. ---")
+        public_categs_by_name = self._get_lookup_cache('product.public.category', 'name')
+        internal_categs_by_name = self._get_lookup_cache('product.category', 'name')
+
+        _logger.info(f"--- CACHE KLAAR: {len(existing_by_old_id)} producten. ---")
 
         # Mappings
         condition_mapping = {
@@ -473,10 +522,20 @@ class MigrationWizard(models.TransientModel):
 
         _logger.info("--- START PRODUCTEN/ORDER MIGRATIE ---")
 
-        for row in csv_data:
+        def image_sources(row):
+            # Enkel nieuwe producten krijgen foto's (zie E. hieronder)
+            old_id = self._clean_id(row.get('product_id'))
+            if (old_id and str(old_id) in existing_by_old_id) or row.get('code') in existing_by_code:
+                return []
+            urls = [row.get('foto')] + self._split_extra_photos(row.get('extra_fotos'))
+            return [(url, old_id) for url in urls if url]
+
+        for row, pool in self._iter_rows_with_image_prefetch(csv_data, image_sources):
             count += 1
             if count % 100 == 0:
-                self.env.cr.commit()
+                # Vanuit een migratie job (rows meegegeven) commit de job zelf, samen met het checkpoint
+                if rows is None:
+                    self.env.cr.commit()
                 _logger.info(f"   [PRODUCTEN] {count} verwerkt... (Huidige: {row.get('naam')})")
 
             # --- A. DATA EN STATUS PARSEN ---
@@ -569,16 +628,16 @@ class MigrationWizard(models.TransientModel):
 
                 # We zoeken de categorie ID (de onderste laag)
                 leaf_name = new_cat_full_name.split('/')[-1].strip()
-                category = self.env['product.public.category'].search([('name', '=', leaf_name)], limit=1)
+                category_id = public_categs_by_name.get(leaf_name)
 
-                if category:
-                    final_categ_ids = [category.id]
+                if category_id:
+                    final_categ_ids = [category_id]
                     # Let op: De interne categorie (backend) updaten we best ook
                     # We zoeken een interne categorie met dezelfde naam
-                    int_cat = self.env['product.category'].search([('name', '=', leaf_name)], limit=1)
-                    if not int_cat:
-                        int_cat = self.env['product.category'].create({'name': leaf_name})
-                    final_int_id = int_cat.id
+                    final_int_id = internal_categs_by_name.get(leaf_name)
+                    if not final_int_id:
+                        final_int_id = self.env['product.category'].create({'name': leaf_name}).id
+                        internal_categs_by_name[leaf_name] = final_int_id
                 else:
                     # Fallback als categorie niet gevonden is (zou niet mogen door setup)
                     final_int_id = self.env.ref('product.product_category_all').id
@@ -630,7 +689,7 @@ class MigrationWizard(models.TransientModel):
             else:
                 # Nieuw product maken
                 image_url = row.get('foto')
-                product_vals['image_1920'] = self._download_image(image_url, fix_old_id=old_product_id)
+                product_vals['image_1920'] = self._download_image(image_url, fix_old_id=old_product_id, pool=pool)
                 try:
                     product_vals['list_price'] = float(str(row.get('prijs') or '0').replace(',', '.'))
                 except:
@@ -659,15 +718,11 @@ class MigrationWizard(models.TransientModel):
                 if brand_data: self._add_attribute_by_id(product, brand_data['attr_id'], brand_data['attr_val_id'])
 
                 # Extra foto's
-                extra_fotos = row.get('extra_fotos')
-                if extra_fotos and str(extra_fotos) != 'nan':
-                    clean_string = extra_fotos.replace('\n', ',').replace('\r', '')
-                    for idx, url in enumerate(clean_string.split(',')):
-                        if url:
-                            extra_img = self._download_image(url.strip(), fix_old_id=old_product_id)
-                            if extra_img: self.env['product.image'].create(
-                                {'product_tmpl_id': product.id, 'name': f"{name} - Extra {idx + 1}",
-                                 'image_1920': extra_img})
+                for idx, url in enumerate(self._split_extra_photos(row.get('extra_fotos'))):
+                    extra_img = self._download_image(url, fix_old_id=old_product_id, pool=pool)
+                    if extra_img: self.env['product.image'].create(
+                        {'product_tmpl_id': product.id, 'name': f"{name} - Extra {idx + 1}",
+                         'image_1920': extra_img})
 
             # --- F. STATUS & ORDER REGELS (DE 12 SCENARIO'S) ---
 
@@ -818,8 +873,91 @@ class MigrationWizard(models.TransientModel):
             if current_cat.x_linked_type_value_id != type_val:
                 current_cat.write({'x_linked_type_value_id': type_val.id})
 
-    def _download_image(self, url, fix_old_id=None):
-        if not url or str(url) == 'nan': return False
+    def _download_image(self, url, fix_old_id=None, pool=None):
+        """
+        Geeft de foto als base64 terug: eerst uit de lokale cache, anders via HTTP.
+        Met een ImageDownloadPool wordt een eerder ingeplande (parallelle) download hergebruikt.
+        """
+        # Plan uit de prefetch hergebruiken (niet opnieuw het bestand lezen of dezelfde waarschuwingen loggen)
+        plan = pool.plans.pop((url, fix_old_id), None) if pool is not None else None
+        local_data, urls_to_try, local_save_path = plan or self._plan_image_download(url, fix_old_id)
+        if pool is not None and pool.is_scheduled(urls_to_try):
+            # Ingepland in _iter_rows_with_image_prefetch (de worker kan intussen de lokale cache gevuld hebben)
+            content = pool.get(urls_to_try, local_save_path)
+        elif local_data:
+            if pool is not None and pool.postprocess:
+                processed = pool.postprocess(base64.b64decode(local_data))
+                return base64.b64encode(processed) if processed else False
+            return local_data
+        elif not urls_to_try:
+            return False
+        elif pool is not None:
+            content = pool.get(urls_to_try, local_save_path)
+        else:
+            with self._image_download_pool(max_workers=1) as single_pool:
+                content = single_pool.get(urls_to_try, local_save_path)
+        return base64.b64encode(content) if content else False
+
+    def _image_download_pool(self, max_workers=None, processor=None):
+        """
+        Instelbaar via systeemparameters (threads en requests/seconde per host).
+        Met een ImageProcessor worden de foto's meteen verkleind, nog in de download thread.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if max_workers is None:
+            max_workers = int(ICP.get_param('otters_consignment.image_download_workers', '8'))
+        per_host_rate = float(ICP.get_param('otters_consignment.image_download_rate', '10'))
+        return ImageDownloadPool(
+            max_workers=max_workers, per_host_rate=per_host_rate,
+            postprocess=processor.process if processor else None,
+        )
+
+    def _iter_rows_with_image_prefetch(self, rows, get_image_sources, batch_size=50):
+        """
+        Geeft (rij, pool) terug en plant telkens de foto's van de VOLGENDE batch al in,
+        zodat de downloads lopen terwijl de hoofdcursor de huidige batch wegschrijft.
+        get_image_sources(row) geeft een lijst (url, fix_old_id) terug.
+        De pool wordt gesloten als de lus stopt (ook bij een fout).
+        """
+        processor = self.env['product.template']._get_image_processor()
+        pool = self._image_download_pool(processor=processor)
+
+        def schedule(batch):
+            for row in batch:
+                for url, fix_old_id in get_image_sources(row):
+                    plan = self._plan_image_download(url, fix_old_id)
+                    pool.plans[(url, fix_old_id)] = plan
+                    local_data, urls_to_try, local_save_path = plan
+                    if not local_data and urls_to_try:
+                        pool.prefetch(urls_to_try, local_save_path)
+
+        try:
+            iterator = iter(rows)
+            batch = list(itertools.islice(iterator, batch_size))
+            schedule(batch)
+            while batch:
+                next_batch = list(itertools.islice(iterator, batch_size))
+                schedule(next_batch)
+                for row in batch:
+                    yield row, pool
+                batch = next_batch
+        finally:
+            pool.close()
+            processor.close()
+
+    def _split_extra_photos(self, extra_fotos):
+        """ 'extra_fotos' staat in de CSV gescheiden door enters en/of komma's. """
+        if not extra_fotos or str(extra_fotos) == 'nan':
+            return []
+        clean_string = extra_fotos.replace('\n', ',').replace('\r', '')
+        return [u.strip() for u in clean_string.split(',') if u.strip()]
+
+    def _plan_image_download(self, url, fix_old_id=None):
+        """
+        Bepaalt waar een foto vandaan moet komen, zonder te downloaden.
+        Geeft (base64 uit lokale cache of False, te proberen urls, lokaal opslagpad) terug.
+        """
+        if not url or str(url) == 'nan': return False, [], False
 
         local_save_path = False
         filename = False
@@ -848,6 +986,13 @@ class MigrationWizard(models.TransientModel):
             _logger.warning(f"Kon bestandsnaam niet bepalen uit {url}: {e}")
             filename = "unknown.jpg"
 
+        # Waar we online moeten zoeken als hij lokaal niet bestaat
+        clean_path = url.lstrip('.').strip().replace('//', '/')
+        if fix_old_id and '/product//' in url:
+            clean_path = clean_path.replace('/product//', f'/product/{fix_old_id}/')
+
+        urls_to_try = [url] if url.startswith('http') else [f"{self.old_site_url}/{clean_path.lstrip('/')}"]
+
         # --- STAP 2: BOUW HET LOKALE PAD ---
         if self.image_base_path and fix_old_id and filename:
             try:
@@ -859,7 +1004,7 @@ class MigrationWizard(models.TransientModel):
                 if os.path.exists(local_save_path):
                     _logger.info(f"✅ GEVONDEN (CACHE): {local_save_path}")
                     with open(local_save_path, 'rb') as f:
-                        return base64.b64encode(f.read())
+                        return base64.b64encode(f.read()), urls_to_try, local_save_path
 
                 # Case-insensitive fallback check
                 if os.path.exists(folder_path):
@@ -867,7 +1012,7 @@ class MigrationWizard(models.TransientModel):
                         if f.lower() == filename.lower():
                             full_path = os.path.join(folder_path, f)
                             with open(full_path, 'rb') as f_obj:
-                                return base64.b64encode(f_obj.read())
+                                return base64.b64encode(f_obj.read()), urls_to_try, local_save_path
                     _logger.warning(
                         f"❌ NIET GEVONDEN IN MAP: {folder_path}. Gezocht naar: {filename}. Aanwezig: {os.listdir(folder_path)}")
                 else:
@@ -877,40 +1022,7 @@ class MigrationWizard(models.TransientModel):
                 _logger.error(f"Fout bij padbepaling lokaal bestand: {e}")
 
         # --- OPTIE B: DOWNLOADEN (CACHE MISS) ---
-        # _logger.info(f"🌐 Downloaden: {url}")
-
-        clean_path = url.lstrip('.').strip().replace('//', '/')
-        if fix_old_id and '/product//' in url:
-            clean_path = clean_path.replace('/product//', f'/product/{fix_old_id}/')
-
-        urls_to_try = [url] if url.startswith('http') else [f"{self.old_site_url}/{clean_path.lstrip('/')}"]
-        headers = {'User-Agent': 'Mozilla/5.0'}
-
-        for try_url in urls_to_try:
-            try:
-                r = requests.get(try_url, headers=headers, timeout=10)
-                if r.status_code == 200 and 'image' in r.headers.get('Content-Type', ''):
-                    content = r.content
-
-                    # --- STAP 3: OPSLAAN VOOR DE VOLGENDE KEER (CACHE FILL) ---
-                    if local_save_path:
-                        try:
-                            # Zorg dat de map bestaat
-                            os.makedirs(os.path.dirname(local_save_path), exist_ok=True)
-
-                            # Schrijf het bestand weg MET DE JUISTE NAAM
-                            with open(local_save_path, 'wb') as f_save:
-                                f_save.write(content)
-
-                            _logger.info(f"💾 CACHE OPGESLAGEN: {local_save_path}")
-                        except Exception as save_err:
-                            _logger.warning(f"Kon bestand niet lokaal cachen: {save_err}")
-
-                    return base64.b64encode(content)
-            except Exception as e:
-                pass
-
-        return False
+        return False, urls_to_try, local_save_path
 
     def _add_attribute(self, product, att_name, val_name):
         if not val_name or str(val_name) == 'nan': return
@@ -918,27 +1030,29 @@ class MigrationWizard(models.TransientModel):
         clean_val_string = str(val_name).replace('/', '|').replace('&', '|').replace(' en ', '|')
         vals = clean_val_string.split('|')
 
+        normalize = self._normalize_lookup_text
+        attributes_by_name = self._get_lookup_cache('product.attribute', 'name', normalize=normalize)
+        values_by_name = self._get_lookup_cache('product.attribute.value', ('attribute_id', 'name'), normalize=normalize)
+
         for v in vals:
             v = v.strip()
             if not v: continue
 
-            attribute = self.env['product.attribute'].search([('name', '=ilike', att_name)], limit=1)
+            attribute = self.env['product.attribute'].browse(attributes_by_name.get(normalize(att_name)))
             if not attribute:
                 attribute = self.env['product.attribute'].create({
                     'name': att_name,
                     'create_variant': 'no_variant'
                 })
+                attributes_by_name[normalize(att_name)] = attribute.id
 
-            value = self.env['product.attribute.value'].search([
-                ('attribute_id', '=', attribute.id),
-                ('name', '=ilike', v)
-            ], limit=1)
-
+            value = self.env['product.attribute.value'].browse(values_by_name.get((attribute.id, normalize(v))))
             if not value:
                 value = self.env['product.attribute.value'].create({
                     'name': v,
                     'attribute_id': attribute.id
                 })
+                values_by_name[(attribute.id, normalize(v))] = value.id
 
             try:
                 self.env['product.template.attribute.line'].create({
@@ -957,11 +1071,11 @@ class MigrationWizard(models.TransientModel):
         if not exists: self.env['product.template.attribute.line'].create(
             {'product_tmpl_id': product.id, 'attribute_id': attribute_id, 'value_ids': [(6, 0, [value_id])]})
 
-    def _process_giftcards(self):
-        if not self.file_giftcards:
+    def _process_giftcards(self, rows=None):
+        if rows is None and not self.file_giftcards:
             return
 
-        csv_data = self._read_csv(self.file_giftcards)
+        csv_data = rows if rows is not None else self._read_csv(self.file_giftcards)
 
         # 1. Programma zoeken/maken
         program = self.env['loyalty.program'].search([('program_type', '=', 'gift_card')], limit=1)
@@ -1012,6 +1126,8 @@ class MigrationWizard(models.TransientModel):
 
         today = fields.Date.context_today(self)
 
+        existing_codes = self._get_lookup_cache('loyalty.card', 'code')
+
         _logger.info("--- START IMPORT CADEAUBONNEN ---")
 
         for row in csv_data:
@@ -1023,8 +1139,7 @@ class MigrationWizard(models.TransientModel):
                 continue
 
             # LOG: Bestaat al
-            existing = self.env['loyalty.card'].search([('code', '=', code)], limit=1)
-            if existing:
+            if code in existing_codes:
                 _logger.info(f"SKIP: Bon {code} bestaat al in Odoo.")
                 skipped_exist += 1
                 continue
@@ -1065,12 +1180,13 @@ class MigrationWizard(models.TransientModel):
                         f"LET OP: Datum '{raw_date}' onleesbaar voor bon {code}. Wordt geïmporteerd zonder vervaldatum.")
 
             # Maak de bon aan
-            self.env['loyalty.card'].create({
+            card = self.env['loyalty.card'].create({
                 'program_id': program.id,
                 'code': code,
                 'points': rest,
                 'expiration_date': expiration_date,
             })
+            existing_codes[code] = card.id
             count += 1
 
             if count % 50 == 0:
@@ -1084,11 +1200,11 @@ class MigrationWizard(models.TransientModel):
         _logger.info(f"❌ Vervallen datum: {skipped_expired}")
         _logger.info("==========================================")
 
-    def _process_actioncodes(self):
-        if not self.file_actioncodes:
+    def _process_actioncodes(self, rows=None):
+        if rows is None and not self.file_actioncodes:
             return
 
-        csv_data = self._read_csv(self.file_actioncodes)
+        csv_data = rows if rows is not None else self._read_csv(self.file_actioncodes)
 
         # Cache voor de percentage-programma's om database calls te sparen
         # Key = percentage (bv. 10.0), Value = program_id
@@ -1130,6 +1246,7 @@ class MigrationWizard(models.TransientModel):
         skipped_expired = 0
 
         today = fields.Date.context_today(self)
+        existing_codes = self._get_lookup_cache('loyalty.card', 'code')
         _logger.info("--- START IMPORT ACTIECODES (SPLIT) ---")
 
         for row in csv_data:
@@ -1137,8 +1254,7 @@ class MigrationWizard(models.TransientModel):
             if not code: continue
 
             # Check duplicaten (in alle programma's)
-            existing = self.env['loyalty.card'].search([('code', '=', code)], limit=1)
-            if existing: continue
+            if code in existing_codes: continue
 
             # Datum check
             expiration_date = False
@@ -1165,12 +1281,13 @@ class MigrationWizard(models.TransientModel):
 
             # === SCENARIO A: VAST BEDRAG ===
             if 'vast' in soort:
-                self.env['loyalty.card'].create({
+                card = self.env['loyalty.card'].create({
                     'program_id': fixed_program.id,
                     'code': code,
                     'points': value,  # 25 euro = 25 punten
                     'expiration_date': expiration_date,
                 })
+                existing_codes[code] = card.id
                 count_fixed += 1
 
             # === SCENARIO B: PERCENTAGE ===
@@ -1205,12 +1322,13 @@ class MigrationWizard(models.TransientModel):
                     percentage_programs_cache[value] = perc_prog.id
 
                 # Maak de coupon aan in het juiste programma
-                self.env['loyalty.card'].create({
+                card = self.env['loyalty.card'].create({
                     'program_id': percentage_programs_cache[value],
                     'code': code,
                     'points': 0,  # Coupons hebben geen punten nodig, gewoon bestaan is genoeg
                     'expiration_date': expiration_date,
                 })
+                existing_codes[code] = card.id
                 count_percent += 1
 
         _logger.info("==========================================")
@@ -1373,7 +1491,8 @@ class MigrationWizard(models.TransientModel):
             return
         # ------------------------
 
-        new_product = original_product.copy({
+        # otters_share_images: de kopie deelt de foto-attachments van het origineel
+        new_product = original_product.with_context(otters_share_images=True).copy({
             'name': original_product.name,
             'submission_id': mig_submission.id,
             'x_old_id': False,
@@ -1537,10 +1656,20 @@ class MigrationWizard(models.TransientModel):
         )
         product_map = {str(p['x_old_id']): p['id'] for p in existing_products}
 
+        # Checksums van de bestaande extra foto's: identieke foto's niet opnieuw wegschrijven
+        existing_checksums = self.env['product.template']._get_extra_image_checksums(product_map.values())
+
         count = 0
         images_added = 0
+        images_skipped = 0
 
-        for row in csv_data:
+        def image_sources(row):
+            old_id = self._clean_id(row.get('product_id'))
+            if not old_id or old_id not in product_map:
+                return []
+            return [(url, old_id) for url in self._split_extra_photos(row.get('extra_fotos'))[:-1]]
+
+        for row, pool in self._iter_rows_with_image_prefetch(csv_data, image_sources):
             count += 1
 
             # Tussentijdse opslag om geheugen te sparen
@@ -1557,13 +1686,8 @@ class MigrationWizard(models.TransientModel):
             product_id = product_map[old_product_id]
 
             # 2. Extra foto's ophalen
-            extra_fotos_raw = row.get('extra_fotos')
-            if not extra_fotos_raw or str(extra_fotos_raw) == 'nan':
-                continue
-
             # A. SPLITTEN (Correct op enters/komma's)
-            clean_string = extra_fotos_raw.replace('\n', ',').replace('\r', '')
-            url_list = [u.strip() for u in clean_string.split(',') if u.strip()]
+            url_list = self._split_extra_photos(row.get('extra_fotos'))
 
             if not url_list:
                 continue
@@ -1582,9 +1706,16 @@ class MigrationWizard(models.TransientModel):
 
             for url in url_list:
                 # Downloaden (gebruikt je bestaande _download_image logica)
-                image_data = self._download_image(url, fix_old_id=old_product_id)
+                image_data = self._download_image(url, fix_old_id=old_product_id, pool=pool)
 
                 if image_data:
+                    checksum = self.env['product.template']._image_checksum(base64.b64decode(image_data))
+                    product_checksums = existing_checksums.setdefault(product_id, set())
+                    if checksum in product_checksums:
+                        images_skipped += 1
+                        continue
+                    product_checksums.add(checksum)
+
                     current_image_count += 1
                     try:
                         # We voegen ze toe als 'Extra X'
@@ -1604,6 +1735,7 @@ class MigrationWizard(models.TransientModel):
         _logger.info("==========================================")
         _logger.info(f"🏁 FOTO FIX KLAAR!")
         _logger.info(f"Totaal {images_added} extra afbeeldingen toegevoegd (laatste overgeslagen).")
+        _logger.info(f"{images_skipped} afbeeldingen waren al identiek aanwezig.")
         _logger.info("==========================================")
 
         return {
@@ -1611,7 +1743,7 @@ class MigrationWizard(models.TransientModel):
             'tag': 'display_notification',
             'params': {
                 'title': 'Foto Herstel Voltooid',
-                'message': f'{images_added} foto\'s zijn toegevoegd.',
+                'message': f'{images_added} foto\'s zijn toegevoegd, {images_skipped} waren al aanwezig.',
                 'type': 'success',
                 'sticky': True
             }
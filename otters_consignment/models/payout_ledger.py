@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Sleutel in cr.precommit.data waaronder we de te verversen product varianten verzamelen
+PAYOUT_LEDGER_QUEUE = 'otters_consignment.payout_ledger_product_ids'
+
+class ConsignmentPayoutLedger(models.Model):
+    """
+    Vooraf geaggregeerde verkoopdata per inzending.
+    Eén regel per (Inzending, Product, Datum, Betaald) - precies de groepering
+    die het portaal (/my/consignments/<id>) toont. Wordt incrementeel bijgewerkt
+    wanneer orders bevestigd worden of uitbetalingen gemarkeerd worden.
+    """
+    _name = 'otters.consignment.payout.ledger'
+    _description = 'Uitbetalingsgrootboek Consignatie'
+    _order = 'date desc, id desc'
+
+    submission_id = fields.Many2one('otters.consignment.submission', string="Inzending", required=True, index=True, ondelete='cascade')
+    product_id = fields.Many2one('product.product', string="Product", required=True, index=True, ondelete='cascade')
+    name = fields.Char(string="Productnaam")
+    date = fields.Date(string="Datum")
+    is_paid = fields.Boolean(string="Uitbetaald", index=True)
+    qty = fields.Float(string="Aantal")
+    price_sold = fields.Monetary(string="Verkoopprijs", currency_field='currency_id')
+    payout = fields.Monetary(string="Uitbetaling", currency_field='currency_id')
+    percentage = fields.Float(string="Percentage", digits=(16, 2))
+    currency_id = fields.Many2one('res.currency', string="Munt")
+
+    # =================================================================================
+    # WACHTRIJ (Precommit)
+    # =================================================================================
+
+    @api.model
+    def _schedule_refresh(self, product_ids):
+        """ Onthoudt welke varianten gewijzigd zijn. Verversen gebeurt één keer vlak voor de commit. """
+        product_ids = [pid for pid in product_ids if pid]
+        if not product_ids:
+            return
+        data = self.env.cr.precommit.data
+        if PAYOUT_LEDGER_QUEUE not in data:
+            data[PAYOUT_LEDGER_QUEUE] = set()
+            self.env.cr.precommit.add(self._flush_refresh_queue)
+        data[PAYOUT_LEDGER_QUEUE].update(product_ids)
+
+    @api.model
+    def _flush_refresh_queue(self):
+        product_ids = self.env.cr.precommit.data.pop(PAYOUT_LEDGER_QUEUE, set())
+        if not product_ids:
+            return
+        self.sudo()._refresh_products(list(product_ids))
+        self.env.flush_all()
+
+    # =================================================================================
+    # OPBOUW
+    # =================================================================================
+
+    @api.model
+    def _refresh_products(self, product_ids):
+        """ Herbouwt de grootboekregels voor de gegeven product varianten (delete + bulk create). """
+        self.search([('product_id', 'in', product_ids)]).unlink()
+        self._create_from_query("AND sol.product_id = ANY(%(product_ids)s)", {'product_ids': product_ids})
+
+    @api.model
+    def _rebuild_all(self):
+        """ Volledige herbouw (installatie / upgrade of handmatige reparatie). """
+        self.sudo().search([]).unlink()
+        count = self.sudo()._create_from_query()
+        _logger.info(f"Uitbetalingsgrootboek herbouwd: {count} regels.")
+
+    @api.model
+    def _create_from_query(self, extra_where='', params=None):
+        """
+        Eén gegroepeerde query over sale_order_line. Dezelfde regels als
+        sale.order.line._compute_commission:
+        - Betaald: vastgelegde commissie / percentage (fallback op live percentage)
+        - Onbetaald: live berekening op basis van de inzending
+        """
+        self.env['sale.order.line'].flush_model([
+            'order_id', 'product_id', 'product_uom_qty', 'price_unit', 'price_total', 'currency_id',
+            'x_is_paid_out', 'x_payout_date', 'x_fixed_commission', 'x_fixed_percentage',
+        ])
+        self.env['sale.order'].flush_model(['state', 'date_order'])
+        self.env['product.template'].flush_model(['submission_id'])
+        self.env['otters.consignment.submission'].flush_model(['payout_percentage'])
+
+        query = """
+            SELECT pt.submission_id,
+                   sol.product_id,
+                   COALESCE(sol.x_payout_date, so.date_order::date) AS date,
+                   COALESCE(sol.x_is_paid_out, FALSE) AS is_paid,
+                   SUM(sol.product_uom_qty) AS qty,
+                   SUM(sol.price_unit * sol.product_uom_qty) AS price_sold,
+                   SUM(CASE WHEN sol.x_is_paid_out
+                            THEN COALESCE(sol.x_fixed_commission, 0)
+                            -- Onbetaald maar al een vast bedrag (bv. gemigreerd)? Dan dat, zoals het verkooprapport
+                            ELSE COALESCE(NULLIF(sol.x_fixed_commission, 0),
+                                          sol.price_total * COALESCE(sub.payout_percentage, 0)) END) AS payout,
+                   MAX(CASE WHEN sol.x_is_paid_out
+                            THEN COALESCE(NULLIF(sol.x_fixed_percentage, 0), sub.payout_percentage, 0)
+                            ELSE COALESCE(sub.payout_percentage, 0) END) AS percentage,
+                   MAX(sol.currency_id) AS currency_id
+            FROM sale_order_line sol
+            JOIN sale_order so ON so.id = sol.order_id
+            JOIN product_product pp ON pp.id = sol.product_id
+            JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            JOIN otters_consignment_submission sub ON sub.id = pt.submission_id
+            WHERE so.state IN ('sale', 'done')
+              {extra_where}
+            GROUP BY pt.submission_id, sol.product_id,
+                     COALESCE(sol.x_payout_date, so.date_order::date),
+                     COALESCE(sol.x_is_paid_out, FALSE)
+        """.format(extra_where=extra_where)
+        self.env.cr.execute(query, params or {})
+        rows = self.env.cr.dictfetchall()
+        if not rows:
+            return 0
+
+        # Productnamen in één keer ophalen (snapshot in het grootboek)
+        products = self.env['product.product'].with_context(active_test=False).browse(list({r['product_id'] for r in rows}))
+        names = {p.id: p.name for p in products}
+        for row in rows:
+            row['name'] = names.get(row['product_id'])
+
+        self.create(rows)
+        return len(rows)
@@ -6,4 +6,26 @@ class ProductTemplateAttributeLine(models.Model):
     @api.onchange('attribute_id')
     def _onchange_attribute_id_marleen_fix(self):
         if self.attribute_id:
-            self.value_ids = False
\ No newline at end of file
+            self.value_ids = False
+
+    # --- Shop filtertellers (otters.facet.count) bijhouden ---
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['otters.facet.count']._schedule_refresh(template_ids=lines.product_tmpl_id.ids)
+        return lines
+
+    def write(self, vals):
+        if not {'value_ids', 'product_tmpl_id', 'active'} & set(vals):
+            return super().write(vals)
+        old_template_ids = self.product_tmpl_id.ids
+        res = super().write(vals)
+        self.env['otters.facet.count']._schedule_refresh(template_ids=old_template_ids + self.product_tmpl_id.ids)
+        return res
+
+    def unlink(self):
+        template_ids = self.product_tmpl_id.ids
+        res = super().unlink()
+        self.env['otters.facet.count']._schedule_refresh(template_ids=template_ids)
+        return res
@@ -1,5 +1,14 @@
 # In models/product_template.py
 from odoo import models, fields, api
+import hashlib
+
+from .image_processing import ImageProcessor
+
+# Velden die bepalen of (en waar) een product meetelt in de shop filters
+FACET_FIELDS = {'x_shop_available', 'is_published', 'active', 'public_categ_ids', 'x_unsold_reason'}
+
+# image_1920 + de formaten die Odoo ervan afleidt (allemaal attachments)
+PRODUCT_IMAGE_FIELDS = ['image_1920', 'image_1024', 'image_512', 'image_256', 'image_128']
 
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
@@ -79,16 +88,18 @@ class ProductTemplate(models.Model):
         readonly=True
     )
 
+    # Opgeslagen zodat we erop kunnen zoeken/filteren. Herberekening wordt
+    # aangestuurd vanuit sale.order.line / sale.order (_mark_payout_info_to_recompute).
     x_is_paid = fields.Boolean(
         string="Uitbetaald",
-        compute='_compute_is_paid',
-        store=False
+        compute='_compute_payout_info',
+        store=True
     )
 
     x_payout_date = fields.Date(
         string="Datum Uitbetaald",
-        compute='_compute_payout_date',
-        store=False
+        compute='_compute_payout_info',
+        store=True
     )
 
     # 1. Het vinkje voor de filter (bestond al)
@@ -148,6 +159,80 @@ class ProductTemplate(models.Model):
         # Voer de standaard aanmaak uit
         return super(ProductTemplate, self).create(vals_list)
 
+    def copy_data(self, default=None):
+        vals_list = super().copy_data(default=default)
+        if self.env.context.get('otters_share_images'):
+            # De foto's koppelen we na de copy rechtstreeks (zie _share_images_from)
+            for vals in vals_list:
+                for field_name in PRODUCT_IMAGE_FIELDS:
+                    vals.pop(field_name, None)
+        return vals_list
+
+    def copy(self, default=None):
+        new_products = super().copy(default=default)
+        if self.env.context.get('otters_share_images'):
+            for source, new_product in zip(self, new_products):
+                new_product._share_images_from(source)
+        return new_products
+
+    def _share_images_from(self, source):
+        """
+        Hergebruikt de foto-attachments van source (zelfde bestand in de filestore),
+        in plaats van de afbeelding opnieuw te decoderen en alle formaten opnieuw te maken.
+        """
+        self.ensure_one()
+        # Eerst de (lege) afgeleide formaten van de create wegschrijven, anders overschrijft
+        # een latere flush onze gedeelde attachments.
+        self.flush_recordset()
+        Attachment = self.env['ir.attachment'].sudo()
+        attachments = Attachment.search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', source.id),
+            ('res_field', 'in', PRODUCT_IMAGE_FIELDS),
+        ])
+        for attachment in attachments:
+            # copy() neemt store_fname en checksum over: geen nieuw bestand op schijf
+            attachment.copy({'res_id': self.id})
+        self.invalidate_recordset(PRODUCT_IMAGE_FIELDS)
+        # Berekend bij de create, toen er nog geen foto was: overnemen i.p.v. de foto opnieuw te decoderen
+        self.can_image_1024_be_zoomed = source.can_image_1024_be_zoomed
+
+    @api.model
+    def _image_checksum(self, data):
+        """ Dezelfde hash als ir.attachment.checksum (sha1 van de ruwe bytes). """
+        return hashlib.sha1(data or b'').hexdigest()
+
+    @api.model
+    def _get_image_checksums(self, model_name, record_ids, field_name='image_1920'):
+        """ {record id: checksum} van de opgeslagen foto's, in één query. """
+        if not record_ids:
+            return {}
+        attachments = self.env['ir.attachment'].sudo().search_read([
+            ('res_model', '=', model_name),
+            ('res_field', '=', field_name),
+            ('res_id', 'in', list(record_ids)),
+        ], ['res_id', 'checksum'])
+        return {att['res_id']: att['checksum'] for att in attachments}
+
+    @api.model
+    def _get_extra_image_checksums(self, template_ids):
+        """ {template id: set(checksums)} van alle extra foto's (product.image) in één query. """
+        if not template_ids:
+            return {}
+        self.env['product.image'].flush_model(['product_tmpl_id'])
+        self.env.cr.execute("""
+            SELECT pi.product_tmpl_id, ia.checksum
+            FROM product_image pi
+            JOIN ir_attachment ia ON ia.res_model = 'product.image'
+                                 AND ia.res_field = 'image_1920'
+                                 AND ia.res_id = pi.id
+            WHERE pi.product_tmpl_id = ANY(%s)
+        """, [list(template_ids)])
+        checksums = {}
+        for template_id, checksum in self.env.cr.fetchall():
+            checksums.setdefault(template_id, set()).add(checksum)
+        return checksums
+
     @api.onchange('brand_id')
     def _onchange_brand_id(self):
         """ Koppel het gekozen merk aan de attributen-tab. """
@@ -215,6 +300,14 @@ class ProductTemplate(models.Model):
         # 1. Voer de wijziging uit
         res = super(ProductTemplate, self).write(vals)
 
+        # Verhuisd naar een andere inzending? Dan verhuizen de grootboekregels mee.
+        if 'submission_id' in vals:
+            self.env['otters.consignment.payout.ledger']._schedule_refresh(self.product_variant_ids.ids)
+
+        # Zichtbaarheid in de shop gewijzigd? Dan de filtertellers bijwerken.
+        if FACET_FIELDS & set(vals):
+            self.env['otters.facet.count']._schedule_refresh(template_ids=self.ids)
+
         # 2. Check of er een reden is ingevuld/gewijzigd
         if 'x_unsold_reason' in vals:
             for product in self:
@@ -229,6 +322,12 @@ class ProductTemplate(models.Model):
                         self._zero_out_stock(variant)
         return res
 
+    def unlink(self):
+        # Verwijderde producten tellen niet meer mee (hun bijdrage verdwijnt mee met de template)
+        self.env.flush_all()
+        self.env['otters.facet.count'].sudo()._apply_template_deltas(self.ids, drop=True)
+        return super().unlink()
+
     def _zero_out_stock(self, product_variant):
         """ Hulpfunctie om stock op 0 te zetten """
         # Zoek de hoofdlocatie
@@ -254,27 +353,80 @@ class ProductTemplate(models.Model):
                 'inventory_quantity': 0
             }).action_apply_inventory()
 
-    def _compute_is_paid(self):
-        for product in self:
-            is_paid = self.env['sale.order.line'].search_count([
-                ('product_template_id', '=', product.id),
-                ('x_is_paid_out', '=', True),
-                ('order_id.state', 'in', ['sale', 'done'])
-            ])
-            product.x_is_paid = (is_paid > 0)
+    def _compute_payout_info(self):
+        """ Berekent x_is_paid en x_payout_date voor de hele recordset in één query. """
+        payout_data = {}
+        template_ids = [pid for pid in self.ids if pid]
+        if template_ids:
+            self.env['sale.order.line'].flush_model(['product_id', 'order_id', 'x_is_paid_out', 'x_payout_date'])
+            self.env['sale.order'].flush_model(['state', 'date_order'])
+            self.env.cr.execute("""
+                SELECT pp.product_tmpl_id,
+                       MAX(COALESCE(sol.x_payout_date, so.date_order::date))
+                FROM sale_order_line sol
+                JOIN sale_order so ON so.id = sol.order_id
+                JOIN product_product pp ON pp.id = sol.product_id
+                WHERE sol.x_is_paid_out = TRUE
+                  AND so.state IN ('sale', 'done')
+                  AND pp.product_tmpl_id = ANY(%s)
+                GROUP BY pp.product_tmpl_id
+            """, [template_ids])
+            payout_data = dict(self.env.cr.fetchall())
 
-    def _compute_payout_date(self):
         for product in self:
-            line = self.env['sale.order.line'].search([
-                ('product_template_id', '=', product.id),
-                ('order_id.state', 'in', ['sale', 'done']),
-                ('x_is_paid_out', '=', True)
-            ], limit=1)
-
-            if line:
-                product.x_payout_date = line.x_payout_date or line.order_id.date_order.date()
-            else:
-                product.x_payout_date = False
+            payout_date = payout_data.get(product.id)
+            product.x_is_paid = bool(payout_date)
+            product.x_payout_date = payout_date or False
+
+    def _mark_payout_info_to_recompute(self):
+        """ Markeer x_is_paid / x_payout_date als te herberekenen (gebeurt bij de volgende flush). """
+        templates = self.exists()
+        if not templates:
+            return
+        self.env.add_to_compute(self._fields['x_is_paid'], templates)
+        self.env.add_to_compute(self._fields['x_payout_date'], templates)
+
+    def init(self):
+        super().init()
+        # Functionele index voor hoofdletterongevoelig zoeken op code (UPPER(default_code) = ...)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS product_template_default_code_upper_index
+            ON product_template (UPPER(default_code))
+        """)
+
+    @api.model
+    def _resolve_default_codes(self, codes):
+        """
+        Zoekt een hele lijst codes in één query op, hoofdletterongevoelig.
+        Geeft {CODE (hoofdletters): template id} terug; bij dubbels wint het oudste product.
+        """
+        codes = list({code.strip().upper() for code in codes if code})
+        if not codes:
+            return {}
+        self.flush_model(['default_code', 'active'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (UPPER(default_code)) UPPER(default_code), id
+            FROM product_template
+            WHERE UPPER(default_code) = ANY(%s)
+              AND active
+            ORDER BY UPPER(default_code), id
+        """, [codes])
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_image_processor(self):
+        """ Thread pool voor het verkleinen van foto's, met de instellingen uit Configuratie. """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if ICP.get_param('otters_consignment.image_keep_resolution'):
+            max_resolution = 0
+        else:
+            max_resolution = int(ICP.get_param('otters_consignment.image_max_resolution') or 0) or 1920
+        return ImageProcessor(
+            max_workers=int(ICP.get_param('otters_consignment.image_workers') or 0) or None,
+            max_resolution=max_resolution,
+            quality=int(ICP.get_param('otters_consignment.image_quality', '85') or 85),
+            image_format=ICP.get_param('otters_consignment.image_format', 'jpeg'),
+        )
 
     @api.constrains('public_categ_ids')
     def _check_category_type_sync(self):
@@ -16,4 +16,54 @@ class ResConfigSettings(models.TransientModel):
         config_parameter='otters_consignment.closed_message',
         default="Wegens grote drukte nemen we momenteel even geen nieuwe verzendzakken aan. Probeer het later opnieuw!",
         translate=True
-    )
\ No newline at end of file
+    )
+
+    otters_consignment_mail_force_send = fields.Boolean(
+        string="Mails meteen versturen",
+        config_parameter='otters_consignment.mail_force_send',
+        help="Standaard komen bevestigings- en labelmails in de mailwachtrij en verstuurt de mail cron ze in batches. "
+             "Aanvinken om ze (zoals vroeger) meteen tijdens de request te versturen."
+    )
+
+    otters_consignment_report_materialized = fields.Boolean(
+        string="Verkooprapport als materialized view",
+        config_parameter='otters_consignment.report_materialized',
+        help="Het verkooprapport wordt vooraf berekend en periodiek ververst (snelle pivots over meerdere jaren). "
+             "Uitvinken om terug te vallen op de live view."
+    )
+
+    otters_consignment_image_max_resolution = fields.Integer(
+        string="Maximale fotoresolutie (px)",
+        config_parameter='otters_consignment.image_max_resolution',
+        default=1920,
+        help="Langste zijde van geüploade/gemigreerde productfoto's."
+    )
+
+    # Apart vinkje: 0 in het veld hierboven overleeft set_values niet (wordt als leeg bewaard)
+    otters_consignment_image_keep_resolution = fields.Boolean(
+        string="Originele resolutie behouden",
+        config_parameter='otters_consignment.image_keep_resolution',
+        help="Foto's niet verkleinen, enkel rechtzetten en opnieuw comprimeren."
+    )
+
+    otters_consignment_image_quality = fields.Integer(
+        string="Fotokwaliteit",
+        config_parameter='otters_consignment.image_quality',
+        default=85,
+        help="JPEG/WebP kwaliteit (1-100)."
+    )
+
+    otters_consignment_image_format = fields.Selection(
+        [('jpeg', 'JPEG'), ('webp', 'WebP')],
+        string="Fotoformaat",
+        config_parameter='otters_consignment.image_format',
+        default='jpeg'
+    )
+
+    def set_values(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        was_materialized = bool(ICP.get_param('otters_consignment.report_materialized'))
+        super().set_values()
+        if was_materialized != self.otters_consignment_report_materialized:
+            # View opnieuw opbouwen in de gekozen modus
+            self.env['otters.consignment.report'].init()
@@ -28,6 +28,47 @@ class SaleOrderLine(models.Model):
         currency_field='currency_id'
     )
 
+    # Velden die x_is_paid / x_payout_date op het product beïnvloeden
+    _PAYOUT_INFO_FIELDS = {'x_is_paid_out', 'x_payout_date', 'product_id'}
+    # Velden die het uitbetalingsgrootboek (otters.consignment.payout.ledger) beïnvloeden
+    _PAYOUT_LEDGER_FIELDS = _PAYOUT_INFO_FIELDS | {
+        'x_fixed_commission', 'x_fixed_percentage', 'product_uom_qty', 'price_unit', 'discount', 'tax_ids', 'order_id'
+    }
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        paid_lines = lines.filtered('x_is_paid_out')
+        if paid_lines:
+            paid_lines.product_id.product_tmpl_id._mark_payout_info_to_recompute()
+        self.env['otters.consignment.payout.ledger']._schedule_refresh(lines.product_id.ids)
+        return lines
+
+    def write(self, vals):
+        # Betaalstatus gewijzigd? Dan moeten x_is_paid / x_payout_date op het product mee.
+        if not self._PAYOUT_LEDGER_FIELDS.intersection(vals):
+            return super().write(vals)
+
+        products = self.product_id
+        res = super().write(vals)
+        self._after_payout_write(vals, products)
+        return res
+
+    def _after_payout_write(self, fnames, products=None):
+        """ Product en grootboek bijwerken na een wijziging (ook na een rechtstreekse SQL update). """
+        products = (products or self.env['product.product']) | self.product_id
+        if self._PAYOUT_INFO_FIELDS.intersection(fnames):
+            products.product_tmpl_id._mark_payout_info_to_recompute()
+        self.env['otters.consignment.payout.ledger']._schedule_refresh(products.ids)
+
+    def unlink(self):
+        products = self.product_id
+        templates = self.filtered('x_is_paid_out').product_id.product_tmpl_id
+        res = super().unlink()
+        templates._mark_payout_info_to_recompute()
+        self.env['otters.consignment.payout.ledger']._schedule_refresh(products.ids)
+        return res
+
     @api.depends('x_fixed_commission', 'x_fixed_percentage', 'x_is_paid_out', 'price_total', 'product_id.submission_id.payout_percentage')
     def _compute_commission(self):
         for line in self:
@@ -39,10 +80,29 @@ class SaleOrderLine(models.Model):
                 line.x_computed_percentage = line.x_fixed_percentage or (submission.payout_percentage if submission else 0.0)
                 line.x_computed_commission = line.x_fixed_commission
             else:
-                # NOG NIET BETAALD: Toon de live berekening
-                if submission:
-                    line.x_computed_percentage = submission.payout_percentage
-                    line.x_computed_commission = line.price_total * submission.payout_percentage
-                else:
-                    line.x_computed_percentage = 0.0
-                    line.x_computed_commission = 0.0
\ No newline at end of file
+                # NOG NIET BETAALD: Vast bedrag als dat er al is (bv. gemigreerd), anders de live berekening
+                perc = submission.payout_percentage if submission else 0.0
+                line.x_computed_percentage = perc
+                line.x_computed_commission = line._get_payout_amount(perc)
+
+    def _get_payout_amount(self, percentage):
+        """
+        Eén regel voor het uit te betalen bedrag, zoals in het verkooprapport en het grootboek:
+        het vastgelegde bedrag als dat ingevuld is (niet 0), anders prijs * percentage.
+        """
+        self.ensure_one()
+        return self.x_fixed_commission or self.price_total * percentage
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Order bevestigd of geannuleerd? Betaalde lijnen tellen enkel mee in 'sale'/'done'.
+        if 'state' in vals or 'date_order' in vals:
+            paid_lines = self.order_line.filtered('x_is_paid_out')
+            if paid_lines:
+                paid_lines.product_id.product_tmpl_id._mark_payout_info_to_recompute()
+            self.env['otters.consignment.payout.ledger']._schedule_refresh(self.order_line.product_id.ids)
+        return res
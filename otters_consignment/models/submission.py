@@ -264,6 +264,9 @@ class ConsignmentSubmission(models.Model):
             if removed_template_ids: vals['product_ids'] = new_commands
         res = super(ConsignmentSubmission, self).write(vals)
         if removed_template_ids: self.env['product.template'].browse(removed_template_ids).write({'active': False})
+        if 'payout_percentage' in vals:
+            # Onbetaalde regels in het grootboek rekenen met het live percentage
+            self.env['otters.consignment.payout.ledger']._schedule_refresh(self.product_ids.product_variant_ids.ids)
         return res
 
     def _get_sold_lines(self):
@@ -281,39 +284,23 @@ class ConsignmentSubmission(models.Model):
         ])
 
     def _get_portal_sold_data(self):
-        """ Bouwt de geaggregeerde lijst, inclusief betaalstatus """
+        """ Leest de vooraf geaggregeerde lijst (otters.consignment.payout.ledger), inclusief betaalstatus """
         self = self.sudo()
-        lines = self._get_sold_lines()
-
-        grouped_data = {}
-
-        for line in lines:
-            # We voegen nu ook de betaalstatus toe aan de sleutel
-            # Zo worden betaalde en onbetaalde regels niet op één hoop gegooid
-            is_paid = line.x_is_paid_out
-            date_val = line.x_payout_date or line.order_id.date_order.date()
-
-            # Key = (Product, Datum, IsBetaald)
-            key = (line.product_id, date_val, is_paid)
-
-            if key not in grouped_data:
-                grouped_data[key] = {
-                    'product': line.product_id,
-                    'name': line.product_id.name,
-                    'qty': 0.0,
-                    'price_sold': 0.0,
-                    'payout': 0.0,
-                    'date': date_val,
-                    'is_paid': is_paid,       # <--- Belangrijk voor filtering straks
-                    'currency': line.currency_id,
-                    'percentage': line.x_computed_percentage # <--- NIEUW: Voeg percentage toe aan de data
-                }
-
-            grouped_data[key]['qty'] += line.product_uom_qty
-            grouped_data[key]['price_sold'] += (line.price_unit * line.product_uom_qty)
-            grouped_data[key]['payout'] += line.x_fixed_commission
-
-        return list(grouped_data.values())
+        ledger_rows = self.env['otters.consignment.payout.ledger'].search([
+            ('submission_id', 'in', self.ids)
+        ])
+
+        return [{
+            'product': row.product_id,
+            'name': row.name,
+            'qty': row.qty,
+            'price_sold': row.price_sold,
+            'payout': row.payout,
+            'date': row.date,
+            'is_paid': row.is_paid,       # <--- Belangrijk voor filtering straks
+            'currency': row.currency_id,
+            'percentage': row.percentage,
+        } for row in ledger_rows]
 
     def action_view_products(self):
         self.ensure_one()
@@ -355,7 +342,7 @@ class ConsignmentSubmission(models.Model):
 
         template = self.env.ref('otters_consignment.mail_template_consignment_is_online', raise_if_not_found=False)
         if template:
-            template.sudo().send_mail(self.id, force_send=True)
+            self._send_template_mail(template, self.id)
 
         self.message_post(body="Klant is per mail verwittigd. Datum Online is ingesteld.")
 
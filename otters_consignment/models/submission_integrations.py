@@ -2,8 +2,6 @@
 from odoo import models, api, _
 import logging
 import re
-import requests
-import base64
 
 _logger = logging.getLogger(__name__)
 
@@ -20,69 +18,24 @@ class ConsignmentSubmissionIntegrations(models.AbstractModel):
     # =================================================================================
 
     def action_generate_sendcloud_label(self):
+        """
+        Zet het label in de wachtrij (otters.consignment.label). Parcel aanmaken, PDF
+        downloaden en de mail versturen gebeurt op de achtergrond, met retries.
+        """
         self.ensure_one()
 
         config = self._get_sendcloud_config()
         if not config:
             return self._return_notification('Fout', 'Sendcloud configuratie ontbreekt.', 'danger')
 
-        payload = self._prepare_sendcloud_payload(config)
-        _logger.info("------- SENDCLOUD payload: %s", payload)
-        success, result = self._call_sendcloud_api(config, payload)
-
-        if success:
-            label_url = result.get('label', {}).get('label_printer')
-            tracking_nr = result.get('tracking_number')
-
-            # --- NIEUWE LOGICA: PDF DOWNLOADEN ---
-            attachment_id = False
-            if label_url:
-                try:
-                    # 1. Download de PDF met de API keys van de config
-                    pdf_response = requests.get(label_url, auth=config['auth'])
-
-                    if pdf_response.status_code == 200:
-                        # 2. Maak een Odoo Attachment aan
-                        pdf_content = base64.b64encode(pdf_response.content)
-                        filename = f"Verzendlabel_{self.name}.pdf"
-
-                        attachment = self.env['ir.attachment'].create({
-                            'name': filename,
-                            'type': 'binary',
-                            'datas': pdf_content,
-                            'res_model': 'otters.consignment.submission',
-                            'res_id': self.id,
-                            'mimetype': 'application/pdf'
-                        })
-                        attachment_id = attachment.id
-
-                        # 3. Sla het label record op (voor referentie)
-                        self.env['otters.consignment.label'].sudo().create({
-                            'submission_id': self.id,
-                            'label_url': label_url,
-                            'tracking_number': tracking_nr
-                        })
-                    else:
-                        _logger.error(f"Kon PDF niet downloaden van Sendcloud. Status: {pdf_response.status_code}")
-
-                except Exception as e:
-                    _logger.error(f"Fout bij downloaden label PDF: {e}")
-
-            # 4. Stuur de e-mail MET de bijlage
-            self._send_label_email(attachment_id)
-
-            # --- RELOAD OPDRACHT ---
-            # In plaats van een notificatie, geven we een RELOAD commando terug.
-            # Hierdoor ververst de pagina en zie je het nieuwe label direct in de lijst staan.
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'reload',
-            }
+        self.env['otters.consignment.label']._enqueue(self)
 
-        else:
-            # Bij een fout behouden we wel de notificatie, want een reload heeft dan geen zin
-            error_msg = result if isinstance(result, str) else "Onbekende fout"
-            return self._return_notification('Fout', f'Sendcloud API: {error_msg}', 'danger', sticky=True)
+        # --- RELOAD OPDRACHT ---
+        # Hierdoor ververst de pagina en zie je het nieuwe label (In Wachtrij) direct in de lijst staan.
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'reload',
+        }
 
     def _get_sendcloud_config(self):
         company = self.env.company
@@ -104,6 +57,8 @@ class ConsignmentSubmissionIntegrations(models.AbstractModel):
             'store_phone': ICP.get_param('otters_consignment.store_phone'),
         }
         if not all(config.values()): return False
+        # Optioneel (bv. een lokale mock server om te testen)
+        config['api_url'] = ICP.get_param('otters_consignment.sendcloud_api_url') or False
         return config
 
     def _prepare_sendcloud_payload(self, config):
@@ -170,18 +125,6 @@ class ConsignmentSubmissionIntegrations(models.AbstractModel):
         # Fallback: Geen nummer gevonden? Alles is straatnaam.
         return full_street, ""
 
-    def _call_sendcloud_api(self, config, payload):
-        url = "https://panel.sendcloud.sc/api/v2/parcels"
-        headers = {"Content-Type": "application/json"}
-        try:
-            response = requests.post(url, headers=headers, json=payload, auth=config['auth'])
-            response.raise_for_status()
-            data = response.json()
-            return True, data.get('parcel', {})
-        except Exception as e:
-            _logger.error(f"Sendcloud API Fout: {str(e)}")
-            return False, str(e)
-
     # =================================================================================
     # MAIL LOGICA
     # =================================================================================
@@ -193,7 +136,7 @@ class ConsignmentSubmissionIntegrations(models.AbstractModel):
         template_customer = self.env.ref('otters_consignment.mail_template_consignment_confirmation', raise_if_not_found=False)
         if template_customer and primary_submission.supplier_id.email:
             try:
-                template_customer.with_context(total_bags=total_bags).sudo().send_mail(primary_submission.id, force_send=True)
+                self._send_template_mail(template_customer.with_context(total_bags=total_bags), primary_submission.id)
             except Exception as e:
                 _logger.error(f"Fout mail klant: {e}")
 
@@ -201,7 +144,7 @@ class ConsignmentSubmissionIntegrations(models.AbstractModel):
         company_email = self.env.company.email
         if template_admin and company_email:
             try:
-                template_admin.with_context(total_bags=total_bags).sudo().send_mail(primary_submission.id, force_send=True)
+                self._send_template_mail(template_admin.with_context(total_bags=total_bags), primary_submission.id)
             except Exception as e:
                 _logger.error(f"Fout mail admin: {e}")
 
@@ -218,11 +161,25 @@ class ConsignmentSubmissionIntegrations(models.AbstractModel):
                 if attachment_id:
                     email_values['attachment_ids'] = [(4, attachment_id)]
 
-                template.sudo().send_mail(self.id, force_send=True, email_values=email_values)
+                self._send_template_mail(template, self.id, email_values=email_values)
 
             except Exception as e:
                 _logger.error(f"Label mail fout: {e}")
 
+    def _send_template_mail(self, template, res_id, email_values=None):
+        """
+        Standaard komt de mail in de wachtrij (mail.mail): de template wordt nu gerenderd
+        (met de context, bv. total_bags), het versturen doet de mail cron in batches over
+        één SMTP connectie. Zo wacht het formulier niet op de mailserver.
+        Met de instelling 'Mails meteen versturen' gaat alles zoals vroeger synchroon.
+        """
+        force_send = bool(self.env['ir.config_parameter'].sudo().get_param('otters_consignment.mail_force_send'))
+        template.sudo().send_mail(res_id, force_send=force_send, email_values=email_values)
+        if not force_send:
+            mail_cron = self.env.ref('mail.ir_cron_mail_scheduler_action', raise_if_not_found=False)
+            if mail_cron:
+                mail_cron.sudo()._trigger()
+
     # =================================================================================
     # TOOLS & HELPERS
     # =================================================================================
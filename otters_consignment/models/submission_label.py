@@ -1,14 +1,38 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
+from datetime import timedelta
+import base64
+import logging
+
+from odoo.addons.om_sendcloud_delivery.models.sendcloud_client import SendcloudClient, SendcloudError
+
+_logger = logging.getLogger(__name__)
+
+# Wachttijd (minuten) voor poging 1, 2, 3, ... Daarna: mislukt.
+LABEL_RETRY_DELAYS = [1, 5, 15, 60, 240]
+
 
 class ConsignmentLabel(models.Model):
     _name = 'otters.consignment.label'
     _description = 'Sendcloud Label'
+    _order = 'id desc'
 
     submission_id = fields.Many2one('otters.consignment.submission', string="Inzending", required=True, ondelete='cascade')
     label_url = fields.Char(string="Label URL", required=True, default="Not created")
     tracking_number = fields.Char(string="Tracking Nummer")
 
+    # --- Wachtrij ---
+    state = fields.Selection([
+        ('queued', 'In Wachtrij'),
+        ('done', 'Klaar'),
+        ('failed', 'Mislukt'),
+    ], string="Status", default='done', required=True, index=True)
+    parcel_id = fields.Char(string="Sendcloud Parcel ID", readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string="Label PDF", readonly=True)
+    attempt_count = fields.Integer(string="Pogingen", default=0, readonly=True)
+    next_attempt = fields.Datetime(string="Volgende Poging", default=fields.Datetime.now, index=True)
+    error_message = fields.Text(string="Laatste Fout", readonly=True)
+
     def action_open_url(self):
         """ Hulpknopje om de URL te openen vanuit de lijst """
         self.ensure_one()
@@ -16,4 +40,111 @@ class ConsignmentLabel(models.Model):
             'type': 'ir.actions.act_url',
             'url': self.label_url,
             'target': 'new',
-        }
\ No newline at end of file
+        }
+
+    def action_retry(self):
+        self.filtered(lambda l: l.state == 'failed').write({
+            'state': 'queued',
+            'attempt_count': 0,
+            'next_attempt': fields.Datetime.now(),
+            'error_message': False,
+        })
+        self._trigger_queue()
+
+    # =================================================================================
+    # WACHTRIJ
+    # =================================================================================
+
+    @api.model
+    def _enqueue(self, submissions):
+        """ Zet voor elke inzending een label klaar. De cron maakt het aan bij Sendcloud. """
+        labels = self.sudo().create([{
+            'submission_id': submission.id,
+            'state': 'queued',
+        } for submission in submissions])
+        self._trigger_queue()
+        return labels
+
+    @api.model
+    def _trigger_queue(self):
+        cron = self.env.ref('otters_consignment.ir_cron_process_label_queue', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def _cron_process_label_queue(self, limit=50):
+        labels = self.search([
+            ('state', '=', 'queued'),
+            ('next_attempt', '<=', fields.Datetime.now()),
+        ], order='next_attempt, id', limit=limit)
+        if not labels:
+            return
+
+        config = self.env['otters.consignment.submission']._get_sendcloud_config()
+        if not config:
+            _logger.error("Sendcloud configuratie ontbreekt, labels blijven in de wachtrij.")
+            return
+        client = SendcloudClient(config['auth'], api_url=config.get('api_url'))
+
+        for label in labels:
+            label._process(client, config)
+            self.env.cr.commit()  # Eén label per transactie: een fout raakt de rest niet
+
+        # Nog meer in de wachtrij? Meteen verder.
+        if self.search_count([('state', '=', 'queued'), ('next_attempt', '<=', fields.Datetime.now())]):
+            self._trigger_queue()
+
+    def _process(self, client, config):
+        """ Parcel aanmaken (één keer), PDF ophalen, mail versturen. Fouten -> opnieuw met backoff. """
+        self.ensure_one()
+        submission = self.submission_id
+        try:
+            # Parcel al aangemaakt in een vorige poging? Dan niet opnieuw (kost geld).
+            if not self.parcel_id:
+                payload = submission._prepare_sendcloud_payload(config)
+                _logger.info("------- SENDCLOUD payload: %s", payload)
+                parcel = client.create_parcel(payload)
+                self.write({
+                    'parcel_id': str(parcel.get('id') or ''),
+                    'label_url': parcel.get('label', {}).get('label_printer') or self.label_url,
+                    'tracking_number': parcel.get('tracking_number'),
+                })
+                # Parcel id meteen vastleggen: bij een latere fout maken we geen tweede (betaald) label
+                self.env.cr.commit()
+
+            if self.label_url and self.label_url != "Not created" and not self.attachment_id:
+                pdf_content = client.download_label(self.label_url)
+                self.attachment_id = self.env['ir.attachment'].sudo().create({
+                    'name': f"Verzendlabel_{submission.name}.pdf",
+                    'type': 'binary',
+                    'datas': base64.b64encode(pdf_content),
+                    'res_model': 'otters.consignment.submission',
+                    'res_id': submission.id,
+                    'mimetype': 'application/pdf'
+                })
+
+            self.write({'state': 'done', 'error_message': False})
+            submission._send_label_email(self.attachment_id.id)
+
+        except SendcloudError as e:
+            self._schedule_retry(str(e), retryable=e.retryable)
+        except Exception as e:
+            _logger.exception(f"Onverwachte fout bij label voor {submission.name}")
+            # De transactie kan stuk zijn; de parcel id staat al veilig gecommit
+            self.env.cr.rollback()
+            self._schedule_retry(str(e), retryable=True)
+
+    def _schedule_retry(self, error, retryable=True):
+        attempt = self.attempt_count + 1
+        if not retryable or attempt > len(LABEL_RETRY_DELAYS):
+            _logger.error(f"Sendcloud label voor {self.submission_id.name} definitief mislukt: {error}")
+            self.write({'state': 'failed', 'attempt_count': attempt, 'error_message': error})
+            self.submission_id.message_post(body=f"Verzendlabel kon niet aangemaakt worden: {error}")
+            return
+        delay = LABEL_RETRY_DELAYS[attempt - 1]
+        _logger.warning(f"Sendcloud label voor {self.submission_id.name} mislukt (poging {attempt}), opnieuw over {delay} min: {error}")
+        self.write({
+            'attempt_count': attempt,
+            'next_attempt': fields.Datetime.now() + timedelta(minutes=delay),
+            'error_message': error,
+        })
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, tools, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
 
 class ConsignmentReport(models.Model):
@@ -24,9 +24,23 @@ class ConsignmentReport(models.Model):
     x_old_id = fields.Char(string="Oude Id", readonly=True)
 
     def init(self):
-        tools.drop_view_if_exists(self.env.cr, self._table)
-        self.env.cr.execute("""
-            CREATE OR REPLACE VIEW %s AS (
+        self._drop_report_relation()
+        query = self._report_query()
+
+        if not self._is_materialized_mode():
+            self.env.cr.execute("CREATE OR REPLACE VIEW %s AS (%s)" % (self._table, query))
+            return
+
+        # MATERIALIZED VIEW: de join wordt één keer berekend, pivots/grafieken lezen een tabel.
+        self.env.cr.execute("CREATE MATERIALIZED VIEW %s AS (%s)" % (self._table, query))
+        # Unieke index is verplicht voor REFRESH ... CONCURRENTLY
+        self.env.cr.execute("CREATE UNIQUE INDEX %s_id_uniq ON %s (id)" % (self._table, self._table))
+        self.env.cr.execute("CREATE INDEX %s_supplier_idx ON %s (supplier_id)" % (self._table, self._table))
+        self.env.cr.execute("CREATE INDEX %s_date_idx ON %s (date)" % (self._table, self._table))
+        self.env.cr.execute("CREATE INDEX %s_paid_idx ON %s (x_is_paid_out, supplier_id)" % (self._table, self._table))
+
+    def _report_query(self):
+        return """
                 SELECT
                     sol.id AS id,
                     sub.id AS submission_id,
@@ -43,7 +57,8 @@ class ConsignmentReport(models.Model):
                     sol.product_uom_qty AS qty_sold, -- AANGEPAST: Kijk naar besteld aantal (product_uom_qty) ipv gefactureerd
                     sub.payout_method AS payout_method,
                     
-                    COALESCE(sol.x_fixed_commission, (sub.payout_percentage * sol.price_total)) AS commission_amount
+                    -- Vast bedrag als dat ingevuld is (niet 0), anders live. Zelfde regel als het grootboek en _get_payout_amount
+                    COALESCE(NULLIF(sol.x_fixed_commission, 0), (sub.payout_percentage * sol.price_total)) AS commission_amount
                     
                 FROM sale_order_line sol
                 JOIN sale_order so ON sol.order_id = so.id
@@ -56,38 +71,104 @@ class ConsignmentReport(models.Model):
                     pt.submission_id IS NOT NULL
                     AND so.state IN ('sale', 'done')
                     AND sol.product_uom_qty > 0 -- AANGEPAST: Kijk naar besteld aantal
-            )
-        """ % (self._table,))
+        """
+
+    # =================================================================================
+    # MATERIALIZED VIEW MODUS
+    # =================================================================================
+
+    def _is_materialized_mode(self):
+        """ Schakelaar (Instellingen): materialized view of live view. """
+        ICP = self.env['ir.config_parameter'].sudo()
+        return bool(ICP.get_param('otters_consignment.report_materialized'))
+
+    def _get_report_relkind(self):
+        """ 'v' = gewone view, 'm' = materialized view, None = bestaat niet. """
+        self.env.cr.execute("""
+            SELECT relkind FROM pg_class
+            WHERE relname = %s AND relnamespace = current_schema()::regnamespace
+        """, [self._table])
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    def _drop_report_relation(self):
+        relkind = self._get_report_relkind()
+        if relkind == 'm':
+            self.env.cr.execute("DROP MATERIALIZED VIEW IF EXISTS %s CASCADE" % (self._table,))
+        elif relkind == 'v':
+            tools.drop_view_if_exists(self.env.cr, self._table)
+
+    def _refresh_materialized_view(self):
+        """ Ververst de materialized view zonder lezers te blokkeren (CONCURRENTLY). """
+        if self._get_report_relkind() != 'm':
+            return
+        self.env.flush_all()
+        self.env.cr.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY %s" % (self._table,))
+        self.env.invalidate_all()
+
+    def _schedule_refresh(self):
+        """ Na uitbetaalacties: één refresh vlak voor de commit, ongeacht het aantal acties. """
+        if not self._is_materialized_mode():
+            return
+        data = self.env.cr.precommit.data
+        if 'otters_consignment.report_refresh' not in data:
+            data['otters_consignment.report_refresh'] = True
+            self.env.cr.precommit.add(self._refresh_materialized_view)
+
+    @api.model
+    def _cron_refresh_report(self):
+        self._refresh_materialized_view()
 
     def action_mark_paid(self):
         """ Markeer geselecteerde regels als betaald en leg commissie én percentage vast. """
+        today = fields.Date.context_today(self)
+        values_per_line = {}
+        total_commission = 0.0
+
+        # Prefetch: orderlijnen, producten en inzendingen in één keer
+        self.mapped('order_line_id.product_id.submission_id')
+
         for report_line in self:
             sol = report_line.order_line_id
             if not sol.x_is_paid_out:
-                current_amount = report_line.commission_amount
-
                 # Haal het percentage op via het gelinkte product/submission
                 current_perc = sol.product_id.submission_id.payout_percentage
+                # Bedrag op de orderlijn bepalen (de materialized view kan achterlopen):
+                # een bestaand vast bedrag blijft staan, anders live
+                current_amount = sol._get_payout_amount(current_perc)
 
-                sol.write({
+                values_per_line[sol] = {
                     'x_is_paid_out': True,
-                    'x_payout_date': fields.Date.context_today(self),
+                    'x_payout_date': today,
                     'x_fixed_commission': current_amount,
                     'x_fixed_percentage': current_perc  # <--- HIER OOK OPSLAAN
-                })
+                }
+                total_commission += current_amount
+
+        count = self._write_grouped(values_per_line)
+        self._schedule_refresh()
+        return self._return_summary('Betaald Gemarkeerd', count, total_commission)
 
     def action_mark_unpaid(self):
         """ Reset geselecteerde regels naar onbetaald. """
-        for report_line in self:
-            sol = report_line.order_line_id
-            sol.write({
-                'x_is_paid_out': False,
-                'x_payout_date': False,
-                'x_fixed_commission': 0.0,
-                'x_fixed_percentage': 0.0 # <--- RESETTEN
-            })
+        lines = self.order_line_id
+        total_commission = sum(lines.mapped('x_fixed_commission'))
+        # Zelfde waarden voor alle regels: één write
+        lines.write({
+            'x_is_paid_out': False,
+            'x_payout_date': False,
+            'x_fixed_commission': 0.0,
+            'x_fixed_percentage': 0.0 # <--- RESETTEN
+        })
+        self._schedule_refresh()
+        return self._return_summary('Onbetaald Gemarkeerd', len(lines), total_commission)
 
     def action_fix_commissions(self):
+        values_per_line = {}
+        total_commission = 0.0
+
+        self.mapped('order_line_id.product_id.submission_id')
+
         for report_line in self:
             sol = report_line.order_line_id
             # Fix alleen als het betaald is maar het percentage nog op 0 staat
@@ -95,7 +176,61 @@ class ConsignmentReport(models.Model):
                 submission = sol.product_id.submission_id
                 if submission:
                     perc = submission.payout_percentage
-                    sol.write({
+                    amount = sol.price_total * perc
+                    values_per_line[sol] = {
                         'x_fixed_percentage': perc,
-                        'x_fixed_commission': sol.price_total * perc
-                    })
\ No newline at end of file
+                        'x_fixed_commission': amount
+                    }
+                    total_commission += amount
+
+        count = self._write_grouped(values_per_line)
+        self._schedule_refresh()
+        return self._return_summary('Commissies Hersteld', count, total_commission)
+
+    def _write_grouped(self, values_per_line):
+        """
+        Schrijft alle orderlijnen in één UPDATE ... FROM UNNEST(...), ook als elke lijn een ander
+        bedrag heeft. Daarna de cache leegmaken en dezelfde hooks als een gewone write aanroepen.
+        De rauwe UPDATE slaat de ORM rechten over, dus controleren we die eerst zelf (ACL + record rules)
+        voor de huidige gebruiker. Er is bewust geen sudo pad: wie dat nodig heeft roept dit aan
+        vanuit een sudo() env, dan is check_access een no-op.
+        """
+        if not values_per_line:
+            return 0
+        SaleLine = self.env['sale.order.line']
+        columns = list(next(iter(values_per_line.values())))
+        lines = SaleLine.browse([sol.id for sol in values_per_line])
+        lines.check_access('write')
+
+        # Openstaande ORM wijzigingen eerst naar de database, anders overschrijven ze onze update
+        SaleLine.flush_model(columns + ['product_id'])
+
+        arrays = [[vals[fname] for vals in values_per_line.values()] for fname in columns]
+        casts = ", ".join(f"%s::{SaleLine._fields[fname].column_type[1]}[]" for fname in columns)
+        self.env.cr.execute(f"""
+            UPDATE sale_order_line sol
+            SET {", ".join(f"{fname} = v.{fname}" for fname in columns)},
+                write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+            FROM UNNEST(%s::int[], {casts}) AS v(id, {", ".join(columns)})
+            WHERE sol.id = v.id
+        """, [self.env.uid, lines.ids, *arrays])
+
+        lines.invalidate_recordset(columns + ['write_uid', 'write_date'])
+        lines.modified(columns)
+        lines._after_payout_write(columns)
+        return len(lines)
+
+    def _return_summary(self, title, count, total_commission):
+        currency = self.env.company.currency_id
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': title,
+                'message': f'{count} regels aangepast. Totale commissie: {currency.symbol} {total_commission:.2f}',
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.otters_consignment.models.image_download_pool import ImageDownloadPool
+
+FAKE_JPEG = b'\xff\xd8\xff\xe0 nep jpeg'
+
+
+class MockImageHandler(BaseHTTPRequestHandler):
+    """ /foto/<naam>.jpg geeft een 'foto', /ontbreekt een 404 en /pagina een HTML pagina (geen foto). """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        if self.path.startswith('/foto/'):
+            status, content_type, body = 200, 'image/jpeg', FAKE_JPEG + self.path.encode()
+        elif self.path == '/pagina':
+            status, content_type, body = 200, 'text/html', b'<html>geen foto</html>'
+        else:
+            status, content_type, body = 404, 'text/plain', b'niet gevonden'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@tagged('post_install', '-at_install')
+class TestImageDownloadPool(BaseCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockImageHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.hits = {}
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    def setUp(self):
+        super().setUp()
+        self.server.hits.clear()
+        self.pool = ImageDownloadPool(max_workers=4, per_host_rate=0, timeout=5)
+        self.addCleanup(self.pool.close)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def test_prefetch_then_get(self):
+        urls = [self.url('/foto/a.jpg')]
+        self.pool.prefetch(urls)
+        self.pool.prefetch(urls)  # dubbel inplannen = één download
+        self.assertTrue(self.pool.is_scheduled(urls))
+        self.assertEqual(self.pool.get(urls), FAKE_JPEG + b'/foto/a.jpg')
+        self.assertFalse(self.pool.is_scheduled(urls))
+        self.assertEqual(self.server.hits['/foto/a.jpg'], 1)
+
+    def test_fallback_urls_and_non_images(self):
+        # Eerste url bestaat niet, tweede is geen foto, derde wel
+        urls = [self.url('/ontbreekt'), self.url('/pagina'), self.url('/foto/b.jpg')]
+        self.assertEqual(self.pool.get(urls), FAKE_JPEG + b'/foto/b.jpg')
+        self.assertFalse(self.pool.get([self.url('/ontbreekt'), self.url('/pagina')]))
+
+    def test_save_local_and_postprocess(self):
+        pool = ImageDownloadPool(max_workers=2, per_host_rate=0, timeout=5, postprocess=lambda data: data.upper())
+        self.addCleanup(pool.close)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            save_path = os.path.join(tmp_dir, 'merk', 'c.jpg')
+            pool.prefetch([self.url('/foto/c.jpg')], save_path)
+            content = pool.get([self.url('/foto/c.jpg')], save_path)
+            # Op schijf het origineel, terug de bewerkte versie
+            with open(save_path, 'rb') as f:
+                self.assertEqual(f.read(), FAKE_JPEG + b'/foto/c.jpg')
+            self.assertEqual(content, (FAKE_JPEG + b'/foto/c.jpg').upper())
+            self.assertFalse(os.path.exists(f"{save_path}.part"))
+
+    def test_parallel_downloads(self):
+        batches = [[self.url(f'/foto/{n}.jpg')] for n in range(20)]
+        for urls in batches:
+            self.pool.prefetch(urls)
+        results = [self.pool.get(urls) for urls in batches]
+        self.assertEqual(results, [FAKE_JPEG + f'/foto/{n}.jpg'.encode() for n in range(20)])
+        self.assertEqual(sum(self.server.hits.values()), 20)
+
+    def test_close_clears_plans(self):
+        self.pool.plans[('foto.jpg', '12')] = (False, [self.url('/foto/d.jpg')], False)
+        self.pool.prefetch([self.url('/foto/d.jpg')])
+        self.pool.close()
+        self.assertFalse(self.pool.plans)
+        self.assertFalse(self.pool.is_scheduled([self.url('/foto/d.jpg')]))
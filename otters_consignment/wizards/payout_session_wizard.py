@@ -14,9 +14,13 @@ class PayoutSessionWizard(models.TransientModel):
     _description = 'Uitbetaal Sessie'
 
     # --- De Wachtrij ---
-    # We slaan hier alle partner ID's op die we nog moeten doen
-    queue_partner_ids = fields.Many2many('res.partner', string="Wachtrij")
+    # Eén keer berekend bij het openen: [{'partner_id', 'line_ids', 'amount'}, ...] op naam gesorteerd.
+    # Daarna schuiven we enkel de positie op, zonder opnieuw te zoeken.
+    queue_data = fields.Json(string="Wachtrij")
+    queue_position = fields.Integer(string="Positie", default=0)
     queue_count = fields.Integer(string="Aantal te gaan", compute='_compute_queue_count')
+    # Iets betaald in deze sessie? Dan verversen we het rapport één keer op het einde.
+    has_payments = fields.Boolean(default=False)
 
     # --- De Huidige Leverancier ---
     current_partner_id = fields.Many2one('res.partner', string="Huidige Leverancier", readonly=True)
@@ -30,63 +34,75 @@ class PayoutSessionWizard(models.TransientModel):
     qr_image = fields.Binary("QR Code", readonly=True)
     qr_filename = fields.Char("Bestandsnaam", default="qr.png")
 
-    @api.depends('queue_partner_ids')
+    @api.depends('queue_data', 'queue_position')
     def _compute_queue_count(self):
         for w in self:
-            w.queue_count = len(w.queue_partner_ids)
+            w.queue_count = max(len(w.queue_data or []) - w.queue_position, 0)
 
     @api.model
     def default_get(self, fields_list):
         res = super().default_get(fields_list)
 
-        # 1. Zoek ALLE leveranciers die nog geld krijgen (Cash + Onbetaald)
-        # We zoeken eerst de lijnen om zeker te zijn dat er bedragen open staan
-        unpaid_lines = self.env['sale.order.line'].search([
-            ('x_is_paid_out', '=', False),
-            ('order_id.state', 'in', ['sale', 'done']),
-            ('product_id.submission_id.payout_method', '=', 'cash'),
-            ('product_id.submission_id', '!=', False)
-        ])
-
-        # Unieke partners uit deze lijnen halen
-        partners_to_pay = unpaid_lines.mapped('product_id.submission_id.supplier_id')
-
-        if not partners_to_pay:
+        # 1. De volledige wachtrij in één gegroepeerde query
+        queue = self._compute_payout_queue()
+        if not queue:
             return res # Wordt straks afgevangen in de view of start actie
 
-        res['queue_partner_ids'] = [(6, 0, partners_to_pay.ids)]
+        res['queue_data'] = queue
+        res['queue_position'] = 0
 
         # 2. Setup de eerste partner alvast
-        first_partner = partners_to_pay[0]
-        data = self._prepare_partner_data(first_partner, unpaid_lines)
-        res.update(data)
+        res.update(self._prepare_queue_entry(queue[0]))
 
         return res
 
-    def _prepare_partner_data(self, partner, all_unpaid_lines=None):
-        """ Hulpfunctie om de view velden te vullen voor een specifieke partner """
-        if not all_unpaid_lines:
-            # Zoek opnieuw als we geen cache hebben (tijdens de loop)
-            all_unpaid_lines = self.env['sale.order.line'].search([
-                ('x_is_paid_out', '=', False),
-                ('order_id.state', 'in', ['sale', 'done']),
-                ('product_id.submission_id.supplier_id', '=', partner.id),
-                ('product_id.submission_id.payout_method', '=', 'cash')
-            ])
-        else:
-            # Filter uit de bestaande set
-            all_unpaid_lines = all_unpaid_lines.filtered(
-                lambda l: l.product_id.submission_id.supplier_id == partner
-            )
-
-        amount = sum(all_unpaid_lines.mapped('x_computed_commission'))
+    @api.model
+    def _compute_payout_queue(self):
+        """
+        Alle leveranciers die nog cash geld krijgen, met hun onbetaalde lijnen en het totaal.
+        Zelfde berekening als sale.order.line._get_payout_amount (vast bedrag als dat er is, anders live).
+        """
+        self.env['sale.order.line'].flush_model(['order_id', 'product_id', 'price_total', 'x_is_paid_out', 'x_fixed_commission'])
+        self.env['sale.order'].flush_model(['state', 'company_id'])
+        self.env['product.product'].flush_model(['product_tmpl_id'])
+        self.env['product.template'].flush_model(['submission_id'])
+        self.env['otters.consignment.submission'].flush_model(['supplier_id', 'payout_method', 'payout_percentage'])
+
+        self.env.cr.execute("""
+            SELECT sub.supplier_id AS partner_id,
+                   ARRAY_AGG(sol.id ORDER BY sol.id) AS line_ids,
+                   SUM(COALESCE(NULLIF(sol.x_fixed_commission, 0),
+                                sol.price_total * COALESCE(sub.payout_percentage, 0))) AS amount
+            FROM sale_order_line sol
+            JOIN sale_order so ON so.id = sol.order_id
+            JOIN product_product pp ON pp.id = sol.product_id
+            JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            JOIN otters_consignment_submission sub ON sub.id = pt.submission_id
+            JOIN res_partner rp ON rp.id = sub.supplier_id
+            WHERE so.state IN ('sale', 'done')
+              AND so.company_id = ANY(%(company_ids)s)
+              AND NOT COALESCE(sol.x_is_paid_out, FALSE)
+              AND sub.payout_method = 'cash'
+            GROUP BY sub.supplier_id, rp.name
+            ORDER BY rp.name, sub.supplier_id
+        """, {'company_ids': self.env.companies.ids})
+        return [{
+            'partner_id': row['partner_id'],
+            'line_ids': row['line_ids'],
+            'amount': float(row['amount'] or 0.0),
+        } for row in self.env.cr.dictfetchall()]
+
+    def _prepare_queue_entry(self, entry):
+        """ Hulpfunctie om de view velden te vullen voor één stap uit de wachtrij """
+        partner = self.env['res.partner'].browse(entry['partner_id'])
+        amount = entry['amount']
 
         # Genereer QR
         qr_image = self._generate_qr(partner, amount)
 
         return {
             'current_partner_id': partner.id,
-            'line_ids': [(6, 0, all_unpaid_lines.ids)],
+            'line_ids': [(6, 0, entry['line_ids'])],
             'total_amount': amount,
             'currency_id': partner.currency_id.id or self.env.company.currency_id.id,
             'qr_image': qr_image
@@ -116,42 +132,81 @@ class PayoutSessionWizard(models.TransientModel):
         self.ensure_one()
 
         # 1. MARKEER HUIDIGE ALS BETAALD
-        if self.line_ids:
-            # Eerst basis vlaggen zetten
-            self.line_ids.write({
+        # Opnieuw uit de database lezen (en vergrendelen): lijnen die intussen elders betaald zijn
+        # laten we met rust, en die mogen ook niet meer in het totaal zitten.
+        lines = self._lock_unpaid_lines()
+        today = fields.Date.context_today(self)
+        values_per_line = {}
+        for line in lines:
+            # Huidig percentage en bedrag vastklikken (een bestaand vast bedrag blijft staan)
+            perc = line.product_id.submission_id.payout_percentage
+            values_per_line[line] = {
                 'x_is_paid_out': True,
-                'x_payout_date': fields.Date.context_today(self),
-            })
+                'x_payout_date': today,
+                'x_fixed_commission': line._get_payout_amount(perc),
+                'x_fixed_percentage': perc,
+            }
+        amount = sum(vals['x_fixed_commission'] for vals in values_per_line.values())
 
-            # Dan de bedragen en percentages vastklikken
-            for line in self.line_ids:
-                # Haal het huidige percentage op
-                perc = line.product_id.submission_id.payout_percentage
-                # Bereken het bedrag
-                amount = line.price_total * perc
+        # Klopt het getoonde bedrag (en de QR) niet meer? Dan eerst het juiste tonen, niets betalen.
+        currency = self.currency_id or self.env.company.currency_id
+        if set(lines.ids) != set(self.line_ids.ids) or currency.compare_amounts(amount, self.total_amount):
+            return self._reload_current_entry(lines, amount)
 
-                # Sla BEIDE op
-                line.write({
-                    'x_fixed_commission': amount,
-                    'x_fixed_percentage': perc
-                })
+        if values_per_line:
+            # Alle lijnen in één UPDATE, elk met hun eigen bedrag
+            self.env['otters.consignment.report']._write_grouped(values_per_line)
+            self.has_payments = True
 
-        # 2. VERWIJDER HUIDIGE UIT DE WACHTRIJ
-        self.write({'queue_partner_ids': [(3, self.current_partner_id.id)]})
+        # 2. VOLGENDE IN DE WACHTRIJ
+        self.queue_position += 1
 
         # 3. LADEN DE VOLGENDE (OF STOPPEN)
         return self._load_next_step()
 
+    def _lock_unpaid_lines(self):
+        """ De nog onbetaalde lijnen van de huidige leverancier, vers uit de database en vergrendeld. """
+        self.env['sale.order.line'].flush_model(['x_is_paid_out'])
+        self.env.cr.execute("""
+            SELECT id FROM sale_order_line
+            WHERE id = ANY(%s) AND NOT COALESCE(x_is_paid_out, FALSE)
+            ORDER BY id
+            FOR UPDATE
+        """, [self.line_ids.ids])
+        lines = self.env['sale.order.line'].browse([row[0] for row in self.env.cr.fetchall()])
+        lines.invalidate_recordset(['x_is_paid_out', 'x_fixed_commission'])
+        return lines
+
+    def _reload_current_entry(self, lines, amount):
+        """ Huidige stap opnieuw opbouwen met de lijnen en het bedrag van nu (ook in de wachtrij). """
+        queue = list(self.queue_data or [])
+        entry = dict(queue[self.queue_position], line_ids=lines.ids, amount=amount)
+        queue[self.queue_position] = entry
+        self.write(dict(self._prepare_queue_entry(entry), queue_data=queue))
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'otters.payout.session.wizard',
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
     def action_skip_and_next(self):
         """ Sla over (doe niets met data) en laad de volgende """
         self.ensure_one()
-        # Gewoon uit de wachtrij halen
-        self.write({'queue_partner_ids': [(3, self.current_partner_id.id)]})
+        # Gewoon een plaats opschuiven
+        self.queue_position += 1
         return self._load_next_step()
 
     def _load_next_step(self):
         # Is er nog iemand in de rij?
-        if not self.queue_partner_ids:
+        queue = self.queue_data or []
+        if self.queue_position >= len(queue):
+            # Rapport (materialized view) één keer verversen voor de hele sessie.
+            # Sessie halverwege gesloten? Dan pikt de uurlijkse cron het op.
+            if self.has_payments:
+                self.env['otters.consignment.report']._schedule_refresh()
+
             # KLAAR! Toon regenboog.
             return {
                 'type': 'ir.actions.client',
@@ -165,11 +220,8 @@ class PayoutSessionWizard(models.TransientModel):
                 }
             }
 
-        # Pak de volgende
-        next_partner = self.queue_partner_ids[0]
-
-        # Bereken data
-        data = self._prepare_partner_data(next_partner)
+        # Pak de volgende (staat al klaar, geen nieuwe zoekopdracht)
+        data = self._prepare_queue_entry(queue[self.queue_position])
 
         # Schrijf data naar DEZE wizard (zodat we in dezelfde popup blijven)
         self.write(data)
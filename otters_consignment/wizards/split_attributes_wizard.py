@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Zoveel seconden werken we per klik; daarna tonen we de voortgang en ga je verder met "Verder"
+SPLIT_TIME_BUDGET = 60
 
 class SplitAttributesWizard(models.TransientModel):
     _name = 'otters.consignment.split.attributes.wizard'
@@ -18,56 +25,143 @@ class SplitAttributesWizard(models.TransientModel):
         default=False,
         help="Indien aangevinkt, wordt de hele database gecontroleerd. Anders enkel de geselecteerde producten."
     )
+    dry_run = fields.Boolean(
+        string="Enkel tellen (proefdraai)",
+        help="Toont hoeveel producten en lijnen gesplitst zouden worden, zonder iets te wijzigen."
+    )
+    chunk_size = fields.Integer(string="Producten per Chunk", default=200,
+                                help="Na elke chunk wordt er gecommit, zodat de shop niet geblokkeerd raakt.")
+
+    # --- Voortgang (hervatbaar) ---
+    state = fields.Selection([('draft', 'Concept'), ('running', 'Bezig'), ('done', 'Klaar')], default='draft')
+    template_ids = fields.Json(string="Geselecteerde Producten")  # Leeg = hele database
+    last_template_id = fields.Integer(string="Laatst Verwerkt Product", default=0)
+    candidate_count = fields.Integer(string="Te Splitsen Producten", readonly=True)
+    products_done = fields.Integer(string="Gesplitste Producten", readonly=True)
+    lines_split = fields.Integer(string="Gesplitste Lijnen", readonly=True)
 
     def action_split(self):
-        # ... (rest van de code blijft identiek)
         self.ensure_one()
 
-        if self.process_all:
-            products = self.env['product.template'].search([])
-        else:
-            active_ids = self.env.context.get('active_ids', [])
-            if not active_ids:
-                return {'type': 'ir.actions.client', 'tag': 'display_notification', 'params': {'title': 'Geen selectie', 'message': 'Selecteer producten of vink "Verwerk ALLE producten" aan.', 'type': 'warning'}}
-            products = self.env['product.template'].browse(active_ids)
-
-        total_products_fixed = 0
-        target_attr_ids = self.attribute_ids.ids
-
-        for product in products:
-            # Zoek lijnen die horen bij de gekozen attributen EN meer dan 1 waarde hebben
-            lines_to_split = product.attribute_line_ids.filtered(
-                lambda l: l.attribute_id.id in target_attr_ids and len(l.value_ids) > 1
-            )
-
-            if not lines_to_split:
-                continue
+        if self.state == 'draft':
+            if not self.process_all:
+                active_ids = self.env.context.get('active_ids', [])
+                if not active_ids:
+                    return {'type': 'ir.actions.client', 'tag': 'display_notification', 'params': {'title': 'Geen selectie', 'message': 'Selecteer producten of vink "Verwerk ALLE producten" aan.', 'type': 'warning'}}
+                self.template_ids = active_ids
 
-            for line in lines_to_split:
-                attribute = line.attribute_id
-                values = line.value_ids
+            product_count, line_count = self._count_candidates()
+            if self.dry_run:
+                return self._notify('Proefdraai', f'{product_count} producten met {line_count} lijnen zouden gesplitst worden. Er is niets gewijzigd.', 'info')
 
-                # A. Verwijder de oude gecombineerde regel
-                line.unlink()
+            self.write({'state': 'running', 'candidate_count': product_count, 'last_template_id': 0})
+            self.env.cr.commit()
 
-                # B. Maak nieuwe, enkele regels
-                for val in values:
-                    self.env['product.template.attribute.line'].create({
-                        'product_tmpl_id': product.id,
-                        'attribute_id': attribute.id,
-                        'value_ids': [(6, 0, [val.id])]
-                    })
+        # Chunk per chunk, met een commit na elke chunk. Loopt de tijd op, dan hervat je later
+        # vanaf last_template_id.
+        deadline = time.monotonic() + SPLIT_TIME_BUDGET
+        while self._split_next_chunk():
+            self.env.cr.commit()
+            if time.monotonic() > deadline:
+                return {
+                    'type': 'ir.actions.act_window',
+                    'res_model': self._name,
+                    'res_id': self.id,
+                    'view_mode': 'form',
+                    'target': 'new',
+                }
 
-            total_products_fixed += 1
+        self.state = 'done'
+        return self._notify('Klaar!', f'{self.products_done} producten zijn succesvol gesplitst.', 'success')
 
+    def _notify(self, title, message, notification_type):
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
-                'title': 'Klaar!',
-                'message': f'{total_products_fixed} producten zijn succesvol gesplitst.',
-                'type': 'success',
+                'title': title,
+                'message': message,
+                'type': notification_type,
                 'sticky': False,
                 'next': {'type': 'ir.actions.act_window_close'}
             }
-        }
\ No newline at end of file
+        }
+
+    def _candidate_query(self):
+        """
+        Lijnen van de gekozen kenmerken met meer dan één waarde, enkel voor producten na de cursor.
+        Het echte zoekwerk gebeurt in SQL; Python krijgt enkel de lijnen die gesplitst moeten worden.
+        """
+        value_field = self.env['product.template.attribute.line']._fields['value_ids']
+        self.env['product.template.attribute.line'].flush_model(['product_tmpl_id', 'attribute_id', 'value_ids', 'active'])
+        self.env['product.attribute.value'].flush_model(['active'])
+        self.env['product.template'].flush_model(['active'])
+
+        params = {
+            'attribute_ids': self.attribute_ids.ids,
+            'cursor': self.last_template_id,
+        }
+        if self.template_ids:
+            where = "AND ptal.product_tmpl_id = ANY(%(template_ids)s)"
+            params['template_ids'] = self.template_ids
+        else:
+            where = "AND pt.active"  # zoals search([]): enkel actieve producten
+
+        query = f"""
+            SELECT ptal.id AS line_id, ptal.product_tmpl_id
+            FROM product_template_attribute_line ptal
+            JOIN product_template pt ON pt.id = ptal.product_tmpl_id
+            JOIN {value_field.relation} rel ON rel.{value_field.column1} = ptal.id
+            JOIN product_attribute_value pav ON pav.id = rel.{value_field.column2}
+            WHERE ptal.active
+              AND ptal.attribute_id = ANY(%(attribute_ids)s)
+              AND ptal.product_tmpl_id > %(cursor)s
+              {where}
+            GROUP BY ptal.id, ptal.product_tmpl_id
+            -- Enkel actieve waarden tellen (net als vroeger len(line.value_ids))
+            HAVING COUNT(*) FILTER (WHERE pav.active) > 1
+        """
+        return query, params
+
+    def _count_candidates(self):
+        query, params = self._candidate_query()
+        self.env.cr.execute(f"SELECT COUNT(DISTINCT c.product_tmpl_id), COUNT(*) FROM ({query}) c", params)
+        return self.env.cr.fetchone()
+
+    def _split_next_chunk(self):
+        """ Splitst de lijnen van de volgende chunk producten. Geeft False terug als er niets meer is. """
+        query, params = self._candidate_query()
+        params['limit'] = max(self.chunk_size, 1)
+        self.env.cr.execute(f"""
+            WITH candidates AS ({query})
+            SELECT line_id, product_tmpl_id FROM candidates
+            WHERE product_tmpl_id IN (
+                SELECT DISTINCT product_tmpl_id FROM candidates ORDER BY product_tmpl_id LIMIT %(limit)s
+            )
+        """, params)
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return False
+
+        Line = self.env['product.template.attribute.line']
+        lines = Line.browse([line_id for line_id, _tmpl_id in rows])
+
+        # Eén nieuwe, enkele lijn per waarde, ook voor gearchiveerde waarden (anders gaan ze verloren)
+        vals_list = [{
+            'product_tmpl_id': line.product_tmpl_id.id,
+            'attribute_id': line.attribute_id.id,
+            'value_ids': [(6, 0, [val.id])],
+        } for line in lines for val in line.with_context(active_test=False).value_ids]
+
+        # A. Verwijder de oude gecombineerde regels, B. maak de nieuwe in één keer
+        lines.unlink()
+        Line.create(vals_list)
+
+        template_ids = {tmpl_id for _line_id, tmpl_id in rows}
+        self.write({
+            'last_template_id': max(template_ids),
+            'products_done': self.products_done + len(template_ids),
+            'lines_split': self.lines_split + len(rows),
+        })
+        _logger.info(f"Kenmerken splitsen: {self.products_done}/{self.candidate_count} producten verwerkt.")
+        return True
@@ -1,24 +1,104 @@
 from odoo import models, fields, api
 
+# Sleutel in cr.precommit.data waaronder we de aangeraakte templates verzamelen
+SHOP_AVAILABILITY_QUEUE = 'otters_webshop_outofstock_filter.shop_availability_ids'
+
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
     # Dit vinkje slaan we op (store=True) zodat we er supersnel op kunnen zoeken.
     x_shop_available = fields.Boolean(string="Beschikbaar in Shop", default=True, index=True)
 
+    def _schedule_shop_availability(self):
+        """
+        Zet de templates in de wachtrij. De echte herberekening gebeurt één keer,
+        vlak voor de commit, voor alle templates die in de transactie geraakt zijn.
+        """
+        if not self:
+            return
+        data = self.env.cr.precommit.data
+        if SHOP_AVAILABILITY_QUEUE not in data:
+            data[SHOP_AVAILABILITY_QUEUE] = set()
+            self.env.cr.precommit.add(self._flush_shop_availability_queue)
+        data[SHOP_AVAILABILITY_QUEUE].update(self.ids)
+
+    def _flush_shop_availability_queue(self):
+        """ Precommit hook: verwerkt de volledige wachtrij in één keer. """
+        template_ids = self.env.cr.precommit.data.pop(SHOP_AVAILABILITY_QUEUE, set())
+        if not template_ids:
+            return
+        templates = self.env['product.template'].sudo().with_context(active_test=False).browse(template_ids).exists()
+        templates._update_shop_availability()
+        # Precommit draait na de gewone flush: onze writes (en afhankelijke computes) zelf wegschrijven
+        self.env.flush_all()
+
     def _update_shop_availability(self):
         """
         Berekent of het product in de shop mag staan en slaat dit op.
         """
-        for product in self:
-            # LOGICA:
-            # 1. Diensten (Cadeaubonnen) -> Altijd zichtbaar
-            # 2. Goederen -> Moeten fysiek én virtueel op voorraad zijn
-            if product.type == 'service':
-                is_available = True
-            else:
-                is_available = product.qty_available > 0 and product.virtual_available > 0
+        if not self:
+            return
+
+        # LOGICA:
+        # 1. Diensten (Cadeaubonnen) -> Altijd zichtbaar
+        # 2. Goederen -> Moeten fysiek én virtueel op voorraad zijn
+        availability = self._get_shop_availability_map()
 
-            # Alleen schrijven als de status echt verandert (database optimalisatie)
-            if product.x_shop_available != is_available:
-                product.x_shop_available = is_available
\ No newline at end of file
+        # Alleen schrijven als de status echt verandert (database optimalisatie)
+        to_enable = self.filtered(lambda p: availability.get(p.id) and not p.x_shop_available)
+        to_disable = self.filtered(lambda p: not availability.get(p.id) and p.x_shop_available)
+
+        if to_enable:
+            to_enable.write({'x_shop_available': True})
+        if to_disable:
+            to_disable.write({'x_shop_available': False})
+
+    def _get_shop_availability_map(self):
+        """
+        Eén gegroepeerde query over stock_quant en stock_move voor de hele recordset.
+        Geeft {template_id: beschikbaar} terug, met dezelfde regels als qty_available
+        (interne locaties) en virtual_available (+ inkomend - uitgaand, lopende moves).
+        """
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity'])
+        self.env['stock.move'].flush_model(['product_id', 'location_id', 'location_dest_id', 'product_qty', 'state'])
+        self.flush_model(['type'])
+
+        self.env.cr.execute("""
+            SELECT pt.id,
+                   pt.type,
+                   COALESCE(q.qty, 0) AS qty_available,
+                   COALESCE(q.qty, 0) + COALESCE(m.incoming, 0) - COALESCE(m.outgoing, 0) AS virtual_available
+            FROM product_template pt
+            LEFT JOIN (
+                SELECT pp.product_tmpl_id, SUM(sq.quantity) AS qty
+                FROM stock_quant sq
+                JOIN product_product pp ON pp.id = sq.product_id
+                JOIN stock_location sl ON sl.id = sq.location_id
+                WHERE sl.usage = 'internal'
+                  AND pp.product_tmpl_id = ANY(%(ids)s)
+                GROUP BY pp.product_tmpl_id
+            ) q ON q.product_tmpl_id = pt.id
+            LEFT JOIN (
+                SELECT pp.product_tmpl_id,
+                       SUM(CASE WHEN dest.usage = 'internal' AND src.usage != 'internal'
+                                THEN sm.product_qty ELSE 0 END) AS incoming,
+                       SUM(CASE WHEN src.usage = 'internal' AND dest.usage != 'internal'
+                                THEN sm.product_qty ELSE 0 END) AS outgoing
+                FROM stock_move sm
+                JOIN product_product pp ON pp.id = sm.product_id
+                JOIN stock_location src ON src.id = sm.location_id
+                JOIN stock_location dest ON dest.id = sm.location_dest_id
+                WHERE sm.state NOT IN ('draft', 'cancel', 'done')
+                  AND pp.product_tmpl_id = ANY(%(ids)s)
+                GROUP BY pp.product_tmpl_id
+            ) m ON m.product_tmpl_id = pt.id
+            WHERE pt.id = ANY(%(ids)s)
+        """, {'ids': list(self.ids)})
+
+        availability = {}
+        for template_id, product_type, qty_available, virtual_available in self.env.cr.fetchall():
+            if product_type == 'service':
+                availability[template_id] = True
+            else:
+                availability[template_id] = qty_available > 0 and virtual_available > 0
+        return availability
@@ -1,25 +1,28 @@
 from odoo import models
 
+# De hooks zetten de templates enkel in de wachtrij (_schedule_shop_availability).
+# De herberekening gebeurt één keer per transactie, bij precommit.
+
 class StockQuant(models.Model):
     _inherit = 'stock.quant'
 
     def create(self, vals_list):
         res = super().create(vals_list)
         # Nieuwe voorraad? Update het product!
-        res.product_id.product_tmpl_id._update_shop_availability()
+        res.product_id.product_tmpl_id._schedule_shop_availability()
         return res
 
     def write(self, vals):
         res = super().write(vals)
         # Voorraad gewijzigd? Update het product!
         if 'quantity' in vals or 'location_id' in vals:
-            self.mapped('product_id.product_tmpl_id')._update_shop_availability()
+            self.mapped('product_id.product_tmpl_id')._schedule_shop_availability()
         return res
 
     def unlink(self):
         products = self.mapped('product_id.product_tmpl_id')
         res = super().unlink()
-        products._update_shop_availability()
+        products._schedule_shop_availability()
         return res
 
 class StockMove(models.Model):
@@ -29,5 +32,5 @@ class StockMove(models.Model):
         res = super().write(vals)
         # Reservering gewijzigd (iemand bestelt iets)? Update het product!
         if 'state' in vals or 'product_uom_qty' in vals:
-            self.mapped('product_id.product_tmpl_id')._update_shop_availability()
-        return res
\ No newline at end of file
+            self.mapped('product_id.product_tmpl_id')._schedule_shop_availability()
+        return res